@@ -0,0 +1,112 @@
+"""
+Benchmark de latência da primeira consulta com o engine de src/db/database.py.
+
+Mede, para cada configuração do engine:
+    - fria: engine novo, primeira consulta paga conexão (e TLS, se houver);
+    - aquecida: primeira consulta após aquecer_engine();
+    - após queda: primeira consulta depois que o servidor encerra as conexões ociosas
+      do pool (o que o Neon faz ao suspender o compute). Sem pool_pre_ping a consulta
+      falha; com pre_ping o pool reconecta de forma transparente.
+
+Uso:
+    python -m benchmarks.bench_conexao_db [--repeticoes 20] [--sslmode disable]
+
+Usa BENCH_DATABASE_URL (ou DATABASE_URL) e deve rodar contra um Postgres local;
+contra o Neon, os tempos incluem também a latência de rede e o despertar do compute.
+"""
+import argparse
+import os
+import statistics
+import sys
+import time
+
+from dotenv import load_dotenv
+from sqlalchemy import text
+
+load_dotenv()
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+url = os.getenv("BENCH_DATABASE_URL") or os.getenv("DATABASE_URL")
+if not url:
+    raise ValueError("Defina BENCH_DATABASE_URL ou DATABASE_URL")
+os.environ["DATABASE_URL"] = url  # database.py lê a URL ao ser importado
+
+from src.db.database import criar_engine, aquecer_engine
+
+CONSULTA = text("SELECT count(*) FROM pg_class")
+
+
+def _primeira_consulta(engine) -> float:
+    """Executa a consulta em uma conexão do pool e retorna o tempo total (ms)."""
+    inicio = time.perf_counter()
+    with engine.connect() as conexao:
+        conexao.execute(CONSULTA).scalar()
+    return (time.perf_counter() - inicio) * 1000
+
+
+def _derrubar_conexoes_ociosas(engine) -> None:
+    """Encerra no servidor as conexões ociosas desta aplicação, simulando a suspensão do Neon."""
+    administrador = criar_engine(url, pool_size=1, max_overflow=0, sslmode=os.environ["DB_SSLMODE"])
+    with administrador.connect() as conexao:
+        conexao.execute(text("""
+            SELECT pg_terminate_backend(pid)
+            FROM pg_stat_activity
+            WHERE application_name = 'app_dv_smartshop'
+              AND state = 'idle'
+              AND pid <> pg_backend_pid()
+        """))
+    administrador.dispose()
+    time.sleep(0.05)
+
+
+def medir(repeticoes: int, pool_pre_ping: bool) -> dict:
+    tempos = {"fria": [], "aquecida": [], "após queda": []}
+    falhas_apos_queda = 0
+
+    for _ in range(repeticoes):
+        engine = criar_engine(url, pool_pre_ping=pool_pre_ping, sslmode=os.environ["DB_SSLMODE"])
+        tempos["fria"].append(_primeira_consulta(engine))
+        engine.dispose()
+
+        engine = criar_engine(url, pool_pre_ping=pool_pre_ping, sslmode=os.environ["DB_SSLMODE"])
+        aquecer_engine(engine)
+        tempos["aquecida"].append(_primeira_consulta(engine))
+
+        _derrubar_conexoes_ociosas(engine)
+        try:
+            tempos["após queda"].append(_primeira_consulta(engine))
+        except Exception:
+            falhas_apos_queda += 1
+        engine.dispose()
+
+    return {"tempos": tempos, "falhas_apos_queda": falhas_apos_queda}
+
+
+def _resumo(valores: list) -> str:
+    if not valores:
+        return f"{'-':>10} {'-':>10}"
+    ordenados = sorted(valores)
+    p95 = ordenados[min(len(ordenados) - 1, int(len(ordenados) * 0.95))]
+    return f"{statistics.median(valores):>8.2f}ms {p95:>8.2f}ms"
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--repeticoes", type=int, default=20)
+    parser.add_argument("--sslmode", default=os.getenv("DB_SSLMODE", "prefer"),
+                        help="sslmode do libpq (Postgres local normalmente não tem TLS: use disable ou prefer)")
+    args = parser.parse_args()
+    os.environ["DB_SSLMODE"] = args.sslmode
+
+    print(f"{'configuração':<22} {'cenário':<12} {'mediana':>10} {'p95':>10}")
+    for pool_pre_ping in (False, True):
+        resultado = medir(args.repeticoes, pool_pre_ping)
+        nome = f"pool_pre_ping={pool_pre_ping}"
+        for cenario, valores in resultado["tempos"].items():
+            print(f"{nome:<22} {cenario:<12} {_resumo(valores)}")
+        print(f"{nome:<22} falhas na primeira consulta após queda: "
+              f"{resultado['falhas_apos_queda']}/{args.repeticoes}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,157 @@
+"""
+Benchmark dos índices do ledger de estoque (migração 2 de src/db/create_schema.py).
+
+Cria um schema temporário com um ledger sintético, executa EXPLAIN (ANALYZE, BUFFERS)
+das consultas mais frequentes antes e depois de criar os índices e imprime os planos
+e os tempos de execução.
+
+Uso:
+    python -m benchmarks.bench_indices_estoque [--linhas 1000000] [--manter]
+
+Usa BENCH_DATABASE_URL (ou DATABASE_URL). Não rode contra o banco de produção:
+embora tudo fique no schema bench_indices, a carga consome CPU e armazenamento.
+"""
+import argparse
+import os
+import sys
+import time
+
+import psycopg2
+from psycopg2 import sql
+from dotenv import load_dotenv
+from sqlalchemy.dialects import postgresql
+
+load_dotenv()
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from src.db.create_schema import SQL_SCHEMA, MIGRATIONS
+from src.db.crud_estoque import _stmt_saldos
+
+SCHEMA = "bench_indices"
+SKU_BENCH = "SKU00042"
+DEPOSITO_BENCH = 2
+
+CARGA_SQL = """
+INSERT INTO deposito (nome, tipo)
+SELECT 'Depósito ' || d, 'Próprio' FROM generate_series(1, %(depositos)s) AS d;
+
+INSERT INTO produto (sku, nome)
+SELECT 'SKU' || lpad(p::text, 5, '0'), 'Produto ' || p FROM generate_series(1, %(produtos)s) AS p;
+
+INSERT INTO estoque (sku, deposito_id, quantidade, tipo, data_hora, saldo)
+SELECT
+    'SKU' || lpad((1 + (g::bigint * 7919) %% %(produtos)s)::text, 5, '0'),
+    1 + (g::bigint * 104729) %% %(depositos)s,
+    1 + (g %% 50),
+    CASE
+        WHEN g %% 97 = 0 THEN 'Balanço'
+        WHEN g %% 2 = 0 THEN 'Entrada'
+        ELSE 'Saída'
+    END,
+    TIMESTAMPTZ '2023-01-01 00:00:00-03' + (g * INTERVAL '1 minute'),
+    0
+FROM generate_series(1, %(linhas)s) AS g;
+"""
+
+
+def _sql_postgres(stmt) -> str:
+    """Compila uma consulta SQLAlchemy para SQL PostgreSQL com os parâmetros embutidos."""
+    return str(stmt.compile(dialect=postgresql.dialect(), compile_kwargs={"literal_binds": True}))
+
+
+def consultas_benchmark() -> dict:
+    """Consultas equivalentes às usadas por crud_estoque, com parâmetros fixos."""
+    return {
+        "saldo de um par (_calcular_saldo)": _sql_postgres(_stmt_saldos(SKU_BENCH, DEPOSITO_BENCH)),
+        "estoque atual de um depósito (consultar_estoque_batch)": f"""
+            SELECT e.sku, e.saldo
+            FROM estoque e
+            JOIN (
+                SELECT sku, max(data_hora) AS max_data_hora
+                FROM estoque
+                WHERE deposito_id = {DEPOSITO_BENCH}
+                GROUP BY sku
+            ) u ON u.sku = e.sku AND u.max_data_hora = e.data_hora
+            WHERE e.deposito_id = {DEPOSITO_BENCH} AND e.saldo > 0
+        """,
+        "histórico de um par em um mês (consultar_historico_movimentacoes)": f"""
+            SELECT * FROM estoque
+            WHERE sku = '{SKU_BENCH}' AND deposito_id = {DEPOSITO_BENCH}
+              AND data_hora >= '2024-03-01' AND data_hora <= '2024-03-31 23:59:59'
+            ORDER BY data_hora DESC
+        """,
+        "histórico sem filtro, primeira página": """
+            SELECT * FROM estoque ORDER BY data_hora DESC, id DESC LIMIT 100
+        """,
+    }
+
+
+def explicar(cur, titulo: str, consulta: str) -> float:
+    """Executa EXPLAIN ANALYZE, imprime o plano e retorna o tempo de execução (ms)."""
+    cur.execute("EXPLAIN (ANALYZE, BUFFERS) " + consulta)
+    linhas = [linha for (linha,) in cur.fetchall()]
+    tempo = next(
+        (float(linha.split(":")[1].strip().split()[0]) for linha in linhas if linha.startswith("Execution Time")),
+        0.0
+    )
+    print(f"\n--- {titulo} ---")
+    print("\n".join(linhas))
+    return tempo
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--linhas", type=int, default=1_000_000, help="quantidade de movimentações sintéticas")
+    parser.add_argument("--produtos", type=int, default=2_000)
+    parser.add_argument("--depositos", type=int, default=5)
+    parser.add_argument("--manter", action="store_true", help="não remove o schema ao final")
+    args = parser.parse_args()
+
+    url = os.getenv("BENCH_DATABASE_URL") or os.getenv("DATABASE_URL")
+    if not url:
+        raise ValueError("Defina BENCH_DATABASE_URL ou DATABASE_URL")
+
+    conn = psycopg2.connect(url)
+    conn.autocommit = True
+    cur = conn.cursor()
+    try:
+        cur.execute(sql.SQL("DROP SCHEMA IF EXISTS {} CASCADE").format(sql.Identifier(SCHEMA)))
+        cur.execute(sql.SQL("CREATE SCHEMA {}").format(sql.Identifier(SCHEMA)))
+        cur.execute(sql.SQL("SET search_path TO {}").format(sql.Identifier(SCHEMA)))
+        cur.execute(SQL_SCHEMA)
+
+        print(f"Gerando ledger sintético com {args.linhas:,} movimentações...")
+        inicio = time.perf_counter()
+        cur.execute(CARGA_SQL, {"linhas": args.linhas, "produtos": args.produtos, "depositos": args.depositos})
+        cur.execute("VACUUM ANALYZE estoque")
+        print(f"Carga concluída em {time.perf_counter() - inicio:.1f}s")
+
+        consultas = consultas_benchmark()
+
+        print("\n================ ANTES DOS ÍNDICES ================")
+        antes = {titulo: explicar(cur, titulo, consulta) for titulo, consulta in consultas.items()}
+
+        migracao_indices = next(m for m in MIGRATIONS if m["versao"] == 2)
+        inicio = time.perf_counter()
+        for comando in migracao_indices["sql"]:
+            cur.execute(comando)
+        cur.execute("VACUUM ANALYZE estoque")
+        print(f"\nÍndices criados em {time.perf_counter() - inicio:.1f}s")
+
+        print("\n================ DEPOIS DOS ÍNDICES ================")
+        depois = {titulo: explicar(cur, titulo, consulta) for titulo, consulta in consultas.items()}
+
+        print("\n================ RESUMO (Execution Time) ================")
+        for titulo in consultas:
+            ganho = antes[titulo] / depois[titulo] if depois[titulo] else float("inf")
+            print(f"{titulo:<70} {antes[titulo]:>10.2f} ms -> {depois[titulo]:>8.2f} ms  ({ganho:,.0f}x)")
+
+    finally:
+        if not args.manter:
+            cur.execute(sql.SQL("DROP SCHEMA IF EXISTS {} CASCADE").format(sql.Identifier(SCHEMA)))
+        cur.close()
+        conn.close()
+
+
+if __name__ == "__main__":
+    main()
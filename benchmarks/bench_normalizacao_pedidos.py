@@ -0,0 +1,132 @@
+"""
+Benchmark da normalização dos pedidos do Mercado Livre (MercadoLivreAPI._normalize_orders).
+
+Gera um payload sintético de /orders/search a partir dos pedidos reais de api_response.txt
+(mesma estrutura, com ids, datas, SKUs e envios variados), normaliza com a implementação
+atual (Arrow + pandas por coluna) e com o laço por pedido/item usado antes, confere que
+os dois DataFrames são iguais e imprime os tempos.
+
+Uso:
+    python -m benchmarks.bench_normalizacao_pedidos [--pedidos 100000] [--repeticoes 3]
+
+Não acessa a API: os detalhes de envio também são sintéticos.
+"""
+import argparse
+import copy
+import json
+import os
+import random
+import statistics
+import sys
+import time
+from datetime import datetime, timedelta, timezone
+
+import pandas as pd
+import pytz
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from src.api.mercadolivre import MercadoLivreAPI
+from src.api.pedidos_ml import STORE_COLUMNS
+
+ARQUIVO_MODELO = os.path.join(os.path.dirname(__file__), '..', 'api_response.txt')
+ENVIOS = 5000
+
+
+def gerar_pedidos(quantidade: int, semente: int = 42):
+    """Pedidos sintéticos com a estrutura dos de api_response.txt."""
+    modelos = json.load(open(ARQUIVO_MODELO, encoding='utf-8'))
+    gerador = random.Random(semente)
+    fuso = timezone(timedelta(hours=-4))
+    inicio = datetime(2024, 1, 1, tzinfo=fuso)
+
+    pedidos = []
+    for i in range(quantidade):
+        pedido = copy.deepcopy(modelos[i % len(modelos)])
+        fechamento = inicio + timedelta(minutes=gerador.randint(0, 365 * 24 * 60))
+        pedido['id'] = 2000000000000000 + i
+        pedido['date_closed'] = fechamento.isoformat(timespec='milliseconds')
+        pedido['date_last_updated'] = (fechamento + timedelta(days=2)).astimezone(timezone.utc).isoformat()
+        pedido['status'] = gerador.choice(['paid', 'paid', 'paid', 'cancelled'])
+        pedido['shipping'] = {'id': 44000000000 + gerador.randrange(ENVIOS)}
+        for pagamento in pedido['payments']:
+            pagamento['order_id'] = pedido['id']
+        # Parte dos pedidos com mais de um item (carrinho)
+        itens = pedido['order_items'] * gerador.choice([1, 1, 1, 2, 3])
+        pedido['order_items'] = [
+            dict(item, quantity=gerador.randint(1, 5), unit_price=round(gerador.uniform(10, 500), 2),
+                 item=dict(item['item'], seller_sku=f"SKU{gerador.randrange(300):03d}"))
+            for item in itens
+        ]
+        pedidos.append(pedido)
+
+    envios = {
+        44000000000 + i: (gerador.choice(['fulfillment', 'cross_docking', 'self_service', None]), float(gerador.randint(0, 30)))
+        for i in range(ENVIOS)
+    }
+    return pedidos, envios
+
+
+def normalizar_em_laco(orders, shipment_dict) -> pd.DataFrame:
+    """Implementação anterior: laço por pedido e item, com conversão de fuso por linha."""
+    brt = pytz.timezone('America/Sao_Paulo')
+    sales_data = []
+    for order in orders:
+        try:
+            date_created_brt = datetime.fromisoformat(order['date_closed']).astimezone(brt)
+            for item in order['order_items']:
+                payments = order.get('payments')
+                unit_price, qty = item['unit_price'], item['quantity']
+                logistic_type, logistic_cost = shipment_dict.get(order['shipping']['id'], ("unknown", 0.0))
+                sales_data.append({
+                    'order_id': payments[0]['order_id'],
+                    'order_status': order['status'],
+                    'payment_status': payments[0]['status'],
+                    'product_name': item['item'].get('title'),
+                    'date': date_created_brt,
+                    'sku': item['item']['seller_sku'],
+                    'qty': qty,
+                    'unit_price': unit_price,
+                    'paid_amount_calculated': (unit_price * qty) + logistic_cost,
+                    'paid_amount_calculated_no_ship_cost': unit_price * qty,
+                    'logistic_cost': logistic_cost,
+                    'logistic_type': logistic_type,
+                    'date_last_updated': order.get('date_last_updated'),
+                })
+        except KeyError:
+            pass
+    df = pd.DataFrame(sales_data, columns=STORE_COLUMNS)
+    df['date'] = pd.to_datetime(df['date'], utc=True).dt.tz_convert('America/Sao_Paulo')
+    return df
+
+
+def medir(funcao, repeticoes: int):
+    tempos, resultado = [], None
+    for _ in range(repeticoes):
+        inicio = time.perf_counter()
+        resultado = funcao()
+        tempos.append(time.perf_counter() - inicio)
+    return statistics.median(tempos), resultado
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark da normalização de pedidos do Mercado Livre.")
+    parser.add_argument("--pedidos", type=int, default=100_000, help="quantidade de pedidos sintéticos")
+    parser.add_argument("--repeticoes", type=int, default=3, help="execuções de cada implementação (mediana)")
+    args = parser.parse_args()
+
+    pedidos, envios = gerar_pedidos(args.pedidos)
+    # _normalize_orders não usa credenciais nem sessão: dispensa o __init__ (que exige o .env)
+    api = MercadoLivreAPI.__new__(MercadoLivreAPI)
+
+    tempo_laco, esperado = medir(lambda: normalizar_em_laco(pedidos, envios), args.repeticoes)
+    tempo_atual, obtido = medir(lambda: api._normalize_orders(pedidos, envios), args.repeticoes)
+
+    pd.testing.assert_frame_equal(obtido, esperado, check_dtype=False)
+    print(f"{args.pedidos} pedidos, {len(obtido)} itens")
+    print(f"  laço por item:    {tempo_laco:.3f} s")
+    print(f"  Arrow + pandas:   {tempo_atual:.3f} s  ({tempo_laco / tempo_atual:.1f}x)")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,6 +1,8 @@
 import time
 import os
 import logging
+import sqlite3
+import threading
 import urllib.parse
 from typing import Dict, List, Optional
 import pandas as pd
@@ -8,6 +10,8 @@ import requests
 from dotenv import load_dotenv
 from requests.exceptions import HTTPError, RequestException
 
+from src.api.armazem_tokens import MARGEM_RENOVACAO_SEGUNDOS, ArmazemTokens, ReservaTokens, armazem_tokens
+
 # Configuração de logging
 logging.basicConfig(
     level=logging.INFO,
@@ -17,18 +21,44 @@ logger = logging.getLogger(__name__)
 
 load_dotenv()
 
+# Validade do token de acesso quando /auth/o2/token não informa expires_in (1 hora)
+AMAZON_TOKEN_EXPIRES_IN = 3600
+
 class AmazonAPIError(Exception):
     """Exceção personalizada para erros da API da Amazon"""
     pass
 
 class AmazonTokenManager:
-    """Gerencia a autenticação e renovação de tokens da Amazon SP-API"""
+    """
+    Gerencia a autenticação e renovação de tokens da Amazon SP-API. O token de acesso fica
+    em armazem_tokens, compartilhado entre processos, com a expiração informada em
+    expires_in; é renovado em segundo plano MARGEM_RENOVACAO_SEGUNDOS antes de expirar.
+    """
     
-    def __init__(self, client_id: str, client_secret: str, refresh_token: str):
+    def __init__(self, client_id: str, client_secret: str, refresh_token: str, store: Optional[ArmazemTokens] = None):
         self.client_id = client_id
         self.client_secret = client_secret
         self.refresh_token_value = refresh_token  # Atributo renomeado
         self.access_token: Optional[str] = None
+        self.expires_at: Optional[float] = None  # epoch; None se desconhecida
+        self.store = store or armazem_tokens
+        self._store_key = f"amazon:{client_id}"
+        # Uma renovação por vez (inclusive a antecipada, feita em outra thread)
+        self._lock = threading.Lock()
+        # Reserva do armazém mantida durante uma renovação (serializa as renovações entre processos)
+        self._reserva: Optional[ReservaTokens] = None
+
+    def _load_token(self, store: Optional[ReservaTokens] = None) -> None:
+        """Adota o token do armazém se for mais novo que o da memória (outro processo pode tê-lo renovado)"""
+        token = (store or self.store).obter(self._store_key)
+        if token and (self.expires_at is None or token.expira_em > self.expires_at):
+            self.access_token, self.expires_at = token.access_token, token.expira_em
+
+    def _is_valid(self) -> bool:
+        return bool(self.access_token) and (self.expires_at is None or self.expires_at > time.time())
+
+    def _is_expiring(self) -> bool:
+        return self.expires_at is not None and self.expires_at - time.time() < MARGEM_RENOVACAO_SEGUNDOS
 
     def renew_token(self) -> None:  # Método renomeado
         """Renova o token de acesso usando refresh token"""
@@ -50,13 +80,63 @@ class AmazonTokenManager:
             response.raise_for_status()
             
             token_data = response.json()
-            self.access_token = token_data.get("access_token")
+            # O refresh token da Amazon não muda: só o token de acesso vai para o armazém
+            token = (self._reserva or self.store).gravar(
+                self._store_key, token_data["access_token"], None,
+                token_data.get("expires_in", AMAZON_TOKEN_EXPIRES_IN)
+            )
+            self.access_token, self.expires_at = token.access_token, token.expira_em
             logger.info("Token da Amazon renovado com sucesso")
             
         except HTTPError as e:
             logger.error(f"Erro ao renovar token: {e.response.text}")
             raise AmazonAPIError("Falha na renovação do token") from e
 
+    def _refresh(self) -> None:
+        """
+        Renova sob a reserva do armazém (chamar com o lock adquirido): o token gravado é relido
+        antes e, se outro processo já o renovou, é adotado sem nova renovação.
+        """
+        with self.store.reservado() as reserva:
+            self._reserva = reserva
+            try:
+                self._load_token(reserva)
+                if not self._is_valid() or self._is_expiring():
+                    self.renew_token()
+            finally:
+                self._reserva = None
+
+    def _refresh_ahead(self) -> None:
+        """Renovação em segundo plano de um token prestes a expirar (executada com o lock adquirido)"""
+        try:
+            self._load_token()
+            if self._is_expiring():
+                self._refresh()
+        except (AmazonAPIError, RequestException, sqlite3.Error) as e:
+            # O token atual continua valendo; a próxima requisição tenta de novo
+            logger.warning(f"Falha na renovação antecipada do token: {e}")
+        finally:
+            self._lock.release()
+
+    def get_token(self) -> str:
+        """
+        Retorna um token válido. Um token válido (da memória ou do armazém) é devolvido sem
+        esperar: se estiver perto de expirar, a renovação é disparada em outra thread, a
+        menos que já haja uma em andamento. Sem token válido, renova sob o lock.
+        """
+        if self.access_token is None:
+            self._load_token()
+        if self._is_valid():
+            if self._is_expiring() and self._lock.acquire(blocking=False):
+                threading.Thread(target=self._refresh_ahead, daemon=True).start()
+            return self.access_token
+
+        with self._lock:
+            self._load_token()
+            if not self._is_valid():
+                self._refresh()
+            return self.access_token
+
 class AmazonAPI:
     """Classe principal para integração com a API de estoque da Amazon"""
     
@@ -106,11 +186,8 @@ class AmazonAPI:
         params = params or {}
         
         try:
-            if not self.token_manager.access_token:
-                self.token_manager.renew_token()
-                
             self.session.headers.update({
-                "x-amz-access-token": self.token_manager.access_token
+                "x-amz-access-token": self.token_manager.get_token()
             })
             
             response = self.session.get(url, params=params, timeout=15)
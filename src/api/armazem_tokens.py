@@ -0,0 +1,140 @@
+import os
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from typing import Iterator, NamedTuple, Optional
+
+# Antecedência, em segundos, com que um token é renovado antes de expirar
+MARGEM_RENOVACAO_SEGUNDOS = float(os.getenv("TOKEN_MARGEM_RENOVACAO", "300"))
+
+# Espera máxima pela reserva do armazém, que outro processo mantém durante uma renovação
+ESPERA_RESERVA_SEGUNDOS = 30
+
+
+class TokenArmazenado(NamedTuple):
+    access_token: str
+    refresh_token: Optional[str]
+    expira_em: float  # epoch, em segundos
+
+
+def _obter(conexao: sqlite3.Connection, chave: str) -> Optional[TokenArmazenado]:
+    linha = conexao.execute(
+        "SELECT access_token, refresh_token, expira_em FROM token WHERE chave = ?", (chave,)
+    ).fetchone()
+    return TokenArmazenado(*linha) if linha else None
+
+
+def _gravar(conexao: sqlite3.Connection, chave: str, access_token: str, refresh_token: Optional[str],
+            expires_in: float) -> TokenArmazenado:
+    token = TokenArmazenado(access_token, refresh_token, time.time() + expires_in)
+    conexao.execute(
+        "INSERT OR REPLACE INTO token (chave, access_token, refresh_token, expira_em) VALUES (?, ?, ?, ?)",
+        (chave, *token)
+    )
+    return token
+
+
+class ReservaTokens:
+    """
+    Trava de escrita do armazém (BEGIN IMMEDIATE) em uma conexão própria, mantida até liberar().
+
+    Enquanto ela existe, nenhum outro processo grava tokens nem obtém outra reserva: quem
+    renova um token a mantém entre reler o token gravado e gravar o novo, e o refresh token
+    (de uso único no Mercado Livre) nunca é enviado duas vezes ao servidor. Leituras e
+    gravações durante a reserva devem passar por ela, não pelo ArmazemTokens.
+    """
+
+    def __init__(self, conexao: sqlite3.Connection):
+        self._conexao = conexao
+
+    def obter(self, chave: str) -> Optional[TokenArmazenado]:
+        """Retorna o token gravado para a chave (mesmo que já expirado) ou None."""
+        return _obter(self._conexao, chave)
+
+    def gravar(self, chave: str, access_token: str, refresh_token: Optional[str], expires_in: float) -> TokenArmazenado:
+        """Grava o token, que expira em expires_in segundos a partir de agora, e o retorna (efetivado em liberar())."""
+        return _gravar(self._conexao, chave, access_token, refresh_token, expires_in)
+
+    def liberar(self) -> None:
+        """Efetiva as gravações e libera a trava."""
+        try:
+            self._conexao.execute("COMMIT")
+        finally:
+            self._conexao.close()
+
+
+class ArmazemTokens:
+    """
+    Armazém persistente (SQLite) dos tokens de acesso das APIs, por chave (ex.: 'mercadolivre:<client_id>').
+
+    É compartilhado entre processos e entre execuções do Streamlit: uma instância nova de
+    MercadoLivreAPI ou AmazonAPI começa com o token já obtido por outra, em vez de fazer
+    uma nova autenticação na primeira requisição. O arquivo é criado com permissão 0600,
+    pois guarda os refresh tokens.
+    """
+
+    def __init__(self, caminho: str):
+        self.caminho = caminho
+        self._lock = threading.Lock()
+        self._conexao: Optional[sqlite3.Connection] = None
+
+    def _conectar(self) -> sqlite3.Connection:
+        """Abre o arquivo na primeira utilização e cria a tabela (chamar com o lock adquirido)."""
+        if self._conexao is None:
+            # Cria o arquivo já só com permissão do dono, antes de gravar qualquer token
+            os.close(os.open(self.caminho, os.O_CREAT | os.O_RDWR, 0o600))
+            self._conexao = sqlite3.connect(self.caminho, timeout=10, check_same_thread=False)
+            self._conexao.execute("""
+                CREATE TABLE IF NOT EXISTS token (
+                    chave TEXT PRIMARY KEY,
+                    access_token TEXT NOT NULL,
+                    refresh_token TEXT,
+                    expira_em REAL NOT NULL
+                )
+            """)
+            self._conexao.commit()
+        return self._conexao
+
+    def obter(self, chave: str) -> Optional[TokenArmazenado]:
+        """Retorna o token gravado para a chave (mesmo que já expirado) ou None."""
+        with self._lock:
+            return _obter(self._conectar(), chave)
+
+    def gravar(self, chave: str, access_token: str, refresh_token: Optional[str], expires_in: float) -> TokenArmazenado:
+        """Grava o token, que expira em expires_in segundos a partir de agora, e o retorna."""
+        with self._lock:
+            conexao = self._conectar()
+            token = _gravar(conexao, chave, access_token, refresh_token, expires_in)
+            conexao.commit()
+        return token
+
+    def reservar(self) -> ReservaTokens:
+        """
+        Obtém a reserva do armazém, esperando até ESPERA_RESERVA_SEGUNDOS se outro processo
+        (ou outra thread) a mantiver. Bloqueia: em código assíncrono, chamar em outra thread.
+        """
+        with self._lock:
+            self._conectar()  # garante o arquivo e a tabela
+        conexao = sqlite3.connect(
+            self.caminho, timeout=ESPERA_RESERVA_SEGUNDOS, isolation_level=None, check_same_thread=False
+        )
+        try:
+            conexao.execute("BEGIN IMMEDIATE")
+        except sqlite3.Error:
+            conexao.close()
+            raise
+        return ReservaTokens(conexao)
+
+    @contextmanager
+    def reservado(self) -> Iterator[ReservaTokens]:
+        """reservar() como gerenciador de contexto: a reserva é liberada ao fim do bloco."""
+        reserva = self.reservar()
+        try:
+            yield reserva
+        finally:
+            reserva.liberar()
+
+
+# Instância compartilhada pelo processo (arquivo configurável via ARMAZEM_TOKENS)
+armazem_tokens = ArmazemTokens(os.getenv("ARMAZEM_TOKENS", "tokens_api.sqlite3"))
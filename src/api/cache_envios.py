@@ -0,0 +1,114 @@
+import os
+import sqlite3
+import threading
+import time
+from typing import Dict, Iterable, Optional, Tuple
+
+# Envios nesses status não mudam mais: tipo logístico e frete podem ficar em cache por muito tempo
+STATUS_FINAIS = {"delivered", "not_delivered", "cancelled"}
+
+
+class CacheEnvios:
+    """
+    Cache persistente (SQLite) dos detalhes de envio do Mercado Livre, por shipping_id.
+
+    O TTL depende do status do envio: envios finalizados ficam em cache por ttl_final_segundos,
+    os ainda em andamento por ttl_andamento_segundos. Assim, ao gerar de novo o relatório de
+    vendas de um período que se sobrepõe ao anterior, só os envios novos ou em andamento são
+    buscados na API.
+    """
+
+    def __init__(self, caminho: str, ttl_final_segundos: float = 30 * 86400, ttl_andamento_segundos: float = 3600):
+        self.caminho = caminho
+        self.ttl_final_segundos = ttl_final_segundos
+        self.ttl_andamento_segundos = ttl_andamento_segundos
+        self._lock = threading.Lock()
+        self._conexao: Optional[sqlite3.Connection] = None
+        self.hits = 0
+        self.misses = 0
+
+    def _conectar(self) -> sqlite3.Connection:
+        """Abre o arquivo na primeira utilização e cria a tabela (chamar com o lock adquirido)."""
+        if self._conexao is None:
+            self._conexao = sqlite3.connect(self.caminho, check_same_thread=False)
+            self._conexao.execute("""
+                CREATE TABLE IF NOT EXISTS envio (
+                    shipping_id TEXT PRIMARY KEY,
+                    status TEXT,
+                    logistic_type TEXT,
+                    logistic_cost REAL NOT NULL DEFAULT 0,
+                    expira_em REAL NOT NULL
+                )
+            """)
+            self._conexao.commit()
+        return self._conexao
+
+    def ttl(self, status: Optional[str]) -> float:
+        """TTL, em segundos, de um envio no status informado."""
+        return self.ttl_final_segundos if status in STATUS_FINAIS else self.ttl_andamento_segundos
+
+    def obter_varios(self, shipping_ids: Iterable) -> Dict[str, Tuple[str, float]]:
+        """
+        Retorna {shipping_id: (logistic_type, logistic_cost)} dos envios com cache válido.
+        As chaves são os IDs como texto.
+        """
+        ids = list({str(shipping_id) for shipping_id in shipping_ids})
+        agora = time.time()
+        encontrados = {}
+        with self._lock:
+            conexao = self._conectar()
+            # Em blocos, abaixo do limite de parâmetros do SQLite
+            for inicio in range(0, len(ids), 500):
+                bloco = ids[inicio:inicio + 500]
+                linhas = conexao.execute(
+                    f"SELECT shipping_id, logistic_type, logistic_cost FROM envio "
+                    f"WHERE expira_em > ? AND shipping_id IN ({', '.join('?' * len(bloco))})",
+                    [agora, *bloco]
+                )
+                encontrados.update({shipping_id: (tipo, custo) for shipping_id, tipo, custo in linhas})
+            self.hits += len(encontrados)
+            self.misses += len(ids) - len(encontrados)
+        return encontrados
+
+    def gravar_varios(self, envios: Iterable[Tuple[str, Optional[str], str, float]]) -> None:
+        """Grava (shipping_id, status, logistic_type, logistic_cost), com o TTL do status de cada envio."""
+        agora = time.time()
+        linhas = [
+            (str(shipping_id), status, tipo, custo or 0.0, agora + self.ttl(status))
+            for shipping_id, status, tipo, custo in envios
+        ]
+        with self._lock:
+            conexao = self._conectar()
+            conexao.executemany(
+                "INSERT OR REPLACE INTO envio (shipping_id, status, logistic_type, logistic_cost, expira_em) "
+                "VALUES (?, ?, ?, ?, ?)",
+                linhas
+            )
+            conexao.commit()
+
+    def remover_expirados(self) -> int:
+        """Apaga do arquivo as entradas expiradas. Retorna quantas foram removidas."""
+        with self._lock:
+            conexao = self._conectar()
+            removidas = conexao.execute("DELETE FROM envio WHERE expira_em <= ?", (time.time(),)).rowcount
+            conexao.commit()
+            return removidas
+
+    def estatisticas(self) -> Dict[str, Optional[float]]:
+        """Retorna os contadores de acertos e faltas do cache."""
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "taxa_acerto": self.hits / total if total else None,
+            }
+
+
+# Instância compartilhada pelo processo. Arquivo e TTLs configuráveis via ML_CACHE_ENVIOS
+# (caminho), ML_CACHE_ENVIOS_TTL_FINAL e ML_CACHE_ENVIOS_TTL_ANDAMENTO (em segundos)
+cache_envios = CacheEnvios(
+    caminho=os.getenv("ML_CACHE_ENVIOS", "cache_envios_ml.sqlite3"),
+    ttl_final_segundos=float(os.getenv("ML_CACHE_ENVIOS_TTL_FINAL", str(30 * 86400))),
+    ttl_andamento_segundos=float(os.getenv("ML_CACHE_ENVIOS_TTL_ANDAMENTO", "3600")),
+)
@@ -3,17 +3,23 @@ import pytz
 import json
 import os
 import logging
+import sqlite3
+import threading
+import time
 import httpx
 import pandas as pd
-import requests
+import pyarrow as pa
+import pyarrow.compute as pc
 from dotenv import load_dotenv
-from typing import Dict, List, Optional
-from requests.exceptions import HTTPError, RequestException
-from functools import lru_cache
+from typing import Dict, Iterable, Iterator, List, Optional
+from itertools import islice
 
-import aiohttp
 import asyncio
 
+from src.api.armazem_tokens import MARGEM_RENOVACAO_SEGUNDOS, ArmazemTokens, ReservaTokens, armazem_tokens
+from src.api.cache_envios import cache_envios
+from src.api.pedidos_ml import ArmazemPedidosML, SALES_COLUMNS, STORE_COLUMNS, armazem_pedidos
+
 from openpyxl import Workbook
 from openpyxl.styles import Font, Alignment, PatternFill
 from openpyxl.utils.dataframe import dataframe_to_rows
@@ -29,24 +35,129 @@ logger = logging.getLogger(__name__)
 
 load_dotenv()
 
+ML_TOKEN_URL = "https://api.mercadolibre.com/oauth/token"
+# Validade do token de acesso quando /oauth/token não informa expires_in (6 horas)
+ML_TOKEN_EXPIRES_IN = 21600
+
+# Cliente HTTP compartilhado (MLAsyncClient): timeout por requisição, em segundos, e
+# tamanho do pool de conexões keep-alive
+ML_REQUEST_TIMEOUT = 15
+ML_MAX_CONNECTIONS = 20
+
+# O multiget (/items?ids=...) aceita até 20 itens por requisição
+ML_MULTIGET_LIMIT = 20
+
+# Paginação de /users/{id}/items/search: até 100 IDs por página e offset máximo de 1000;
+# além disso a busca precisa ser feita em modo scan, seguindo o scroll_id
+ML_SEARCH_PAGE_LIMIT = 100
+ML_SEARCH_OFFSET_MAX = 1000
+
+# Busca de pedidos: páginas de 50 (máximo de /orders/search), buscadas em paralelo com no
+# máximo ML_ORDERS_CONCURRENCY requisições simultâneas e ML_ORDERS_RATE_LIMIT por segundo
+ML_ORDERS_PAGE_LIMIT = 50
+ML_ORDERS_CONCURRENCY = int(os.getenv("ML_ORDERS_CONCURRENCY", "5"))
+ML_ORDERS_RATE_LIMIT = float(os.getenv("ML_ORDERS_RATE_LIMIT", "10"))
+
+# Máximo de detalhes de envio buscados ao mesmo tempo (os demais vêm de cache_envios)
+ML_SHIPMENTS_CONCURRENCY = int(os.getenv("ML_SHIPMENTS_CONCURRENCY", "10"))
+
+# Campos de /orders/search usados na normalização dos pedidos (os demais são descartados
+# na conversão para Arrow)
+ML_ORDER_TYPE = pa.struct([
+    ('id', pa.int64()),
+    ('status', pa.string()),
+    ('date_closed', pa.string()),
+    ('date_last_updated', pa.string()),
+    ('shipping', pa.struct([('id', pa.int64())])),
+    ('payments', pa.list_(pa.struct([('order_id', pa.int64()), ('status', pa.string())]))),
+    ('order_items', pa.list_(pa.struct([
+        ('item', pa.struct([('seller_sku', pa.string()), ('title', pa.string())])),
+        ('quantity', pa.int64()),
+        ('unit_price', pa.float64()),
+    ]))),
+])
+
+# Sincronização incremental dos pedidos (ver sync_orders): histórico buscado na primeira
+# execução e margem de segurança do marco em relação ao relógio local
+ML_SYNC_DIAS_INICIAIS = int(os.getenv("ML_SYNC_DIAS_INICIAIS", "365"))
+ML_SYNC_MARGEM_MINUTOS = int(os.getenv("ML_SYNC_MARGEM_MINUTOS", "5"))
+
+# Grava os pedidos recebidos em api_response.txt, para depuração (desligado por padrão)
+ML_DEBUG_DUMP = os.getenv("ML_DEBUG_DUMP", "false").lower() in ("1", "true", "sim", "yes")
+
+# Campos dos itens usados no filtro de catálogo e no relatório de estoque
+ML_ITEM_ATTRIBUTES = "id,title,catalog_listing,available_quantity,attributes,variations"
+
 class MercadoLivreAPIError(Exception):
     """Exceção personalizada para erros da API do Mercado Livre"""
     pass
 
+class AsyncRateLimiter:
+    """Espaça o início das requisições assíncronas para no máximo 'rate' por segundo"""
+
+    def __init__(self, rate: float):
+        self.interval = 1 / rate if rate > 0 else 0.0
+        self._next_start = 0.0
+        self._lock = asyncio.Lock()
+
+    async def wait(self) -> None:
+        """Aguarda a vez da próxima requisição"""
+        loop = asyncio.get_running_loop()
+        async with self._lock:
+            now = loop.time()
+            start = max(now, self._next_start)
+            self._next_start = start + self.interval
+        if start > now:
+            await asyncio.sleep(start - now)
+
 class MLTokenManager:
-    """Gerencia autenticação e renovação de tokens do Mercado Livre"""
+    """
+    Gerencia autenticação e renovação de tokens do Mercado Livre. Os tokens ficam em
+    armazem_tokens, compartilhados entre processos, com a expiração informada em expires_in;
+    o token é renovado em segundo plano MARGEM_RENOVACAO_SEGUNDOS antes de expirar.
+    """
     
-    def __init__(self, client_id: str, client_secret: str):
+    def __init__(self, client_id: str, client_secret: str, store: Optional[ArmazemTokens] = None):
         self.client_id = client_id
         self.client_secret = client_secret
         self.access_token: Optional[str] = None
         self.refresh_token_value: Optional[str] = None  # Atributo renomeado
+        self.expires_at: Optional[float] = None  # epoch; None se desconhecida
+        self.store = store or armazem_tokens
+        self._store_key = f"mercadolivre:{client_id}"
+        # Serializa as renovações: uma rajada de 401 renova o token uma única vez
+        self._lock = asyncio.Lock()
+        self._refresh_task: Optional[asyncio.Task] = None
+        # Reserva do armazém mantida durante uma renovação (serializa as renovações entre processos)
+        self._reserva: Optional[ReservaTokens] = None
+
+    def _save_token(self, token_data: Dict) -> None:
+        """Guarda o token recebido de /oauth/token na memória e no armazém"""
+        # O refresh token do Mercado Livre é de uso único: guarda o novo, se vier
+        refresh_token = token_data.get("refresh_token", self.refresh_token_value)
+        token = (self._reserva or self.store).gravar(
+            self._store_key, token_data["access_token"], refresh_token,
+            token_data.get("expires_in", ML_TOKEN_EXPIRES_IN)
+        )
+        self.access_token, self.refresh_token_value, self.expires_at = token
+
+    def _load_token(self, store: Optional[ReservaTokens] = None) -> None:
+        """Adota o token do armazém se for mais novo que o da memória (outro processo pode tê-lo renovado)"""
+        token = (store or self.store).obter(self._store_key)
+        if token and (self.expires_at is None or token.expira_em > self.expires_at):
+            self.access_token, self.refresh_token_value, self.expires_at = token
+
+    def _is_valid(self) -> bool:
+        return bool(self.access_token) and (self.expires_at is None or self.expires_at > time.time())
 
-    def authenticate(self) -> None:
+    def _is_expiring(self) -> bool:
+        return self.expires_at is not None and self.expires_at - time.time() < MARGEM_RENOVACAO_SEGUNDOS
+
+    async def authenticate_async(self, client: httpx.AsyncClient) -> None:
         """Obtém novo token de acesso usando client credentials"""
         try:
-            response = requests.post(
-                "https://api.mercadolibre.com/oauth/token",
+            response = await client.post(
+                ML_TOKEN_URL,
                 data={
                     "grant_type": "client_credentials",
                     "client_id": self.client_id,
@@ -55,23 +166,21 @@ class MLTokenManager:
                 timeout=10
             )
             response.raise_for_status()
-            token_data = response.json()
-            self.access_token = token_data.get("access_token")
-            self.refresh_token_value = token_data.get("refresh_token")
+            self._save_token({"refresh_token": None, **response.json()})
             logger.info("Autenticação realizada com sucesso")
             
-        except HTTPError as e:
+        except httpx.HTTPStatusError as e:
             logger.error(f"Erro de autenticação: {e.response.text}")
             raise MercadoLivreAPIError("Falha na autenticação") from e
 
-    def renew_token(self) -> None:  # Método renomeado
+    async def renew_token_async(self, client: httpx.AsyncClient) -> None:
         """Renova o token de acesso usando refresh token"""
         if not self.refresh_token_value:
             raise MercadoLivreAPIError("Refresh token não disponível")
             
         try:
-            response = requests.post(
-                "https://api.mercadolibre.com/oauth/token",
+            response = await client.post(
+                ML_TOKEN_URL,
                 data={
                     "grant_type": "refresh_token",
                     "client_id": self.client_id,
@@ -81,18 +190,136 @@ class MLTokenManager:
                 timeout=10
             )
             response.raise_for_status()
-            token_data = response.json()
-            self.access_token = token_data.get("access_token")
+            self._save_token(response.json())
             logger.info("Token de acesso renovado com sucesso")
             
-        except HTTPError as e:
+        except httpx.HTTPStatusError as e:
             logger.error(f"Erro ao renovar token: {e.response.text}")
             raise MercadoLivreAPIError("Falha ao renovar token") from e
 
+    async def _refresh_async(self, client: httpx.AsyncClient, expired_token: Optional[str] = None) -> None:
+        """
+        Renova com o refresh token, se houver; senão autentica (chamar com o lock adquirido).
+        Tudo sob a reserva do armazém: o token gravado é relido antes de chamar /oauth/token e,
+        se outro processo já o renovou (válido, longe de expirar e diferente de expired_token),
+        é adotado sem nova renovação.
+        """
+        self._reserva = await asyncio.to_thread(self.store.reservar)
+        try:
+            self._load_token(self._reserva)
+            if self._is_valid() and not self._is_expiring() and self.access_token != expired_token:
+                return
+            if self.refresh_token_value:
+                await self.renew_token_async(client)
+            else:
+                await self.authenticate_async(client)
+        finally:
+            reserva, self._reserva = self._reserva, None
+            reserva.liberar()
+
+    async def _refresh_ahead(self, client: httpx.AsyncClient) -> None:
+        """Renovação em segundo plano de um token prestes a expirar, ainda válido"""
+        try:
+            async with self._lock:
+                self._load_token()
+                if self._is_expiring():
+                    await self._refresh_async(client)
+        except (MercadoLivreAPIError, httpx.HTTPError, sqlite3.Error) as e:
+            # O token atual continua valendo; a próxima requisição tenta de novo
+            logger.warning(f"Falha na renovação antecipada do token: {e}")
+        finally:
+            self._refresh_task = None
+
+    async def get_token_async(self, client: httpx.AsyncClient, expired_token: Optional[str] = None) -> str:
+        """
+        Retorna um token válido. Um token válido (da memória ou do armazém) é devolvido sem
+        esperar: se estiver perto de expirar, a renovação é disparada em segundo plano. Sem
+        token válido, ou com expired_token (o token recusado com 401), renova sob o lock, a
+        menos que outra requisição ou processo já tenha renovado enquanto esta aguardava,
+        caso em que só devolve o token novo.
+        """
+        if expired_token is None:
+            if self.access_token is None:
+                self._load_token()
+            if self._is_valid():
+                if self._is_expiring() and self._refresh_task is None:
+                    self._refresh_task = asyncio.create_task(self._refresh_ahead(client))
+                return self.access_token
+
+        async with self._lock:
+            self._load_token()
+            if self._is_valid() and self.access_token != expired_token:
+                return self.access_token
+            await self._refresh_async(client, expired_token)
+            return self.access_token
+
+class MLAsyncClient:
+    """
+    Cliente HTTP assíncrono compartilhado por todas as instâncias de MercadoLivreAPI: um
+    httpx.AsyncClient de vida longa (conexões keep-alive reaproveitadas entre requisições e
+    entre execuções do Streamlit) rodando em um event loop próprio, em uma thread daemon.
+
+    O código síncrono executa corrotinas nesse loop com run(); as corrotinas da API devem
+    rodar sempre nele, pois o pool de conexões pertence ao loop em que foi criado.
+    """
+
+    def __init__(self, transport: Optional[httpx.AsyncBaseTransport] = None):
+        self._transport = transport
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._thread: Optional[threading.Thread] = None
+        self._client: Optional[httpx.AsyncClient] = None
+        self._lock = threading.Lock()
+
+    def _start(self) -> asyncio.AbstractEventLoop:
+        """Inicia o loop e a thread na primeira utilização"""
+        with self._lock:
+            if self._loop is None:
+                self._loop = asyncio.new_event_loop()
+                self._thread = threading.Thread(
+                    target=self._loop.run_forever, name="ml-async-client", daemon=True
+                )
+                self._thread.start()
+            return self._loop
+
+    @property
+    def client(self) -> httpx.AsyncClient:
+        """O httpx.AsyncClient compartilhado (usar apenas em corrotinas executadas por run())"""
+        if self._client is None:
+            self._client = httpx.AsyncClient(
+                headers={"User-Agent": "DVSmartShop/1.0", "Accept": "application/json"},
+                timeout=ML_REQUEST_TIMEOUT,
+                limits=httpx.Limits(max_connections=ML_MAX_CONNECTIONS, max_keepalive_connections=ML_MAX_CONNECTIONS),
+                transport=self._transport,
+            )
+        return self._client
+
+    def run(self, coro):
+        """Executa a corrotina no loop do cliente e aguarda o resultado (ponte para o código síncrono)"""
+        loop = self._start()
+        if threading.current_thread() is self._thread:
+            coro.close()
+            raise RuntimeError("MLAsyncClient.run() chamado de dentro do próprio loop; use await")
+        return asyncio.run_coroutine_threadsafe(coro, loop).result()
+
+    def close(self) -> None:
+        """Fecha as conexões e encerra o loop"""
+        if self._loop is None:
+            return
+        if self._client is not None:
+            self.run(self._client.aclose())
+            self._client = None
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join()
+        self._loop.close()
+        self._loop = self._thread = None
+
+# Instância compartilhada pelo processo
+ml_async_client = MLAsyncClient()
+
 class MercadoLivreAPI:
     """Classe principal para integração com a API do Mercado Livre"""
     
-    def __init__(self):
+    def __init__(self, http_client: Optional["MLAsyncClient"] = None):
         self.client_id = os.getenv("MERCADO_LIVRE_CLIENT_ID")
         self.client_secret = os.getenv("MERCADO_LIVRE_CLIENT_SECRET")
         self.user_id = os.getenv("MERCADO_LIVRE_USER_ID")
@@ -102,7 +329,7 @@ class MercadoLivreAPI:
         self.GROQ_API_KEY = os.getenv("GROQ_API_KEY")
         
         self._validate_credentials()
-        self._setup_session()
+        self.http_client = http_client or ml_async_client
 
     def _validate_credentials(self) -> None:
         """Valida as credenciais essenciais"""
@@ -119,74 +346,106 @@ class MercadoLivreAPI:
                 f"Credenciais faltando no .env: {', '.join(missing)}"
             )
 
-    def _setup_session(self) -> None:
-        """Configura sessão HTTP reutilizável"""
-        self.session = requests.Session()
-        self.session.headers.update({
-            "User-Agent": "DVSmartShop/1.0",
-            "Accept": "application/json",
-            "Content-Type": "application/json"
-        })
+    def _run(self, coro):
+        """Executa uma corrotina da API no cliente compartilhado e retorna o resultado"""
+        return self.http_client.run(coro)
 
     def _make_request(self, url: str, params: Optional[Dict] = None) -> Dict:
-        """Executa requisições à API com tratamento de erros"""
-        try:
-            if not self.token_manager.access_token:
-                self.token_manager.authenticate()
-                
-            headers = {"Authorization": f"Bearer {self.token_manager.access_token}"}
-            
-            response = self.session.get(
-                url,
-                headers=headers,
-                params=params,
-                timeout=15
-            )
-            logger.debug(f"Resposta bruta da API: {response.text}")  # Para debug
-            response.raise_for_status()
-            
-            return response.json()
-            
-        except HTTPError as e:
-            if e.response.status_code == 401:
-                logger.warning("Token expirado, tentando renovar...")
-                self.token_manager.renew_token()
-                return self._make_request(url, params)
-            logger.error(f"Erro na API: {e.response.text}")
-            raise MercadoLivreAPIError("Erro na requisição à API") from e
-            
-        except RequestException as e:
-            logger.error(f"Erro de conexão: {str(e)}")
-            raise MercadoLivreAPIError("Erro de conexão") from e
+        """Executa requisições à API com tratamento de erros (versão síncrona de _make_request_async)"""
+        return self._run(self._make_request_async(url, params))
 
-    @lru_cache(maxsize=128)
-    def _get_active_items(self) -> List[str]:
+    def _iter_active_item_ids(self) -> Iterator[str]:
         """
-        Obtém IDs de itens ativos com cache, excluindo anúncios de catálogo.
+        Percorre todas as páginas de /users/{id}/items/search?status=active e gera os IDs
+        à medida que chegam. Até ML_SEARCH_OFFSET_MAX itens usa offset/limit; acima disso
+        passa para search_type=scan, seguindo o scroll_id até a última página.
         """
-        try:
-            # Faz a requisição para obter os IDs dos anúncios ativos
+        url = f"https://api.mercadolibre.com/users/{self.user_id}/items/search"
+        seen = set()
+
+        offset = 0
+        while True:
             response = self._make_request(
-                f"https://api.mercadolibre.com/users/{self.user_id}/items/search",
-                params={"status": "active"}
+                url, params={"status": "active", "offset": offset, "limit": ML_SEARCH_PAGE_LIMIT}
             )
-            
-            # Extrai os resultados da resposta
             results = response.get("results", [])
-            
-            # Filtra os IDs dos anúncios que não são de catálogo
-            non_catalog_ids = []
             for item_id in results:
-                item_details = self._make_request(f"https://api.mercadolibre.com/items/{item_id}")
-                if not item_details.get("catalog_listing", False):  # Verifica se não é um anúncio de catálogo
-                    non_catalog_ids.append(item_id)
-            
-            print(non_catalog_ids)
-            return non_catalog_ids
+                if item_id not in seen:
+                    seen.add(item_id)
+                    yield item_id
+
+            total = response.get("paging", {}).get("total", 0)
+            offset += len(results)
+            if not results or offset >= total:
+                return
+            if offset + ML_SEARCH_PAGE_LIMIT > ML_SEARCH_OFFSET_MAX:
+                break
+
+        # Mais itens do que o offset permite: o scan recomeça do início, então os IDs já
+        # gerados são ignorados
+        logger.info(f"Mais de {ML_SEARCH_OFFSET_MAX} itens ativos ({total}), continuando em modo scan...")
+        params = {"status": "active", "search_type": "scan", "limit": ML_SEARCH_PAGE_LIMIT}
+        while True:
+            response = self._make_request(url, params=params)
+            results = response.get("results", [])
+            if not results:
+                return
+            for item_id in results:
+                if item_id not in seen:
+                    seen.add(item_id)
+                    yield item_id
+
+            scroll_id = response.get("scroll_id")
+            if not scroll_id:
+                return
+            params = {"status": "active", "search_type": "scan", "scroll_id": scroll_id,
+                      "limit": ML_SEARCH_PAGE_LIMIT}
+
+    def _iter_items_details(self, item_ids: Iterable[str]) -> Iterator[Dict]:
+        """
+        Obtém os detalhes dos itens pelo multiget (/items?ids=...), em lotes de até
+        ML_MULTIGET_LIMIT itens, na mesma ordem dos IDs recebidos. Aceita um gerador:
+        cada lote é buscado assim que os seus IDs chegam.
+        """
+        item_ids = iter(item_ids)
+        while True:
+            batch = list(islice(item_ids, ML_MULTIGET_LIMIT))
+            if not batch:
+                return
+            response = self._make_request(
+                "https://api.mercadolibre.com/items",
+                params={
+                    "ids": ",".join(batch),
+                    "attributes": ML_ITEM_ATTRIBUTES,
+                    "include_attributes": "all"
+                }
+            )
+            # Cada item vem com o próprio código HTTP: um item com erro falha a consulta,
+            # como acontecia com a requisição individual
+            for result in response:
+                if result.get("code") != 200:
+                    logger.error(f"Erro ao obter item: {result}")
+                    raise MercadoLivreAPIError(f"Erro na requisição do item (código {result.get('code')})")
+                yield result["body"]
+
+    def _get_active_items_details(self) -> List[Dict]:
+        """
+        Obtém os detalhes de todos os itens ativos, excluindo anúncios de catálogo. Cada
+        item é buscado uma única vez e os detalhes servem tanto ao filtro quanto ao estoque.
+        """
+        try:
+            # Os lotes do multiget começam enquanto a busca ainda pagina os IDs ativos
+            non_catalog = [
+                item for item in self._iter_items_details(self._iter_active_item_ids())
+                if not item.get("catalog_listing", False)  # Verifica se não é um anúncio de catálogo
+            ]
+
+            logger.debug(f"Itens ativos fora do catálogo: {[item['id'] for item in non_catalog]}")
+            return non_catalog
 
         except MercadoLivreAPIError as e:
             logger.error(f"Falha ao obter itens ativos: {str(e)}")
-            return []        
+            return []
 
     def _process_item_data(self, item_data: Dict) -> List[Dict]:
         """Processa os dados de um item para extrair estoque e SKU"""
@@ -226,14 +485,10 @@ class MercadoLivreAPI:
         """Gera relatório consolidado de estoque"""
         try:
             logger.info("Obtendo dados de estoque do Mercado Livre...")
-            item_ids = self._get_active_items()
+            items = self._get_active_items_details()
             
             stock_data = []
-            for item_id in item_ids:
-                item_data = self._make_request(
-                    f"https://api.mercadolibre.com/items/{item_id}",
-                    params={"include_attributes": "all"}
-                )
+            for item_data in items:
                 stock_data.extend(self._process_item_data(item_data))
                 
             return self._create_dataframe(stock_data)
@@ -261,50 +516,241 @@ class MercadoLivreAPI:
             return pd.DataFrame()
         
 
-    async def _make_request_async(self, session, url: str, params: Optional[Dict] = None) -> Dict:
-        """Versão assíncrona de _make_request"""
+    async def _make_request_async(self, url: str, params: Optional[Dict] = None) -> Dict:
+        """
+        Executa requisições à API com tratamento de erros. Um 401 renova o token (uma única
+        vez para todas as requisições que o receberem ao mesmo tempo) e repete a requisição.
+        """
+        client = self.http_client.client
         try:
-            if not self.token_manager.access_token:
-                await self.token_manager.authenticate_async()
-            
-            headers = {"Authorization": f"Bearer {self.token_manager.access_token}"}
-            
-            async with session.get(url, headers=headers, params=params, timeout=15) as response:
-                logger.debug(f"Resposta bruta da API: {await response.text()}")  # Para debug
-                response.raise_for_status()
-                return await response.json()
-                
-        except aiohttp.ClientResponseError as e:
-            if e.status == 401:
+            token = await self.token_manager.get_token_async(client)
+            response = await client.get(url, headers={"Authorization": f"Bearer {token}"}, params=params)
+            if response.status_code == 401:
                 logger.warning("Token expirado, tentando renovar...")
-                await self.token_manager.renew_token_async()
-                return await self._make_request_async(session, url, params)
-            logger.error(f"Erro na API: {e.message}")
+                token = await self.token_manager.get_token_async(client, expired_token=token)
+                response = await client.get(url, headers={"Authorization": f"Bearer {token}"}, params=params)
+
+            logger.debug(f"Resposta bruta da API: {response.text}")  # Para debug
+            response.raise_for_status()
+            return response.json()
+                
+        except httpx.HTTPStatusError as e:
+            logger.error(f"Erro na API: {e.response.text}")
             raise MercadoLivreAPIError("Erro na requisição à API") from e
             
-        except aiohttp.ClientError as e:
+        except httpx.HTTPError as e:
             logger.error(f"Erro de conexão: {str(e)}")
             raise MercadoLivreAPIError("Erro de conexão") from e
         
         
-    @lru_cache(maxsize=128)
-    async def get_shipment_details_async(self, session, shipping_id: str) -> tuple[str, float]:
-        """
-        Versão assíncrona de get_shipment_details
-        """
+    async def _fetch_shipment_async(self, shipping_id) -> tuple[Optional[str], str, float]:
+        """Busca um envio na API e retorna (status, logistic_type, logistic_cost)"""
         url = f"https://api.mercadolibre.com/shipments/{shipping_id}"
-        shipment_details = await self._make_request_async(session, url)
+        shipment_details = await self._make_request_async(url)
         logistic_type = shipment_details.get('logistic_type')
         logistic_cost = shipment_details.get('shipping_option', {}).get('cost', 0.0)
+        return shipment_details.get('status'), logistic_type, logistic_cost
+
+    async def get_shipment_details_async(self, shipping_id: str) -> tuple[str, float]:
+        """
+        Versão assíncrona de get_shipment_details
+        """
+        _, logistic_type, logistic_cost = await self._fetch_shipment_async(shipping_id)
         return logistic_type, logistic_cost
 
 
     async def get_all_shipment_details(self, shipping_ids):
-        async with aiohttp.ClientSession() as session:
-            tasks = [self.get_shipment_details_async(session, shipping_id) for shipping_id in shipping_ids]
-            return await asyncio.gather(*tasks)    
+        """
+        Detalhes (logistic_type, logistic_cost) de cada envio, na ordem dos IDs recebidos.
+        Os envios com cache válido em cache_envios não são buscados; os demais são buscados
+        com no máximo ML_SHIPMENTS_CONCURRENCY requisições simultâneas e gravados no cache.
+        Um envio que falha na API fica como None na sua posição (e não vai para o cache).
+        """
+        cached = cache_envios.obter_varios(shipping_ids)
+        missing = list(dict.fromkeys(
+            shipping_id for shipping_id in shipping_ids if str(shipping_id) not in cached
+        ))
+        logger.info(f"Envios: {len(shipping_ids) - len(missing)} em cache, {len(missing)} a buscar")
+
+        if missing:
+            semaphore = asyncio.Semaphore(ML_SHIPMENTS_CONCURRENCY)
+
+            async def fetch(shipping_id):
+                async with semaphore:
+                    try:
+                        return await self._fetch_shipment_async(shipping_id)
+                    except MercadoLivreAPIError as e:
+                        logger.warning(f"Detalhes do envio {shipping_id} indisponíveis: {e}")
+                        return None
+
+            results = await asyncio.gather(*(fetch(shipping_id) for shipping_id in missing))
+            fetched = {
+                shipping_id: details for shipping_id, details in zip(missing, results) if details is not None
+            }
+
+            cache_envios.gravar_varios(
+                (shipping_id, status, logistic_type, logistic_cost)
+                for shipping_id, (status, logistic_type, logistic_cost) in fetched.items()
+            )
+            for shipping_id, (_, logistic_type, logistic_cost) in fetched.items():
+                cached[str(shipping_id)] = (logistic_type, logistic_cost)
+
+        return [cached.get(str(shipping_id)) for shipping_id in shipping_ids]
+
+
+
+    async def _fetch_orders_async(self, url: str, params: Dict) -> List[Dict]:
+        """
+        Busca todas as páginas de /orders/search. A primeira página informa paging.total;
+        os demais offsets são buscados em paralelo, limitados por ML_ORDERS_CONCURRENCY e
+        ML_ORDERS_RATE_LIMIT. Os pedidos são devolvidos na ordem dos offsets.
+        """
+        semaphore = asyncio.Semaphore(ML_ORDERS_CONCURRENCY)
+        limiter = AsyncRateLimiter(ML_ORDERS_RATE_LIMIT)
+
+        async def fetch_page(offset: int) -> List[Dict]:
+            async with semaphore:
+                await limiter.wait()
+                response = await self._make_request_async(url, {**params, "offset": offset})
+                logger.debug(f"Resposta da API (offset {offset}): {response}")
+                return response.get('results', [])
+
+        first = await self._make_request_async(url, {**params, "offset": 0})
+        logger.debug(f"Resposta da API: {first}")  # Log da resposta completa
+        all_orders = first.get('results', [])
+
+        total = first.get('paging', {}).get('total', len(all_orders))
+        offsets = range(params['limit'], total, params['limit'])
+        logger.info(f"{total} pedidos no período, {len(offsets) + 1} páginas")
+        for results in await asyncio.gather(*(fetch_page(offset) for offset in offsets)):
+            all_orders.extend(results)
+
+        return all_orders
+
+    def _fetch_orders(self, params: Dict) -> List[Dict]:
+        """Busca em /orders/search todos os pedidos do vendedor com os filtros informados"""
+        url = "https://api.mercadolibre.com/orders/search"
+        all_orders = self._run(self._fetch_orders_async(
+            url, {"seller": self.user_id, "limit": ML_ORDERS_PAGE_LIMIT, **params}
+        ))
+
+        if ML_DEBUG_DUMP:
+            with open('api_response.txt', 'w', encoding='utf-8') as file:
+                file.write(json.dumps(all_orders, indent=2, ensure_ascii=False) + '\n')
+
+        logger.info(f"Total de pedidos recuperados: {len(all_orders)}")
+        return all_orders
+
+    def _get_shipment_dict(self, orders: List[Dict]) -> Dict:
+        """Detalhes (logistic_type, logistic_cost) dos envios dos pedidos, por shipping_id"""
+        all_shipping_ids = [order['shipping']['id'] for order in orders if 'shipping' in order]
+        unique_shipping_ids = list(set(all_shipping_ids))  # Remove duplicatas
+
+        # Obtenha os detalhes de envio de forma assíncrona; os que falharam ficam como "unknown"
+        shipment_details = self._run(self.get_all_shipment_details(unique_shipping_ids))
+        return {
+            shipping_id: details
+            for shipping_id, details in zip(unique_shipping_ids, shipment_details)
+            if details is not None
+        }
+
+    def _orders_to_arrow(self, orders: List[Dict]) -> pa.StructArray:
+        """
+        Converte os pedidos para Arrow (ML_ORDER_TYPE) de uma vez. Se algum pedido não couber
+        no tipo (um campo com tipo inesperado), converte um a um e descarta só os malformados.
+        """
+        try:
+            return pa.array(orders, type=ML_ORDER_TYPE)
+        except (pa.ArrowInvalid, pa.ArrowTypeError):
+            pass
+
+        valid = []
+        for order in orders:
+            try:
+                pa.array([order], type=ML_ORDER_TYPE)
+            except (pa.ArrowInvalid, pa.ArrowTypeError) as e:
+                order_id = order.get('id') if isinstance(order, dict) else order
+                logger.warning(f"Pedido {order_id} ignorado por formato inesperado: {e}")
+                continue
+            valid.append(order)
+        return pa.array(valid, type=ML_ORDER_TYPE)
+
+    def _normalize_orders(self, orders: List[Dict], shipment_dict: Dict) -> pd.DataFrame:
+        """
+        Uma linha por item vendido (colunas STORE_COLUMNS), com a data de fechamento no
+        horário de Brasília. Pedidos sem data de fechamento, status ou envio são ignorados,
+        assim como os malformados (ver _orders_to_arrow).
 
+        Os pedidos são convertidos de uma vez para Arrow só com os campos usados
+        (ML_ORDER_TYPE); os itens são expandidos pelo índice do pedido, os envios entram
+        por junção e as datas são convertidas por coluna.
+        """
+        orders_arr = self._orders_to_arrow(orders)
+        # pc.struct_field (e não StructArray.field) respeita os nulos do struct pai, como um
+        # pedido sem 'shipping'
+        field = pc.struct_field
+
+        # Campos do pedido e do primeiro pagamento, um registro por pedido
+        first_payment = pc.list_slice(field(orders_arr, 'payments'), 0, 1)
+        payments = pc.list_flatten(first_payment)
+        payment_df = pa.table({
+            'payment_order_id': field(payments, 'order_id'),
+            'payment_status': field(payments, 'status'),
+        }).to_pandas()
+        payment_df.index = pc.list_parent_indices(first_payment).to_numpy()
+        order_df = pa.table({
+            'id': field(orders_arr, 'id'),
+            'order_status': field(orders_arr, 'status'),
+            # Datas ISO 8601 com fuso convertidas pelo Arrow, sem parsing linha a linha
+            'date_closed': pc.cast(field(orders_arr, 'date_closed'), pa.timestamp('ns', tz='UTC')),
+            'date_last_updated': field(orders_arr, 'date_last_updated'),
+            'shipping_id': field(field(orders_arr, 'shipping'), 'id'),
+        }).to_pandas().join(payment_df)
+
+        # Um registro por item, com os campos do pedido repetidos
+        items = field(orders_arr, 'order_items')
+        item_arr = pc.list_flatten(items)
+        product = field(item_arr, 'item')
+        df = pd.concat([
+            order_df.iloc[pc.list_parent_indices(items).to_numpy()].reset_index(drop=True),
+            pa.table({
+                'product_name': field(product, 'title'),
+                'sku': field(product, 'seller_sku'),
+                'qty': field(item_arr, 'quantity'),
+                'unit_price': field(item_arr, 'unit_price'),
+            }).to_pandas(),
+        ], axis=1)
+
+        required = ['date_closed', 'order_status', 'shipping_id', 'qty', 'unit_price']
+        incomplete = df[required].isna().any(axis=1)
+        if incomplete.any():
+            logger.warning(f"{incomplete.sum()} itens de pedido ignorados por campos faltando")
+            df = df[~incomplete].reset_index(drop=True)
+
+        df['order_id'] = df['payment_order_id'].fillna(df['id']).astype('int64')
+        df['qty'] = df['qty'].astype('int64')
+        df['date'] = df['date_closed'].dt.tz_convert('America/Sao_Paulo')
+
+        # Recupera o valor do frete do comprador e a malha logística da venda
+        shipments = pd.DataFrame.from_dict(
+            shipment_dict, orient='index', columns=['logistic_type', 'logistic_cost']
+        )
+        shipping_ids = df['shipping_id'].astype('int64')
+        df = df.join(shipments, on=shipping_ids)
+        # "unknown" só para envios sem detalhes; um envio sem logistic_type na API mantém o nulo
+        df['logistic_type'] = df['logistic_type'].where(shipping_ids.isin(shipments.index), "unknown")
+        df['logistic_cost'] = df['logistic_cost'].fillna(0.0)
 
+        # sem frete comprador (default Mercado turbo) e com frete comprador
+        df['paid_amount_calculated_no_ship_cost'] = df['unit_price'] * df['qty']
+        df['paid_amount_calculated'] = df['paid_amount_calculated_no_ship_cost'] + df['logistic_cost']
+
+        return df[STORE_COLUMNS]
+
+    def _log_sales_totals(self, df: pd.DataFrame) -> None:
+        logger.info(f"Total de registros de venda processados: {len(df)}")
+        logger.info(f"Quantidade total unidades vendidas: {df['qty'].sum() if not df.empty else 0}")
+        logger.info(f"Faturamento Total: {df['paid_amount_calculated_no_ship_cost'].sum() if not df.empty else 0}")
 
     def get_sales_data(self, start_date: str, end_date: str) -> pd.DataFrame:
         """
@@ -325,126 +771,97 @@ class MercadoLivreAPI:
             start_utc4 = brt.localize(start_date_brt).astimezone(pytz.timezone('Etc/GMT+4')) - timedelta(hours=1)
             end_utc4 = brt.localize(end_date_brt).astimezone(pytz.timezone('Etc/GMT+4')) + timedelta(hours=23, minutes=59, seconds=59, microseconds=999999)            
 
-            url = "https://api.mercadolibre.com/orders/search"
-            # Formate os parâmetros da API
-            params = {
-                "seller": self.user_id,
+            all_orders = self._fetch_orders({
                 "order.date_closed.from": start_utc4.isoformat(),
                 "order.date_closed.to": end_utc4.isoformat(),
                 #"order.status": "paid",
-                "limit": 50
-            }
+            })
 
-            all_orders = []
-            while True:
-                response = self._make_request(url, params)
-                logger.debug(f"Resposta da API: {response}")  # Log da resposta completa
-                results = response.get('results', [])
-                all_orders.extend(results)
+            df = self._normalize_orders(all_orders, self._get_shipment_dict(all_orders))
 
-                # Write the response results to a file
-                with open('api_response.txt', 'w', encoding='utf-8') as file:
-                    file.write(json.dumps(results, indent=2, ensure_ascii=False) + '\n')
+            datas = df['date'].dt.date
+            in_range = (datas >= start_date_brt.date()) & (datas <= end_date_brt.date())
+            for order_id, data in df.loc[~in_range, ['order_id', 'date']].drop_duplicates('order_id').itertuples(index=False):
+                logger.warning(f"Pedido {order_id} fora do intervalo de datas: {data.date()}")
 
-                if len(results) < params['limit']:
-                    break
-
-                params['offset'] = params.get('offset', 0) + params['limit']
-
-            logger.info(f"Total de pedidos recuperados: {len(all_orders)}")
-
-            sales_data = []
-            qtd_total = 0
-            fat_total = 0
-            
-            all_shipping_ids = [order['shipping']['id'] for order in all_orders if 'shipping' in order]
-            unique_shipping_ids = list(set(all_shipping_ids))  # Remove duplicatas
-
-            # Obtenha os detalhes de envio de forma assíncrona
-            shipment_details = asyncio.run(self.get_all_shipment_details(unique_shipping_ids))
-            shipment_dict = dict(zip(unique_shipping_ids, shipment_details))
+            df = df.loc[in_range, SALES_COLUMNS].reset_index(drop=True)
+            self._log_sales_totals(df)
+            return df
 
-            
-            for order in all_orders:
-                try:
-                    date_created_utc4 = datetime.fromisoformat(order['date_closed'])
-                    date_created_brt = date_created_utc4.astimezone(brt)
+        except Exception as e:
+            logger.error(f"Erro ao obter dados de vendas: {str(e)}", exc_info=True)
+            return pd.DataFrame()
 
-                    if start_date_brt.date() <= date_created_brt.date() <= end_date_brt.date():
-                        
+    def sync_orders(self, store: Optional[ArmazemPedidosML] = None, start_date: Optional[str] = None) -> int:
+        """
+        Sincroniza o armazém local de pedidos: busca só os pedidos alterados desde o último
+        marco, menos ML_SYNC_MARGEM_MINUTOS (order.date_last_updated.from), e regrava as
+        linhas deles. Na primeira execução busca desde start_date ("dd/mm/yyyy"; padrão:
+        ML_SYNC_DIAS_INICIAIS dias atrás).
 
-                        for item in order['order_items']:
-                            #sku = item['item'].get('seller_custom_field') or item['item']['id']
-                            sku = item['item']['seller_sku']
-                            qty = item['quantity']
-                            unit_price = item['unit_price']
-                            product_name = item['item'].get('title')
-
-                            # Extrair informações de pagamento
-                            payments = order.get('payments')
-                            order_id = payments[0]['order_id']
-                            payment_status = payments[0]['status']
-
-                            # Recupera valor efetivo pago pelo usuário
-                            paid_amount = order.get('paid_amount')
-
-                            # Recupera o valor do frete do comprador e a malha logística da venda
-                            shipping_id = order['shipping']['id']                            
-                            logistic_type, logistic_cost = shipment_dict.get(shipping_id, ("unknown", 0.0))
-                            #logistic_type, logistic_cost = shipment_details.get(shipping_id, ("unknown", 0.0))
-
-                            # verificar por que está lento
-                            #logistic_type, logistic_cost = self.get_shipment_details(shipping_id)
-
-                            #logistic_type = "full"
-                            #logistic_cost = 0
-
-                            order_status = order['status']
-
-                            # com frete comprador
-                            paid_amount_calculated = (unit_price * qty) + logistic_cost
-
-                            # sem frete comprador (default Mercado turbo)
-                            paid_amount_calculated_no_ship_cost = unit_price * qty
-
-                            sales_data.append({
-                                'order_id': order_id,
-                                'order_status': order_status,
-                                'payment_status': payment_status,
-                                'product_name': product_name,
-                                'date': date_created_brt,
-                                'sku': sku,
-                                'qty': qty,
-                                'unit_price': unit_price,
-                                'paid_amount_calculated': paid_amount_calculated,  
-                                'paid_amount_calculated_no_ship_cost': paid_amount_calculated_no_ship_cost,   #default mercado turbo - sem frete comprador                            
-                                'logistic_cost': logistic_cost,
-                                'logistic_type': logistic_type,
-                            })
-
-                            qtd_total += qty
-                            fat_total += paid_amount_calculated_no_ship_cost
-                            
-                    else:
-                        logger.warning(f"Pedido {order['id']} fora do intervalo de datas: {date_created_brt.date()}")
-                    
+        :return: Quantidade de pedidos sincronizados
+        """
+        store = store or armazem_pedidos
+        brt = pytz.timezone('America/Sao_Paulo')
+        sync_started = datetime.now(pytz.utc)
+
+        marco = store.estado().get("marco")
+        inicio = None
+        if marco is None:
+            if start_date:
+                inicio = datetime.strptime(start_date, "%d/%m/%Y").date()
+            else:
+                inicio = (datetime.now(brt) - timedelta(days=ML_SYNC_DIAS_INICIAIS)).date()
+            marco = brt.localize(datetime.combine(inicio, datetime.min.time())).isoformat()
+            desde = marco
+        else:
+            # Volta a margem: pedidos gravados na API com atraso em relação ao marco não se perdem
+            desde = pd.Timestamp(marco).tz_convert('UTC') - timedelta(minutes=ML_SYNC_MARGEM_MINUTOS)
+            desde = desde.strftime('%Y-%m-%dT%H:%M:%S.000+00:00')
+
+        # Ordem de criação crescente: pedidos criados durante a leitura entram no fim da
+        # lista, sem deslocar as páginas ainda não lidas
+        orders = self._fetch_orders({"order.date_last_updated.from": desde, "sort": "date_asc"})
+        df = self._normalize_orders(orders, self._get_shipment_dict(orders))
+
+        # Próximo marco: o maior date_last_updated recebido, mas não depois do início desta
+        # sincronização (menos uma margem para diferença de relógio), para que os pedidos
+        # alterados enquanto as páginas eram lidas sejam buscados de novo na próxima
+        limite = sync_started - timedelta(minutes=ML_SYNC_MARGEM_MINUTOS)
+        recebidos = pd.to_datetime([order.get('date_last_updated') for order in orders], utc=True)
+        novo_marco = min(recebidos.max(), limite) if len(recebidos) and pd.notna(recebidos.max()) else limite
+        novo_marco = max(pd.Timestamp(novo_marco), pd.Timestamp(marco).tz_convert('UTC'))
+
+        # Formato aceito pelos filtros de data da API (segundos truncados: no máximo repete pedidos)
+        meses = store.gravar(df, novo_marco.strftime('%Y-%m-%dT%H:%M:%S.000+00:00'), inicio)
+        logger.info(f"Sincronização de pedidos: {len(orders)} pedidos, {meses} meses regravados, marco {novo_marco}")
+        return len(orders)
+
+    def get_sales_data_local(self, start_date: str, end_date: str, sync: bool = True) -> pd.DataFrame:
+        """
+        Como get_sales_data, mas lido do armazém local de pedidos (armazem_pedidos), que
+        antes é sincronizado com os pedidos alterados. Períodos anteriores ao início do
+        armazém são buscados direto na API.
+        """
+        start = datetime.strptime(start_date, "%d/%m/%Y").date()
+        end = datetime.strptime(end_date, "%d/%m/%Y").date()
 
-                except KeyError as ke:
-                    logger.warning(f"Chave não encontrada ao processar pedido: {ke}")
-                    logger.debug(f"Detalhes do pedido: {order}")
+        if sync:
+            try:
+                self.sync_orders(start_date=start_date if armazem_pedidos.estado().get("marco") is None else None)
+            except Exception as e:
+                logger.error(f"Falha ao sincronizar pedidos, usando os dados locais: {str(e)}", exc_info=True)
 
-            logger.info(f"Total de registros de venda processados: {len(sales_data)}")            
-            logger.info(f"Quantidade total unidades vendidas: {qtd_total}")
-            logger.info(f"Faturamento Total: {fat_total}")
-            return pd.DataFrame(sales_data)
+        if not armazem_pedidos.cobre(start):
+            logger.info(f"Armazém de pedidos não cobre {start_date}, consultando a API")
+            return self.get_sales_data(start_date, end_date)
 
-        except Exception as e:
-            logger.error(f"Erro ao obter dados de vendas: {str(e)}", exc_info=True)
-            return pd.DataFrame()
-                  
+        df = armazem_pedidos.ler(start, end)
+        self._log_sales_totals(df)
+        return df
 
     def generate_general_report(self, start_date: str, end_date: str) -> str:
-        df = self.get_sales_data(start_date, end_date)
+        df = self.get_sales_data_local(start_date, end_date)
         if df.empty:
             return f"Nenhum dado de venda encontrado para o período de {start_date} a {end_date}."
         
@@ -482,7 +899,7 @@ class MercadoLivreAPI:
         return report
 
     def generate_modality_report(self, start_date: str, end_date: str) -> str:
-        df = self.get_sales_data(start_date, end_date)
+        df = self.get_sales_data_local(start_date, end_date)
         if df.empty:
             return f"Nenhum dado de venda encontrado para o período de {start_date} a {end_date}."
                         
@@ -494,7 +911,7 @@ class MercadoLivreAPI:
         return report 
     
     def generate_modality_report_excel(self, start_date: str, end_date: str) -> str:
-        df = self.get_sales_data(start_date, end_date)
+        df = self.get_sales_data_local(start_date, end_date)
         if df.empty:
             return f"Nenhum dado de venda encontrado para o período de {start_date} a {end_date}."
         
@@ -0,0 +1,128 @@
+import glob
+import json
+import os
+import threading
+from datetime import date
+from typing import Dict, List, Optional
+
+import pandas as pd
+
+# Colunas das linhas de venda, na ordem de MercadoLivreAPI.get_sales_data
+SALES_COLUMNS = [
+    'order_id', 'order_status', 'payment_status', 'product_name', 'date', 'sku', 'qty',
+    'unit_price', 'paid_amount_calculated', 'paid_amount_calculated_no_ship_cost',
+    'logistic_cost', 'logistic_type',
+]
+
+# Colunas gravadas no armazém: as de venda mais a data da última alteração do pedido
+STORE_COLUMNS = SALES_COLUMNS + ['date_last_updated']
+
+
+class ArmazemPedidosML:
+    """
+    Armazém local das linhas de pedidos do Mercado Livre (uma por item vendido), em Parquet
+    particionado pelo mês de fechamento: <diretorio>/ano_mes=AAAA-MM/pedidos.parquet.
+
+    O arquivo estado.json guarda o marco da sincronização (maior date_last_updated já
+    gravado) e o início da cobertura; cada sincronização busca só os pedidos alterados
+    depois do marco e substitui, por order_id, as linhas que já existiam.
+    """
+
+    def __init__(self, diretorio: str):
+        self.diretorio = diretorio
+        self._lock = threading.Lock()
+
+    def _caminho_estado(self) -> str:
+        return os.path.join(self.diretorio, "estado.json")
+
+    def _caminho_mes(self, ano_mes: str) -> str:
+        return os.path.join(self.diretorio, f"ano_mes={ano_mes}", "pedidos.parquet")
+
+    def _meses_gravados(self) -> List[str]:
+        """Meses (AAAA-MM) que já têm arquivo no armazém."""
+        caminhos = glob.glob(os.path.join(glob.escape(self.diretorio), "ano_mes=*", "pedidos.parquet"))
+        return sorted(os.path.basename(os.path.dirname(caminho)).split("=", 1)[1] for caminho in caminhos)
+
+    def estado(self) -> Dict[str, Optional[str]]:
+        """Marco ('marco', ISO 8601) e início da cobertura ('inicio', AAAA-MM-DD); None se nunca sincronizado."""
+        try:
+            with open(self._caminho_estado(), encoding="utf-8") as arquivo:
+                return json.load(arquivo)
+        except FileNotFoundError:
+            return {"marco": None, "inicio": None}
+
+    def cobre(self, inicio: date) -> bool:
+        """Indica se o armazém já foi sincronizado a partir de uma data igual ou anterior a 'inicio'."""
+        cobertura = self.estado().get("inicio")
+        return cobertura is not None and date.fromisoformat(cobertura) <= inicio
+
+    def gravar(self, linhas: pd.DataFrame, marco: str, inicio: Optional[date] = None) -> int:
+        """
+        Grava as linhas dos pedidos sincronizados, substituindo as linhas anteriores dos
+        mesmos pedidos em qualquer mês (a data de fechamento de um pedido pode mudar), e só
+        então avança o marco. Retorna quantos meses foram regravados.
+
+        Args:
+            linhas: Linhas normalizadas (colunas STORE_COLUMNS, 'date' com fuso).
+            marco: Novo marco da sincronização (date_last_updated, ISO 8601).
+            inicio: Início da cobertura, informado na primeira sincronização.
+        """
+        with self._lock:
+            meses = linhas['date'].dt.strftime('%Y-%m') if not linhas.empty else pd.Series(dtype=str)
+            por_mes = {ano_mes: novas[STORE_COLUMNS] for ano_mes, novas in linhas.groupby(meses)}
+
+            # Meses sem linhas novas que ainda guardam algum dos pedidos recebidos perdem essas linhas
+            pedidos = linhas['order_id']
+            for ano_mes in self._meses_gravados():
+                if ano_mes not in por_mes and \
+                        pd.read_parquet(self._caminho_mes(ano_mes), columns=['order_id'])['order_id'].isin(pedidos).any():
+                    por_mes[ano_mes] = linhas.iloc[0:0][STORE_COLUMNS]
+
+            for ano_mes, novas in por_mes.items():
+                caminho = self._caminho_mes(ano_mes)
+                if os.path.exists(caminho):
+                    existentes = pd.read_parquet(caminho)
+                    existentes = existentes[~existentes['order_id'].isin(pedidos)]
+                    novas = pd.concat([existentes, novas], ignore_index=True) if not novas.empty else existentes
+                if novas.empty:
+                    os.remove(caminho)
+                    continue
+                self._escrever_atomico(
+                    caminho, lambda temporario: novas[STORE_COLUMNS].sort_values('date').to_parquet(temporario, index=False)
+                )
+
+            estado = self.estado()
+            estado["marco"] = marco
+            if inicio is not None and (estado.get("inicio") is None or inicio.isoformat() < estado["inicio"]):
+                estado["inicio"] = inicio.isoformat()
+
+            def salvar_estado(temporario):
+                with open(temporario, "w", encoding="utf-8") as arquivo:
+                    json.dump(estado, arquivo)
+            self._escrever_atomico(self._caminho_estado(), salvar_estado)
+            return len(por_mes)
+
+    def _escrever_atomico(self, caminho: str, escrever) -> None:
+        """Escreve em um arquivo temporário e o renomeia, para um leitor nunca ver um arquivo pela metade."""
+        os.makedirs(os.path.dirname(caminho), exist_ok=True)
+        temporario = f"{caminho}.tmp"
+        escrever(temporario)
+        os.replace(temporario, caminho)
+
+    def ler(self, inicio: date, fim: date) -> pd.DataFrame:
+        """Linhas de venda (colunas SALES_COLUMNS) com data de fechamento entre inicio e fim, inclusive."""
+        arquivos: List[str] = []
+        for periodo in pd.period_range(inicio, fim, freq='M'):
+            caminho = self._caminho_mes(periodo.strftime('%Y-%m'))
+            if os.path.exists(caminho):
+                arquivos.append(caminho)
+        if not arquivos:
+            return pd.DataFrame(columns=SALES_COLUMNS)
+
+        df = pd.concat([pd.read_parquet(caminho, columns=SALES_COLUMNS) for caminho in arquivos], ignore_index=True)
+        datas = df['date'].dt.date
+        return df[(datas >= inicio) & (datas <= fim)].reset_index(drop=True)
+
+
+# Instância compartilhada pelo processo (diretório configurável via ML_ORDER_STORE)
+armazem_pedidos = ArmazemPedidosML(os.getenv("ML_ORDER_STORE", "dados_pedidos_ml"))
@@ -0,0 +1,54 @@
+"""
+Coleta das fontes da visão integrada (Mercado Livre, Amazon, estoque próprio) em paralelo,
+cada uma com o seu tempo máximo. Fica fora de main.py, que é o script do Streamlit.
+"""
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FuturesTimeoutError
+
+
+def _executar_cronometrado(funcao):
+    """Executa a coleta de uma fonte e devolve (resultado, erro, segundos)"""
+    inicio = time.perf_counter()
+    try:
+        return funcao(), None, time.perf_counter() - inicio
+    except Exception as e:
+        logging.error(f"Erro na coleta: {str(e)}", exc_info=True)
+        return None, e, time.perf_counter() - inicio
+
+
+def coletar_fontes_em_paralelo(fontes):
+    """
+    Executa as coletas ao mesmo tempo, cada uma com o seu tempo máximo.
+
+    Args:
+        fontes (dict): Nome da fonte -> (função sem argumentos, timeout em segundos).
+
+    Returns:
+        tuple: DataFrames das fontes que responderam a tempo ({nome: df}) e a situação
+        de cada fonte ({nome: {'status': 'ok' | 'erro' | 'timeout', 'segundos', 'mensagem'}}).
+    """
+    resultados, situacao = {}, {}
+    executor = ThreadPoolExecutor(max_workers=len(fontes), thread_name_prefix="coleta")
+    inicio = time.perf_counter()
+    futuros = {nome: executor.submit(_executar_cronometrado, funcao) for nome, (funcao, _) in fontes.items()}
+
+    for nome, (_, timeout) in fontes.items():
+        # Os tempos máximos contam a partir do início comum, não do fim da fonte anterior
+        restante = max(0.0, timeout - (time.perf_counter() - inicio))
+        try:
+            df, erro, segundos = futuros[nome].result(timeout=restante)
+        except FuturesTimeoutError:
+            situacao[nome] = {'status': 'timeout', 'segundos': float(timeout),
+                              'mensagem': f"sem resposta em {timeout} s"}
+            continue
+
+        if erro is not None:
+            situacao[nome] = {'status': 'erro', 'segundos': segundos, 'mensagem': str(erro)}
+        else:
+            resultados[nome] = df
+            situacao[nome] = {'status': 'ok', 'segundos': segundos, 'mensagem': ''}
+
+    # Não espera as fontes que estouraram o tempo: terminam em segundo plano e são descartadas
+    executor.shutdown(wait=False, cancel_futures=True)
+    return resultados, situacao
@@ -0,0 +1,248 @@
+"""
+Busca de produtos e depósitos por nome/SKU, com ranking e limite de resultados.
+
+No PostgreSQL a busca usa a coluna tsvector "busca" (gerada a partir do SKU e do nome,
+migração 3 de create_schema.py) com índice GIN, e um índice de prefixo em lower(sku).
+Cada palavra digitada é tratada como prefixo ("kit 2" encontra "Kit 24 peças").
+
+Em outros bancos (SQLite nos testes) a mesma semântica de prefixo é atendida por um
+índice em memória, montado na primeira busca e descartado a cada alteração de cadastro.
+
+Quando nenhuma palavra casa como prefixo, ou o termo não tem palavras (só pontuação,
+como "-"), a busca recorre ao trecho em qualquer posição (ILIKE '%termo%', sem índice),
+como a listagem filtrada fazia antes: "123" ainda encontra "ABC123".
+"""
+import bisect
+import logging
+import re
+import threading
+from typing import Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+from sqlalchemy import case, func, literal_column, or_
+from sqlmodel import Session, select
+
+from src.db.database import get_session
+from .models import Deposito, Produto
+
+# Quantidade padrão de resultados de buscar_produtos/buscar_depositos (as listagens de
+# crud_produtos/crud_depositos não limitam, a menos que o chamador informe o limite)
+LIMITE_BUSCA = 50
+
+
+def _palavras(texto: Optional[str]) -> List[str]:
+    """Quebra o texto em palavras minúsculas, como o parser 'simple' do PostgreSQL."""
+    return re.findall(r"\w+", (texto or "").lower())
+
+
+def _tsquery_prefixos(termo: str) -> str:
+    """Monta a tsquery em que todas as palavras do termo devem aparecer como prefixo."""
+    return " & ".join(f"{palavra}:*" for palavra in _palavras(termo))
+
+
+class IndicePrefixos:
+    """
+    Índice invertido em memória: lista ordenada de (palavra, chave) consultada por bisect.
+    Cada palavra do termo buscado precisa ser prefixo de alguma palavra do item.
+    """
+
+    def __init__(self, carregar: Callable[[], Iterable[Tuple[str, Sequence[str]]]]):
+        # carregar retorna (chave, textos); o primeiro texto é o principal (SKU ou nome)
+        self._carregar = carregar
+        self._entradas: Optional[List[Tuple[str, str]]] = None
+        self._textos: Dict[str, Sequence[str]] = {}
+        self._lock = threading.Lock()
+
+    def invalidar(self) -> None:
+        """Descarta o índice; ele é remontado na próxima busca."""
+        with self._lock:
+            self._entradas = None
+
+    def _montar(self) -> List[Tuple[str, str]]:
+        with self._lock:
+            if self._entradas is None:
+                textos = {chave: campos for chave, campos in self._carregar()}
+                entradas = {
+                    (palavra, chave)
+                    for chave, campos in textos.items()
+                    for campo in campos
+                    for palavra in _palavras(campo)
+                }
+                self._textos = textos
+                self._entradas = sorted(entradas)
+            return self._entradas
+
+    def _chaves_com_prefixo(self, entradas: List[Tuple[str, str]], prefixo: str) -> set:
+        chaves = set()
+        for indice in range(bisect.bisect_left(entradas, (prefixo, "")), len(entradas)):
+            palavra, chave = entradas[indice]
+            if not palavra.startswith(prefixo):
+                break
+            chaves.add(chave)
+        return chaves
+
+    def buscar(self, termo: str, limite: Optional[int] = LIMITE_BUSCA) -> List[str]:
+        """Retorna as chaves encontradas, das mais relevantes para as menos relevantes."""
+        palavras = _palavras(termo)
+        if not palavras:
+            return []
+
+        entradas = self._montar()
+        encontrados = None
+        for palavra in palavras:
+            chaves = self._chaves_com_prefixo(entradas, palavra)
+            encontrados = chaves if encontrados is None else encontrados & chaves
+            if not encontrados:
+                return []
+
+        termo_normalizado = termo.strip().lower()
+
+        def relevancia(chave: str):
+            principal = self._textos[chave][0].lower()
+            return (
+                principal != termo_normalizado,
+                not principal.startswith(termo_normalizado),
+                len(" ".join(self._textos[chave])),
+                chave,
+            )
+
+        return sorted(encontrados, key=relevancia)[:limite]
+
+
+def _carregar_produtos() -> List[Tuple[str, Sequence[str]]]:
+    with get_session() as session:
+        return [(sku, (sku, nome)) for sku, nome in session.exec(select(Produto.sku, Produto.nome)).all()]
+
+
+def _carregar_depositos() -> List[Tuple[str, Sequence[str]]]:
+    with get_session() as session:
+        return [(str(id_), (nome,)) for id_, nome in session.exec(select(Deposito.id, Deposito.nome)).all()]
+
+
+# Índices em memória usados quando o banco não é PostgreSQL (invalidados pelos CRUDs)
+indice_produtos = IndicePrefixos(_carregar_produtos)
+indice_depositos = IndicePrefixos(_carregar_depositos)
+
+
+def _stmt_buscar_produtos(termo: str, limite: Optional[int] = LIMITE_BUSCA):
+    """
+    Busca de produtos no PostgreSQL: palavras como prefixo no SKU/nome (índice GIN em
+    produto.busca) ou o termo inteiro como prefixo do SKU (índice em lower(sku)).
+    Ordena por SKU exato, prefixo do SKU e então pelo ts_rank.
+    """
+    tsquery = func.to_tsquery("simple", _tsquery_prefixos(termo))
+    busca = literal_column("produto.busca")
+    termo_sku = termo.strip().lower()
+
+    query = (
+        select(Produto)
+        .where(or_(
+            busca.op("@@")(tsquery),
+            func.lower(Produto.sku).startswith(termo_sku, autoescape=True)
+        ))
+        .order_by(
+            case((func.lower(Produto.sku) == termo_sku, 0), else_=1),
+            case((func.lower(Produto.sku).startswith(termo_sku, autoescape=True), 0), else_=1),
+            func.ts_rank(busca, tsquery).desc(),
+            Produto.sku
+        )
+    )
+    return query.limit(limite) if limite else query
+
+
+def _stmt_buscar_depositos(termo: str, limite: Optional[int] = LIMITE_BUSCA):
+    """Busca de depósitos no PostgreSQL pelas palavras do nome (índice GIN em deposito.busca)."""
+    tsquery = func.to_tsquery("simple", _tsquery_prefixos(termo))
+    busca = literal_column("deposito.busca")
+    query = (
+        select(Deposito)
+        .where(busca.op("@@")(tsquery))
+        .order_by(func.ts_rank(busca, tsquery).desc(), Deposito.nome)
+    )
+    return query.limit(limite) if limite else query
+
+
+def _stmt_produtos_com_trecho(termo: str, limite: Optional[int] = LIMITE_BUSCA):
+    """Produtos com o termo em qualquer posição do SKU ou do nome (recurso quando o prefixo não encontra nada)."""
+    termo = termo.strip()
+    query = (
+        select(Produto)
+        .where(or_(
+            Produto.sku.icontains(termo, autoescape=True),
+            Produto.nome.icontains(termo, autoescape=True)
+        ))
+        .order_by(Produto.sku)
+    )
+    return query.limit(limite) if limite else query
+
+
+def _stmt_depositos_com_trecho(termo: str, limite: Optional[int] = LIMITE_BUSCA):
+    """Depósitos com o termo em qualquer posição do nome (recurso quando o prefixo não encontra nada)."""
+    query = select(Deposito).where(Deposito.nome.icontains(termo.strip(), autoescape=True)).order_by(Deposito.nome)
+    return query.limit(limite) if limite else query
+
+
+def _em_ordem(registros: list, chaves: List[str], chave: Callable) -> list:
+    """Reordena os registros conforme a lista de chaves ranqueada."""
+    posicao = {valor: indice for indice, valor in enumerate(chaves)}
+    return sorted(registros, key=lambda registro: posicao[chave(registro)])
+
+
+def _eh_postgres(session: Session) -> bool:
+    return session.get_bind().dialect.name == "postgresql"
+
+
+def buscar_produtos(termo: str, limite: Optional[int] = LIMITE_BUSCA) -> List[Produto]:
+    """
+    Busca produtos pelo SKU ou por palavras do nome, dos mais relevantes para os menos.
+    Se nenhum produto casar por prefixo, retorna os que contêm o termo em qualquer posição.
+
+    Args:
+        termo: Texto digitado; cada palavra é tratada como prefixo.
+        limite: Quantidade máxima de resultados (None para todos).
+    """
+    if not (termo and termo.strip()):
+        return []
+
+    with get_session() as session:
+        try:
+            if not _palavras(termo):
+                produtos = []  # Só pontuação (ex.: "-"): não há prefixo a buscar, só o trecho
+            elif _eh_postgres(session):
+                produtos = session.exec(_stmt_buscar_produtos(termo, limite)).all()
+            else:
+                skus = indice_produtos.buscar(termo, limite)
+                produtos = _em_ordem(
+                    session.exec(select(Produto).where(Produto.sku.in_(skus))).all(), skus, lambda produto: produto.sku
+                )
+            return produtos or session.exec(_stmt_produtos_com_trecho(termo, limite)).all()
+
+        except Exception as e:
+            logging.error(f"Erro ao buscar produtos: {str(e)}", exc_info=True)
+            raise
+
+
+def buscar_depositos(termo: str, limite: Optional[int] = LIMITE_BUSCA) -> List[Deposito]:
+    """
+    Busca depósitos por palavras do nome, dos mais relevantes para os menos. Se nenhum
+    depósito casar por prefixo, retorna os que contêm o termo em qualquer posição.
+    """
+    if not (termo and termo.strip()):
+        return []
+
+    with get_session() as session:
+        try:
+            if not _palavras(termo):
+                depositos = []  # Só pontuação (ex.: "-"): não há prefixo a buscar, só o trecho
+            elif _eh_postgres(session):
+                depositos = session.exec(_stmt_buscar_depositos(termo, limite)).all()
+            else:
+                ids = indice_depositos.buscar(termo, limite)
+                depositos = _em_ordem(
+                    session.exec(select(Deposito).where(Deposito.id.in_([int(i) for i in ids]))).all(),
+                    ids, lambda deposito: str(deposito.id)
+                )
+            return depositos or session.exec(_stmt_depositos_com_trecho(termo, limite)).all()
+
+        except Exception as e:
+            logging.error(f"Erro ao buscar depósitos: {str(e)}", exc_info=True)
+            raise
@@ -0,0 +1,92 @@
+import os
+import threading
+import time
+from typing import Awaitable, Callable, Dict, Optional, Tuple
+
+
+class CacheEstoque:
+    """
+    Cache do estoque atual por depósito, com TTL e invalidação explícita.
+
+    As funções de escrita de crud_estoque invalidam apenas os depósitos afetados,
+    então uma movimentação no depósito A não descarta o estoque em cache do depósito B.
+    """
+
+    def __init__(self, ttl_segundos: float = 300):
+        self.ttl_segundos = ttl_segundos
+        self._dados: Dict[int, Tuple[float, Dict[str, int]]] = {}
+        self._geracoes: Dict[int, int] = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.invalidacoes = 0
+
+    def obter(self, deposito_id: int, carregar: Callable[[], Dict[str, int]]) -> Dict[str, int]:
+        """
+        Retorna o estoque em cache do depósito ou o carrega com a função informada.
+        Se o depósito for invalidado enquanto a carga está em andamento, o resultado
+        não é armazenado (poderia já estar desatualizado).
+        """
+        dados, geracao = self._buscar(deposito_id)
+        if dados is not None:
+            return dados
+        return self._armazenar(deposito_id, geracao, carregar())
+
+    async def obter_async(self, deposito_id: int, carregar: Callable[[], Awaitable[Dict[str, int]]]) -> Dict[str, int]:
+        """Versão de obter para carregadores assíncronos (ver crud_async)."""
+        dados, geracao = self._buscar(deposito_id)
+        if dados is not None:
+            return dados
+        return self._armazenar(deposito_id, geracao, await carregar())
+
+    def _buscar(self, deposito_id: int) -> Tuple[Optional[Dict[str, int]], int]:
+        """Retorna (cópia dos dados em cache ou None, geração atual do depósito)."""
+        with self._lock:
+            entrada = self._dados.get(deposito_id)
+            if entrada is not None and time.monotonic() - entrada[0] < self.ttl_segundos:
+                self.hits += 1
+                return dict(entrada[1]), self._geracoes[deposito_id]
+            self.misses += 1
+            return None, self._geracoes.setdefault(deposito_id, 0)
+
+    def _armazenar(self, deposito_id: int, geracao: int, dados: Dict[str, int]) -> Dict[str, int]:
+        """Guarda os dados carregados, desde que o depósito não tenha sido invalidado durante a carga."""
+        with self._lock:
+            if self._geracoes.get(deposito_id, 0) == geracao:
+                self._dados[deposito_id] = (time.monotonic(), dados)
+        return dict(dados)
+
+    def invalidar(self, *deposito_ids: int) -> None:
+        """Descarta o estoque em cache dos depósitos informados."""
+        with self._lock:
+            for deposito_id in deposito_ids:
+                self._descartar(deposito_id)
+            self.invalidacoes += 1
+
+    def limpar(self) -> None:
+        """Descarta o estoque em cache de todos os depósitos."""
+        with self._lock:
+            for deposito_id in list(self._geracoes):
+                self._descartar(deposito_id)
+            self.invalidacoes += 1
+
+    def _descartar(self, deposito_id: int) -> None:
+        """Remove a entrada e avança a geração do depósito (chamar com o lock adquirido)."""
+        self._dados.pop(deposito_id, None)
+        self._geracoes[deposito_id] = self._geracoes.get(deposito_id, 0) + 1
+
+    def estatisticas(self) -> Dict[str, Optional[float]]:
+        """Retorna os contadores de acertos, faltas e invalidações do cache."""
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "invalidacoes": self.invalidacoes,
+                "depositos_em_cache": len(self._dados),
+                "taxa_acerto": self.hits / total if total else None,
+            }
+
+
+# Instância compartilhada pelo processo (TTL configurável via CACHE_ESTOQUE_TTL, em segundos)
+cache_estoque = CacheEstoque(ttl_segundos=float(os.getenv("CACHE_ESTOQUE_TTL", "300")))
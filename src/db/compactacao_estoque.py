@@ -0,0 +1,143 @@
+"""
+Compactação do ledger de estoque: move as movimentações antigas para estoque_arquivo.
+
+O saldo de um par é calculado a partir do último Balanço; um par que nunca teve
+contagem física precisa somar todo o seu histórico. A compactação move para
+estoque_arquivo as movimentações com data_hora <= limite (hoje menos o horizonte) e
+insere em estoque, para cada par, um Balanço sintético no limite com o saldo daquele
+instante. Os saldos atuais não mudam, a tabela estoque fica pequena e o histórico
+completo continua consultável (incluir_arquivo nas consultas de histórico; consultar_saldo_em
+usa o arquivo para datas anteriores ao limite).
+
+Execute periodicamente (por exemplo, mensalmente via cron):
+    python -m src.db.compactacao_estoque [--horizonte-dias 365] [--ate 2025-01-01]
+"""
+import argparse
+import logging
+import os
+from datetime import datetime, time, timedelta
+from typing import Dict, Optional
+from zoneinfo import ZoneInfo
+
+from sqlalchemy import delete, func, insert, literal, text
+from sqlmodel import Session, select
+
+from src.db.crud_estoque import _calcular_saldos
+from src.db.database import get_session
+from .models import Estoque, EstoqueArquivo, TipoEstoque
+
+# Movimentações mais antigas que o horizonte (em dias) são arquivadas
+HORIZONTE_PADRAO_DIAS = int(os.getenv("ESTOQUE_HORIZONTE_DIAS", "365"))
+
+_COLUNAS_ARQUIVO = ["id", "sku", "deposito_id", "quantidade", "tipo", "data_hora", "observacoes", "saldo"]
+
+
+def limite_compactacao(session: Session) -> Optional[datetime]:
+    """
+    Limite da última compactação (ou None se nunca houve): movimentações com data_hora
+    anterior a ele só existem em estoque_arquivo.
+    """
+    return session.exec(select(func.max(EstoqueArquivo.compactado_ate))).one()
+
+
+def data_compactada(session: Session, data: datetime) -> bool:
+    """
+    Indica se a data é anterior ao limite da última compactação, ou seja, se as
+    movimentações até ela estão todas em estoque_arquivo. A comparação é feita no banco,
+    como os demais filtros por data_hora.
+    """
+    return bool(session.exec(select(func.max(EstoqueArquivo.compactado_ate) > data)).one())
+
+
+def compactar_estoque(
+    horizonte_dias: int = HORIZONTE_PADRAO_DIAS,
+    ate: Optional[datetime] = None
+) -> Dict[str, int]:
+    """
+    Arquiva as movimentações até o limite e as substitui por um Balanço sintético por par.
+
+    Args:
+        horizonte_dias: Idade mínima, em dias, das movimentações arquivadas. O limite é a
+            meia-noite de hoje (horário de São Paulo) menos o horizonte.
+        ate: Limite explícito; se informado, horizonte_dias é ignorado.
+
+    Returns:
+        Dicionário com as contagens 'arquivadas' (movimentações movidas) e 'pares'
+        (pares que receberam o Balanço sintético).
+
+    Raises:
+        ValueError: Se o horizonte for negativo ou se o limite não for posterior ao da
+            última compactação.
+    """
+    if ate is None:
+        if horizonte_dias < 0:
+            raise ValueError("O horizonte deve ser zero ou positivo")
+        hoje = datetime.now(ZoneInfo("America/Sao_Paulo")).date()
+        ate = datetime.combine(hoje, time.min) - timedelta(days=horizonte_dias)
+
+    with get_session() as session:
+        try:
+            if session.get_bind().dialect.name == "postgresql":
+                # Impede novas movimentações (as leituras continuam) enquanto o ledger é reescrito
+                session.execute(text("LOCK TABLE estoque IN SHARE ROW EXCLUSIVE MODE"))
+
+            if session.exec(select(func.max(EstoqueArquivo.compactado_ate) >= ate)).one():
+                raise ValueError(f"O estoque já foi compactado até {limite_compactacao(session)}")
+
+            saldos = _calcular_saldos(session, ate=ate)
+
+            antigas = Estoque.data_hora <= ate
+            arquivadas = session.execute(
+                insert(EstoqueArquivo).from_select(
+                    _COLUNAS_ARQUIVO + ["compactado_ate"],
+                    select(
+                        *(getattr(Estoque, coluna) for coluna in _COLUNAS_ARQUIVO),
+                        literal(ate, EstoqueArquivo.__table__.c.compactado_ate.type)
+                    ).where(antigas)
+                )
+            ).rowcount
+            session.execute(delete(Estoque).where(antigas).execution_options(synchronize_session=False))
+
+            # Balanço sintético no limite: vem depois de tudo o que foi arquivado e antes do
+            # que ficou em estoque, então o saldo de qualquer instante >= limite não muda
+            observacoes = f"Compactação: saldo em {ate:%d/%m/%Y %H:%M}"
+            sinteticas = []
+            for (sku, deposito_id), saldo in sorted(saldos.items()):
+                par = {"sku": sku, "deposito_id": deposito_id, "data_hora": ate, "observacoes": observacoes}
+                if saldo >= 0:
+                    sinteticas.append({**par, "quantidade": saldo, "tipo": TipoEstoque.BALANCO.value, "saldo": saldo})
+                else:
+                    # Balanço não aceita quantidade negativa: zera o par e registra a falta como saída
+                    sinteticas.append({**par, "quantidade": 0, "tipo": TipoEstoque.BALANCO.value, "saldo": 0})
+                    sinteticas.append({**par, "quantidade": -saldo, "tipo": TipoEstoque.SAIDA.value, "saldo": saldo})
+            if sinteticas:
+                session.execute(insert(Estoque), sinteticas)
+            session.commit()
+
+            resultado = {"arquivadas": arquivadas, "pares": len(saldos)}
+            logging.debug(f"Estoque compactado até {ate}: {resultado}")
+            return resultado
+
+        except Exception as e:
+            logging.error(f"Erro ao compactar o estoque: {str(e)}", exc_info=True)
+            session.rollback()
+            raise
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.DEBUG)  # só na linha de comando: importar o módulo não reconfigura o logging
+    parser = argparse.ArgumentParser(description="Arquiva as movimentações antigas do estoque.")
+    parser.add_argument(
+        "--horizonte-dias",
+        type=int,
+        default=HORIZONTE_PADRAO_DIAS,
+        help="idade mínima, em dias, das movimentações arquivadas"
+    )
+    parser.add_argument(
+        "--ate",
+        type=datetime.fromisoformat,
+        help="limite explícito (ISO 8601); substitui o horizonte"
+    )
+    args = parser.parse_args()
+    resultado = compactar_estoque(args.horizonte_dias, args.ate)
+    print(f"✅ {resultado['arquivadas']} movimentações arquivadas, {resultado['pares']} balanços gerados")
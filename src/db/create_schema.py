@@ -1,4 +1,5 @@
 import os
+import re
 import psycopg2
 from psycopg2 import sql
 from dotenv import load_dotenv
@@ -40,6 +41,35 @@ CREATE TABLE IF NOT EXISTS estoque (
     observacoes VARCHAR(200),
     saldo INTEGER NOT NULL DEFAULT 0
 );
+CREATE TABLE IF NOT EXISTS saldo_estoque (
+    sku VARCHAR(50) REFERENCES produto(sku) ON DELETE CASCADE,
+    deposito_id INTEGER REFERENCES deposito(id) ON DELETE CASCADE,
+    saldo INTEGER NOT NULL DEFAULT 0,
+    atualizado_em TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (sku, deposito_id)
+);
+CREATE TABLE IF NOT EXISTS saldo_snapshot (
+    sku VARCHAR(50) REFERENCES produto(sku) ON DELETE CASCADE,
+    deposito_id INTEGER REFERENCES deposito(id) ON DELETE CASCADE,
+    data_referencia TIMESTAMP WITH TIME ZONE NOT NULL,
+    saldo INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (sku, deposito_id, data_referencia)
+);
+CREATE INDEX IF NOT EXISTS ix_saldo_snapshot_data_referencia ON saldo_snapshot (data_referencia);
+CREATE TABLE IF NOT EXISTS estoque_arquivo (
+    id INTEGER PRIMARY KEY,
+    sku VARCHAR(50) REFERENCES produto(sku) ON DELETE CASCADE,
+    deposito_id INTEGER REFERENCES deposito(id) ON DELETE CASCADE,
+    quantidade INTEGER NOT NULL,
+    tipo VARCHAR(50) NOT NULL,
+    data_hora TIMESTAMP WITH TIME ZONE,
+    observacoes VARCHAR(200),
+    saldo INTEGER NOT NULL DEFAULT 0,
+    compactado_ate TIMESTAMP WITH TIME ZONE NOT NULL
+);
+CREATE INDEX IF NOT EXISTS ix_estoque_arquivo_sku_deposito_data_hora
+    ON estoque_arquivo (sku, deposito_id, data_hora DESC, id DESC);
+CREATE INDEX IF NOT EXISTS ix_estoque_arquivo_data_hora ON estoque_arquivo (data_hora DESC, id DESC);
 
 -- Criação da função current_time_sao_paulo
 CREATE OR REPLACE FUNCTION current_time_sao_paulo()
@@ -53,8 +83,322 @@ $$ LANGUAGE plpgsql;
 ALTER TABLE estoque
 ALTER COLUMN data_hora SET DEFAULT current_time_sao_paulo();
 
+-- Controle das migrações já aplicadas
+CREATE TABLE IF NOT EXISTS schema_migrations (
+    versao INTEGER PRIMARY KEY,
+    descricao VARCHAR(200) NOT NULL,
+    aplicada_em TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP
+);
+
 """
 
+# Migrações incrementais, aplicadas em ordem e uma única vez (registradas em schema_migrations).
+# "transacional": False é obrigatório para CREATE INDEX CONCURRENTLY, que não roda dentro de
+# transação e não bloqueia as escritas no estoque enquanto o índice é construído.
+MIGRATIONS = [
+    {
+        "versao": 1,
+        "descricao": "Carga inicial de saldo_estoque a partir do histórico",
+        "transacional": True,
+        "sql": [
+            """
+            -- Carga inicial do saldo materializado a partir do histórico
+            -- (último balanço de cada par + entradas e saídas a partir dele)
+            WITH ultimo_balanco AS (
+                SELECT DISTINCT ON (sku, deposito_id) sku, deposito_id, quantidade, data_hora, id
+                FROM estoque
+                WHERE tipo = 'Balanço'
+                ORDER BY sku, deposito_id, data_hora DESC, id DESC
+            )
+            INSERT INTO saldo_estoque (sku, deposito_id, saldo)
+            SELECT
+                e.sku,
+                e.deposito_id,
+                COALESCE(b.quantidade, 0) + SUM(
+                    CASE e.tipo
+                        WHEN 'Entrada' THEN e.quantidade
+                        WHEN 'Saída' THEN -e.quantidade
+                        ELSE 0
+                    END
+                )
+            FROM estoque e
+            LEFT JOIN ultimo_balanco b ON b.sku = e.sku AND b.deposito_id = e.deposito_id
+            WHERE b.data_hora IS NULL OR (e.data_hora, e.id) >= (b.data_hora, b.id)
+            GROUP BY e.sku, e.deposito_id, b.quantidade
+            ON CONFLICT (sku, deposito_id) DO NOTHING;
+            """,
+        ],
+    },
+    {
+        "versao": 2,
+        "descricao": "Índices compostos para as consultas do ledger de estoque",
+        "transacional": False,
+        "sql": [
+            # Saldo, estoque atual e histórico por par: busca por prefixo (sku, deposito_id)
+            # já na ordem data_hora DESC, id DESC; INCLUDE permite index-only scan no saldo
+            """
+            CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_estoque_sku_deposito_data_hora
+            ON estoque (sku, deposito_id, data_hora DESC, id DESC)
+            INCLUDE (tipo, quantidade, saldo)
+            """,
+            # Último balanço de cada par
+            """
+            CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_estoque_balanco
+            ON estoque (sku, deposito_id, data_hora DESC, id DESC)
+            INCLUDE (quantidade)
+            WHERE tipo = 'Balanço'
+            """,
+            # Estoque de um depósito inteiro e histórico filtrado só por depósito
+            """
+            CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_estoque_deposito_data_hora
+            ON estoque (deposito_id, data_hora DESC, id DESC)
+            """,
+            # Histórico sem filtro de produto/depósito, ordenado por data
+            """
+            CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_estoque_data_hora
+            ON estoque (data_hora DESC, id DESC)
+            """,
+            "ANALYZE estoque",
+        ],
+    },
+    {
+        "versao": 3,
+        "descricao": "Busca de produtos e depósitos por tsvector e prefixo de SKU",
+        "transacional": False,
+        "sql": [
+            # Palavras do SKU (peso A) e do nome (peso B), sem stemming: a busca é por prefixo
+            """
+            ALTER TABLE produto ADD COLUMN IF NOT EXISTS busca tsvector
+            GENERATED ALWAYS AS (
+                setweight(to_tsvector('simple', coalesce(sku, '')), 'A') ||
+                setweight(to_tsvector('simple', coalesce(nome, '')), 'B')
+            ) STORED
+            """,
+            "CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_produto_busca ON produto USING gin (busca)",
+            # SKU digitado por inteiro ou pelo início (ex.: "ABC-12"), com qualquer collation
+            """
+            CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_produto_sku_prefixo
+            ON produto (lower(sku) varchar_pattern_ops)
+            """,
+            """
+            ALTER TABLE deposito ADD COLUMN IF NOT EXISTS busca tsvector
+            GENERATED ALWAYS AS (to_tsvector('simple', coalesce(nome, ''))) STORED
+            """,
+            "CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_deposito_busca ON deposito USING gin (busca)",
+            "ANALYZE produto",
+            "ANALYZE deposito",
+        ],
+    },
+    {
+        "versao": 4,
+        "descricao": "Particionamento mensal do estoque por data_hora",
+        "transacional": True,
+        "sql": [
+            # Cria as partições mensais (estoque_AAAA_MM) que faltam entre as duas datas; linhas
+            # do mês que já caíram na partição padrão são movidas para a nova partição antes do
+            # ATTACH. A aplicação grava o horário de São Paulo sem fuso e a sessão (padrão do
+            # Neon) o interpreta como UTC, então os meses começam à meia-noite em UTC
+            """
+            CREATE OR REPLACE FUNCTION criar_particoes_estoque(inicio DATE, fim DATE)
+            RETURNS INTEGER AS $$
+            DECLARE
+                mes DATE := date_trunc('month', inicio)::date;
+                de TIMESTAMP WITH TIME ZONE;
+                ate TIMESTAMP WITH TIME ZONE;
+                nome TEXT;
+                criadas INTEGER := 0;
+            BEGIN
+                WHILE mes <= fim LOOP
+                    nome := 'estoque_' || to_char(mes, 'YYYY_MM');
+                    IF to_regclass(nome) IS NULL THEN
+                        de := mes::timestamp AT TIME ZONE 'UTC';
+                        ate := (mes + INTERVAL '1 month')::timestamp AT TIME ZONE 'UTC';
+                        EXECUTE format(
+                            'CREATE TABLE %I (LIKE estoque INCLUDING DEFAULTS INCLUDING CONSTRAINTS)', nome
+                        );
+                        EXECUTE format(
+                            'WITH movidas AS (
+                                DELETE FROM estoque_padrao WHERE data_hora >= %L AND data_hora < %L RETURNING *
+                            )
+                            INSERT INTO %I SELECT * FROM movidas',
+                            de, ate, nome
+                        );
+                        EXECUTE format(
+                            'ALTER TABLE estoque ATTACH PARTITION %I FOR VALUES FROM (%L) TO (%L)', nome, de, ate
+                        );
+                        criadas := criadas + 1;
+                    END IF;
+                    mes := (mes + INTERVAL '1 month')::date;
+                END LOOP;
+                RETURN criadas;
+            END;
+            $$ LANGUAGE plpgsql
+            """,
+            # A tabela atual sai do caminho; a sequência dos ids passa para a nova tabela
+            "ALTER TABLE estoque RENAME TO estoque_nao_particionada",
+            "ALTER INDEX estoque_pkey RENAME TO estoque_nao_particionada_pkey",
+            """
+            DROP INDEX IF EXISTS ix_estoque_sku_deposito_data_hora, ix_estoque_balanco,
+                ix_estoque_deposito_data_hora, ix_estoque_data_hora
+            """,
+            "ALTER SEQUENCE estoque_id_seq OWNED BY NONE",
+            # A chave de partição precisa fazer parte da chave primária: (id, data_hora).
+            # O id continua vindo da mesma sequência e segue único na prática.
+            """
+            CREATE TABLE estoque (
+                id INTEGER NOT NULL DEFAULT nextval('estoque_id_seq'),
+                sku VARCHAR(50) REFERENCES produto(sku) ON DELETE CASCADE,
+                deposito_id INTEGER REFERENCES deposito(id) ON DELETE CASCADE,
+                quantidade INTEGER NOT NULL CHECK (quantidade >= 0),
+                tipo VARCHAR(50) NOT NULL DEFAULT 'Entrada',
+                data_hora TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT current_time_sao_paulo(),
+                observacoes VARCHAR(200),
+                saldo INTEGER NOT NULL DEFAULT 0,
+                PRIMARY KEY (id, data_hora)
+            ) PARTITION BY RANGE (data_hora)
+            """,
+            "ALTER SEQUENCE estoque_id_seq OWNED BY estoque.id",
+            # Recebe movimentações de meses sem partição (ex.: datas muito antigas ou futuras)
+            "CREATE TABLE estoque_padrao PARTITION OF estoque DEFAULT",
+            """
+            SELECT criar_particoes_estoque(
+                (COALESCE(min(data_hora) AT TIME ZONE 'UTC', now() AT TIME ZONE 'America/Sao_Paulo'))::date,
+                (now() AT TIME ZONE 'America/Sao_Paulo')::date
+            )
+            FROM estoque_nao_particionada
+            """,
+            """
+            INSERT INTO estoque (id, sku, deposito_id, quantidade, tipo, data_hora, observacoes, saldo)
+            SELECT id, sku, deposito_id, quantidade, tipo, data_hora, observacoes, saldo
+            FROM estoque_nao_particionada
+            """,
+            "DROP TABLE estoque_nao_particionada",
+            # Os índices da migração 2, agora particionados (criados depois da carga, em cada
+            # partição; CONCURRENTLY não é suportado em tabela particionada)
+            """
+            CREATE INDEX ix_estoque_sku_deposito_data_hora
+            ON estoque (sku, deposito_id, data_hora DESC, id DESC)
+            INCLUDE (tipo, quantidade, saldo)
+            """,
+            """
+            CREATE INDEX ix_estoque_balanco
+            ON estoque (sku, deposito_id, data_hora DESC, id DESC)
+            INCLUDE (quantidade)
+            WHERE tipo = 'Balanço'
+            """,
+            "CREATE INDEX ix_estoque_deposito_data_hora ON estoque (deposito_id, data_hora DESC, id DESC)",
+            "CREATE INDEX ix_estoque_data_hora ON estoque (data_hora DESC, id DESC)",
+            "ANALYZE estoque",
+        ],
+    },
+]
+
+# Quantos meses à frente criar_particoes_futuras deixa particionados
+MESES_PARTICOES_FUTURAS = int(os.getenv("ESTOQUE_MESES_FUTUROS", "3"))
+
+# Chave do advisory lock que impede duas execuções simultâneas das migrações
+MIGRATIONS_LOCK_KEY = 7340021
+
+
+def _indices_concorrentes(migracao: dict) -> list:
+    """Nomes dos índices criados com CREATE INDEX CONCURRENTLY pela migração."""
+    return [
+        nome
+        for comando in migracao["sql"]
+        for nome in re.findall(r"CREATE\s+INDEX\s+CONCURRENTLY\s+IF\s+NOT\s+EXISTS\s+(\w+)", comando, re.IGNORECASE)
+    ]
+
+
+def _remover_indices_invalidos(cur, nomes: list) -> None:
+    """
+    Remove, entre os índices informados, os deixados inválidos por um CREATE INDEX
+    CONCURRENTLY interrompido, para que o IF NOT EXISTS da nova tentativa não os
+    considere prontos. Índices inválidos de outra origem não são tocados.
+    """
+    if not nomes:
+        return
+    cur.execute("""
+        SELECT c.relname
+        FROM pg_index i
+        JOIN pg_class c ON c.oid = i.indexrelid
+        JOIN pg_namespace n ON n.oid = c.relnamespace
+        WHERE NOT i.indisvalid AND n.nspname = current_schema() AND c.relname = ANY(%s)
+    """, (nomes,))
+    for (nome_indice,) in cur.fetchall():
+        print(f"⚠️ Removendo índice inválido {nome_indice}")
+        cur.execute(sql.SQL("DROP INDEX CONCURRENTLY IF EXISTS {}").format(sql.Identifier(nome_indice)))
+
+
+def aplicar_migracoes(conn) -> list:
+    """
+    Aplica, em ordem, as migrações ainda não registradas em schema_migrations.
+    A conexão deve estar em autocommit. Retorna as versões aplicadas nesta execução.
+    """
+    aplicadas_agora = []
+    cur = conn.cursor()
+    try:
+        cur.execute("SELECT pg_advisory_lock(%s)", (MIGRATIONS_LOCK_KEY,))
+        cur.execute("SELECT versao FROM schema_migrations")
+        ja_aplicadas = {versao for (versao,) in cur.fetchall()}
+
+        for migracao in MIGRATIONS:
+            if migracao["versao"] in ja_aplicadas:
+                continue
+
+            print(f"➡️ Aplicando migração {migracao['versao']}: {migracao['descricao']}")
+            if migracao["transacional"]:
+                conn.autocommit = False
+                try:
+                    for comando in migracao["sql"]:
+                        cur.execute(comando)
+                    cur.execute(
+                        "INSERT INTO schema_migrations (versao, descricao) VALUES (%s, %s)",
+                        (migracao["versao"], migracao["descricao"])
+                    )
+                    conn.commit()
+                except Exception:
+                    conn.rollback()
+                    raise
+                finally:
+                    conn.autocommit = True
+            else:
+                _remover_indices_invalidos(cur, _indices_concorrentes(migracao))
+                for comando in migracao["sql"]:
+                    cur.execute(comando)
+                cur.execute(
+                    "INSERT INTO schema_migrations (versao, descricao) VALUES (%s, %s)",
+                    (migracao["versao"], migracao["descricao"])
+                )
+
+            aplicadas_agora.append(migracao["versao"])
+    finally:
+        cur.execute("SELECT pg_advisory_unlock(%s)", (MIGRATIONS_LOCK_KEY,))
+        cur.close()
+
+    return aplicadas_agora
+
+
+def criar_particoes_futuras(cur, meses: int = MESES_PARTICOES_FUTURAS) -> int:
+    """
+    Cria as partições mensais do estoque do mês atual até 'meses' à frente (as que já
+    existem são mantidas). Retorna quantas foram criadas; 0 se o estoque não é particionado.
+    """
+    cur.execute("SELECT relkind FROM pg_class WHERE oid = to_regclass('estoque')")
+    linha = cur.fetchone()
+    if not linha or linha[0] != "p":
+        return 0
+
+    cur.execute(
+        """
+        SELECT criar_particoes_estoque(
+            (now() AT TIME ZONE 'America/Sao_Paulo')::date,
+            ((now() AT TIME ZONE 'America/Sao_Paulo') + make_interval(months => %s))::date
+        )
+        """,
+        (meses,)
+    )
+    return cur.fetchone()[0]
+
 
 def create_schema():
     try:
@@ -66,6 +410,18 @@ def create_schema():
         # Executa DDL
         cur.execute(SQL_SCHEMA)
         print("✅ Tabelas criadas/atualizadas com sucesso!")
+
+        # Aplica as migrações pendentes
+        aplicadas = aplicar_migracoes(conn)
+        if aplicadas:
+            print(f"✅ Migrações aplicadas: {', '.join(str(v) for v in aplicadas)}")
+        else:
+            print("✅ Nenhuma migração pendente.")
+
+        # Partições dos próximos meses; rode periodicamente (ex.: mensalmente via cron)
+        # para que as novas movimentações não caiam na partição padrão
+        criadas = criar_particoes_futuras(cur)
+        print(f"✅ Partições do estoque criadas: {criadas}")
     except Exception as e:
         print(f"❌ Erro crítico: {e}")
     finally:
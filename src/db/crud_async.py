@@ -0,0 +1,235 @@
+"""
+Versões assíncronas (asyncio) das funções de CRUD de depósitos, produtos e estoque.
+
+Usam o engine assíncrono de database_async e as mesmas consultas (_stmt_*) e regras
+dos módulos síncronos, para que uma tela possa buscar depósitos, produtos, estoque e
+histórico ao mesmo tempo (e em paralelo às chamadas HTTP dos marketplaces). Cada função
+abre a própria sessão, então chamadas diferentes podem rodar concorrentemente com
+asyncio.gather. Rodam no loop do banco: do código síncrono, use database_async.executar().
+"""
+import asyncio
+import logging
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Tuple
+
+from sqlmodel import select
+
+from src.db.busca import (
+    _palavras,
+    _stmt_buscar_depositos,
+    _stmt_buscar_produtos,
+    _stmt_depositos_com_trecho,
+    _stmt_produtos_com_trecho,
+)
+from src.db.cache_estoque import cache_estoque
+from src.db.crud_estoque import (
+    _linha_estoque_atual,
+    _linhas_transferencia,
+    _montar_pagina_historico,
+    _registrar_linhas,
+    _stmt_estoque_atual,
+    _stmt_estoque_deposito,
+    _stmt_pagina_historico,
+    _stmt_saldos,
+)
+from src.db.database_async import get_session_async
+from .models import Deposito, Estoque, Produto, TipoEstoque
+
+
+async def listar_depositos_async(filtro: Optional[str] = None, limite: Optional[int] = None) -> List[Deposito]:
+    """
+    Lista depósitos com filtro opcional por nome, como listar_depositos. No PostgreSQL o
+    filtro usa a busca ranqueada; nos demais bancos, e quando nada casa como prefixo, o
+    trecho em qualquer posição do nome.
+    """
+    async with get_session_async() as session:
+        try:
+            if not (filtro and filtro.strip()):
+                return (await session.exec(select(Deposito).order_by(Deposito.nome))).all()
+
+            depositos = []
+            if session.bind.dialect.name == "postgresql" and _palavras(filtro):
+                depositos = (await session.exec(_stmt_buscar_depositos(filtro, limite))).all()
+            return depositos or (await session.exec(_stmt_depositos_com_trecho(filtro, limite))).all()
+
+        except Exception as e:
+            logging.error(f"Erro ao listar depósitos: {str(e)}", exc_info=True)
+            raise
+
+
+async def listar_produtos_async(filtro: Optional[str] = None, limite: Optional[int] = None) -> List[Produto]:
+    """
+    Lista produtos com filtro opcional por nome ou SKU, como listar_produtos. No PostgreSQL
+    o filtro usa a busca ranqueada; nos demais bancos, e quando nada casa como prefixo, o
+    trecho em qualquer posição do SKU ou do nome.
+    """
+    async with get_session_async() as session:
+        try:
+            if not (filtro and filtro.strip()):
+                return (await session.exec(select(Produto).order_by(Produto.sku))).all()
+
+            produtos = []
+            if session.bind.dialect.name == "postgresql" and _palavras(filtro):
+                produtos = (await session.exec(_stmt_buscar_produtos(filtro, limite))).all()
+            return produtos or (await session.exec(_stmt_produtos_com_trecho(filtro, limite))).all()
+
+        except Exception as e:
+            logging.error(f"Erro ao listar produtos: {str(e)}", exc_info=True)
+            raise
+
+
+async def consultar_saldos_async(
+    sku: Optional[str] = None,
+    deposito_id: Optional[int] = None
+) -> Dict[Tuple[str, int], int]:
+    """Calcula pelo histórico o saldo de cada par (sku, depósito), como consultar_saldos."""
+    async with get_session_async() as session:
+        resultados = (await session.exec(_stmt_saldos(sku, deposito_id))).all()
+        return {(linha.sku, linha.deposito_id): int(linha.saldo) for linha in resultados}
+
+
+async def consultar_estoque_async(sku: Optional[str] = None, deposito_id: Optional[int] = None):
+    """
+    Consulta o saldo atual com base no registro mais recente de cada par.
+
+    Returns:
+        tuple: Total de itens encontrados e a lista detalhada, no formato de consultar_estoque.
+    """
+    try:
+        async with get_session_async() as session:
+            resultados = (await session.exec(_stmt_estoque_atual(sku, deposito_id))).all()
+            detalhado = [_linha_estoque_atual(registro) for registro in resultados]
+            return len(detalhado), detalhado
+
+    except Exception as e:
+        print(f"Erro ao consultar estoque: {str(e)}")
+        return 0, []
+
+
+async def consultar_estoque_batch_async(origem_id: int) -> Dict[str, int]:
+    """Estoque positivo de cada produto do depósito, pelo mesmo cache de consultar_estoque_batch."""
+    async def carregar() -> Dict[str, int]:
+        async with get_session_async() as session:
+            resultados = (await session.exec(_stmt_estoque_deposito(origem_id))).all()
+            return {resultado.nome: resultado.saldo for resultado in resultados}
+
+    try:
+        return await cache_estoque.obter_async(origem_id, carregar)
+    except Exception as e:
+        print(f"Erro ao consultar estoque: {str(e)}")
+        return {}
+
+
+async def listar_movimentacoes_async(
+    sku: Optional[str] = None,
+    deposito_id: Optional[int] = None,
+    data_inicio: Optional[datetime] = None,
+    data_fim: Optional[datetime] = None,
+    cursor: Optional[Tuple[datetime, int]] = None,
+    tamanho_pagina: int = 100,
+    incluir_arquivo: bool = False,
+) -> Tuple[List[Dict], Optional[Tuple[datetime, int]]]:
+    """
+    Uma página do histórico de movimentações com paginação por cursor, como
+    consultar_historico_paginado: retorna (registros da página, cursor da próxima página).
+    """
+    query = _stmt_pagina_historico(
+        sku, deposito_id, data_inicio, data_fim, cursor, tamanho_pagina, incluir_arquivo
+    )
+    async with get_session_async() as session:
+        registros = (await session.exec(query)).all()
+        return _montar_pagina_historico(registros, tamanho_pagina)
+
+
+async def registrar_movimentacao_async(
+    sku: str,
+    deposito_id: int,
+    quantidade: int,
+    tipo: TipoEstoque,
+    observacoes: Optional[str] = None
+) -> Estoque:
+    """
+    Registra uma entrada/saída/balanço com validação de saldo, como registrar_movimentacao:
+    a movimentação e o saldo materializado são gravados na mesma transação.
+    """
+    linha = {"sku": sku, "deposito_id": deposito_id, "quantidade": quantidade, "tipo": tipo,
+             "observacoes": observacoes}
+    async with get_session_async() as session:
+        try:
+            registros = await session.run_sync(_registrar_linhas, [linha])
+            await session.commit()
+            cache_estoque.invalidar(deposito_id)
+
+            logging.debug(f"Movimentação de estoque registrada: {registros[0]}")
+            return registros[0]
+
+        except Exception as e:
+            logging.error(f"Erro ao registrar movimentação de estoque: {str(e)}", exc_info=True)
+            await session.rollback()
+            raise
+
+
+async def registrar_movimentacoes_em_lote_async(linhas: List[Dict[str, Any]]) -> int:
+    """
+    Registra várias entradas/saídas/balanços em uma única transação, com as mesmas
+    validações e bloqueios de registrar_movimentacoes_em_lote.
+    """
+    async with get_session_async() as session:
+        try:
+            registros = await session.run_sync(_registrar_linhas, linhas)
+            await session.commit()
+            cache_estoque.invalidar(*{linha["deposito_id"] for linha in linhas})
+
+            logging.debug(f"Lote de {len(registros)} movimentações de estoque registrado")
+            return len(registros)
+
+        except Exception as e:
+            logging.error(f"Erro ao registrar lote de movimentações de estoque: {str(e)}", exc_info=True)
+            await session.rollback()
+            raise
+
+
+async def transferir_estoque_lote_async(
+    origem_id: int,
+    destino_id: int,
+    itens: List[Dict[str, Any]]
+) -> List[Tuple[Estoque, Estoque]]:
+    """Transfere um ou vários SKUs entre dois depósitos em uma única transação, como transferir_estoque_lote."""
+    async with get_session_async() as session:
+        try:
+            linhas = _linhas_transferencia(origem_id, destino_id, itens)
+            registros = await session.run_sync(_registrar_linhas, linhas)
+            await session.commit()
+            cache_estoque.invalidar(origem_id, destino_id)
+
+            transferencias = list(zip(registros[0::2], registros[1::2]))
+            logging.debug(f"Transferência de estoque realizada: {len(transferencias)} item(ns) de {origem_id} para {destino_id}")
+            return transferencias
+
+        except Exception as e:
+            logging.error(f"Erro ao transferir estoque: {str(e)}", exc_info=True)
+            await session.rollback()
+            raise
+
+
+async def carregar_tela_estoque_async(
+    deposito_id: Optional[int] = None,
+    tamanho_pagina_historico: int = 100
+) -> Dict[str, Any]:
+    """
+    Busca em paralelo tudo o que a tela de estoque exibe: depósitos, produtos,
+    estoque atual e a primeira página do histórico (do depósito, se informado).
+    """
+    depositos, produtos, (_, estoque), (historico, cursor_historico) = await asyncio.gather(
+        listar_depositos_async(),
+        listar_produtos_async(),
+        consultar_estoque_async(deposito_id=deposito_id),
+        listar_movimentacoes_async(deposito_id=deposito_id, tamanho_pagina=tamanho_pagina_historico),
+    )
+    return {
+        "depositos": depositos,
+        "produtos": produtos,
+        "estoque": estoque,
+        "historico": historico,
+        "cursor_historico": cursor_historico,
+    }
@@ -2,6 +2,8 @@ from sqlmodel import Session, select
 from typing import List, Optional
 from .models import Deposito
 from src.db.database import get_session
+from src.db.cache_estoque import cache_estoque
+from src.db.busca import buscar_depositos, indice_depositos
 import logging
 
 # Configuração básica do logging
@@ -20,6 +22,7 @@ def criar_deposito(nome: str, tipo: str = "Próprio", observacoes: Optional[str]
             novo_deposito = Deposito(nome=nome, tipo=tipo, observacoes=observacoes)
             session.add(novo_deposito)
             session.commit()  # Corrigido: Adicionado parênteses
+            indice_depositos.invalidar()
             session.refresh(novo_deposito)  # Corrigido: Adicionado parênteses
             
             logging.debug(f"Novo depósito criado: {novo_deposito}")
@@ -30,15 +33,18 @@ def criar_deposito(nome: str, tipo: str = "Próprio", observacoes: Optional[str]
             session.rollback()  # Garante rollback em caso de erro
             raise
 
-def listar_depositos(filtro: Optional[str] = None) -> List[Deposito]:
-    """Lista depósitos com filtro opcional por nome."""
+def listar_depositos(filtro: Optional[str] = None, limite: Optional[int] = None) -> List[Deposito]:
+    """
+    Lista depósitos com filtro opcional por nome.
+    Com filtro, retorna os depósitos ordenados por relevância (ver busca.buscar_depositos),
+    até 'limite' se informado.
+    """
+    if filtro and filtro.strip():
+        return buscar_depositos(filtro, limite)
+
     with get_session() as session:  # Gerencia a sessão automaticamente
         try:
-            query = select(Deposito).order_by(Deposito.nome)
-            if filtro:
-                query = query.where(Deposito.nome.ilike(f"%{filtro}%"))  # Filtro por nome (case-insensitive)
-            
-            return session.exec(query).all()  # Corrigido: Adicionado .all()
+            return session.exec(select(Deposito).order_by(Deposito.nome)).all()
         
         except Exception as e:
             logging.error(f"Erro ao listar depósitos: {str(e)}", exc_info=True)
@@ -67,6 +73,7 @@ def atualizar_deposito(deposito_id: int, novo_nome: Optional[str] = None,
             
             session.add(deposito)
             session.commit()  # Corrigido: Adicionado parênteses
+            indice_depositos.invalidar()
             session.refresh(deposito)  # Corrigido: Adicionado parênteses
             
             return deposito
@@ -91,6 +98,8 @@ def deletar_deposito(deposito_id: int) -> bool:
             logging.debug(f"Tentando excluir depósito com ID: {deposito_id}")
             session.delete(deposito)
             session.commit()  # Confirma a transação
+            cache_estoque.invalidar(deposito_id)
+            indice_depositos.invalidar()
             
             return True
         
@@ -1,12 +1,12 @@
 from sqlmodel import Session, select
-from typing import Tuple, Dict, Optional, List, Any
-from datetime import datetime
+from typing import Tuple, Dict, Optional, List, Any, Iterator
+from datetime import datetime, timedelta
 from zoneinfo import ZoneInfo
-from .models import Estoque, Deposito, Produto, TipoEstoque
+from .models import Estoque, EstoqueArquivo, Deposito, Produto, SaldoEstoque, SaldoSnapshot, TipoEstoque
 from src.db.database import get_session
-from sqlalchemy import func, and_
-from functools import lru_cache
-from sqlalchemy.orm import aliased,selectinload
+from src.db.cache_estoque import cache_estoque
+from sqlalchemy import func, and_, or_, case, insert, tuple_, union_all
+from sqlalchemy.orm import aliased
 import logging
 
 # Configuração básica do logging
@@ -15,44 +15,194 @@ logging.basicConfig(level=logging.DEBUG)
 def consultar_saldo(sku: str, deposito_id: int) -> int:
     """
     Consulta o saldo atual de um produto em um determinado depósito.
+    Lê a tabela saldo_estoque pela chave primária; só recalcula pelo histórico
+    se o par ainda não tiver saldo materializado.
     """
     with get_session() as session:
-        saldo = _calcular_saldo(session, sku, deposito_id)
-        return saldo
+        registro_saldo = session.get(SaldoEstoque, (sku, deposito_id))
+        if registro_saldo is not None:
+            return registro_saldo.saldo
+        return _calcular_saldo(session, sku, deposito_id)
+
+
+def _obter_saldo_materializado(session: Session, sku: str, deposito_id: int) -> SaldoEstoque:
+    """
+    Retorna (bloqueada para atualização) a linha de saldo_estoque do par sku/depósito.
+    Se o par ainda não tiver saldo materializado, cria a linha a partir do histórico.
+    """
+    registro_saldo = session.get(SaldoEstoque, (sku, deposito_id), with_for_update=True)
+    if registro_saldo is None:
+        registro_saldo = SaldoEstoque(
+            sku=sku,
+            deposito_id=deposito_id,
+            saldo=_calcular_saldo(session, sku, deposito_id)
+        )
+        session.add(registro_saldo)
+    return registro_saldo
+
+
+def _aplicar_movimentacao(saldo: int, tipo: TipoEstoque, quantidade: int) -> int:
+    """
+    Retorna o saldo resultante de aplicar uma nova movimentação sobre o saldo atual.
+    """
+    if tipo == TipoEstoque.ENTRADA:
+        return saldo + quantidade
+    if tipo == TipoEstoque.SAIDA:
+        return saldo - quantidade
+    if tipo == TipoEstoque.BALANCO:
+        return quantidade
+    return saldo
+
+
+def _atualizar_saldo_materializado(registro_saldo: SaldoEstoque, novo_saldo: int) -> None:
+    """
+    Atualiza o saldo materializado do par (a gravação ocorre no commit da movimentação).
+    """
+    registro_saldo.saldo = novo_saldo
+    registro_saldo.atualizado_em = datetime.now(ZoneInfo("America/Sao_Paulo"))
+
+
+def consultar_saldos(sku: Optional[str] = None, deposito_id: Optional[int] = None) -> Dict[Tuple[str, int], int]:
+    """
+    Calcula pelo histórico o saldo de vários pares (sku, depósito) de uma só vez.
+
+    Args:
+        sku: SKU do produto. Se None, considera todos os produtos.
+        deposito_id: ID do depósito. Se None, considera todos os depósitos.
+
+    Returns:
+        Dicionário {(sku, deposito_id): saldo}.
+    """
+    with get_session() as session:
+        return _calcular_saldos(session, sku, deposito_id)
+
+
+def _stmt_saldos(
+    sku: Optional[str] = None,
+    deposito_id: Optional[int] = None,
+    pares: Optional[List[Tuple[str, int]]] = None,
+    desde: Optional[datetime] = None,
+    ate: Optional[datetime] = None,
+    tabela=Estoque
+):
+    """
+    Monta a consulta agregada que calcula o saldo de cada par (sku, depósito):
+    quantidade do último balanço (se houver) + entradas - saídas a partir dele.
+
+    Com desde/ate, só as movimentações com desde < data_hora <= ate são consideradas.
+    A coluna "balanco" traz a quantidade do último balanço da janela (NULL se não houver),
+    para quem soma o resultado a um saldo inicial (ver snapshot_estoque).
+    tabela permite o mesmo cálculo sobre estoque_arquivo (EstoqueArquivo), que tem as mesmas colunas.
+    """
+    # Último balanço de cada par, escolhido por data/hora e, no empate, pelo maior id
+    ultimo_balanco = (
+        select(
+            tabela.sku,
+            tabela.deposito_id,
+            tabela.quantidade,
+            tabela.data_hora,
+            tabela.id,
+            func.row_number().over(
+                partition_by=(tabela.sku, tabela.deposito_id),
+                order_by=(tabela.data_hora.desc(), tabela.id.desc())
+            ).label("ordem")
+        )
+        .where(tabela.tipo == TipoEstoque.BALANCO)
+    )
+
+    movimento = case(
+        (tabela.tipo == TipoEstoque.ENTRADA, tabela.quantidade),
+        (tabela.tipo == TipoEstoque.SAIDA, -tabela.quantidade),
+        else_=0
+    )
+
+    query = select(tabela.sku, tabela.deposito_id)
+
+    if sku:
+        ultimo_balanco = ultimo_balanco.where(tabela.sku == sku)
+        query = query.where(tabela.sku == sku)
+    if deposito_id:
+        ultimo_balanco = ultimo_balanco.where(tabela.deposito_id == deposito_id)
+        query = query.where(tabela.deposito_id == deposito_id)
+    if pares:
+        ultimo_balanco = ultimo_balanco.where(tuple_(tabela.sku, tabela.deposito_id).in_(pares))
+        query = query.where(tuple_(tabela.sku, tabela.deposito_id).in_(pares))
+    if desde:
+        ultimo_balanco = ultimo_balanco.where(tabela.data_hora > desde)
+        query = query.where(tabela.data_hora > desde)
+    if ate:
+        ultimo_balanco = ultimo_balanco.where(tabela.data_hora <= ate)
+        query = query.where(tabela.data_hora <= ate)
+
+    balanco = ultimo_balanco.subquery("ultimo_balanco")
+
+    return (
+        query
+        .add_columns(
+            (func.coalesce(func.max(balanco.c.quantidade), 0) + func.coalesce(func.sum(movimento), 0)).label("saldo"),
+            func.max(balanco.c.quantidade).label("balanco")
+        )
+        .outerjoin(balanco, and_(
+            balanco.c.sku == tabela.sku,
+            balanco.c.deposito_id == tabela.deposito_id,
+            balanco.c.ordem == 1
+        ))
+        # Mesmo critério de desempate da escolha do balanço: na mesma data/hora, só as linhas
+        # de id maior que o do balanço entram no saldo
+        .where(or_(
+            balanco.c.data_hora.is_(None),
+            tuple_(tabela.data_hora, tabela.id) >= tuple_(balanco.c.data_hora, balanco.c.id)
+        ))
+        .group_by(tabela.sku, tabela.deposito_id)
+    )
+
+
+def _calcular_saldos(
+    session: Session,
+    sku: Optional[str] = None,
+    deposito_id: Optional[int] = None,
+    pares: Optional[List[Tuple[str, int]]] = None,
+    ate: Optional[datetime] = None
+) -> Dict[Tuple[str, int], int]:
+    """
+    Calcula no banco, em uma única consulta, o saldo de um par, de um depósito inteiro,
+    de uma lista de pares ou de todos os pares (sku, depósito).
+    Com ate, calcula o saldo naquele instante (movimentações com data_hora <= ate).
+    """
+    resultados = session.exec(_stmt_saldos(sku, deposito_id, pares, ate=ate)).all()
+    return {(linha.sku, linha.deposito_id): int(linha.saldo) for linha in resultados}
 
 
 def _calcular_saldo(session: Session, sku: str, deposito_id: int) -> int:
     """
     Calcula o saldo atual do estoque para um determinado produto e depósito.
     """
-    # Encontra o registro de balanço mais recente
-    balanco_recente = session.exec(
-        select(Estoque)
-        .where(Estoque.sku == sku)
-        .where(Estoque.deposito_id == deposito_id)
-        .where(Estoque.tipo == TipoEstoque.BALANCO)
-        .order_by(Estoque.data_hora.desc())
-    ).first()
-
-    query = select(Estoque).where(Estoque.sku == sku).where(Estoque.deposito_id == deposito_id)
-
-    if balanco_recente:
-        query = query.where(Estoque.data_hora >= balanco_recente.data_hora)
-        saldo = balanco_recente.quantidade
-    else:
-        saldo = 0
-
-    movimentacoes = session.exec(query).all()
-
-    for movimentacao in movimentacoes:
-        if movimentacao.tipo == TipoEstoque.ENTRADA:
-            saldo += movimentacao.quantidade
-        elif movimentacao.tipo == TipoEstoque.SAIDA:
-            saldo -= movimentacao.quantidade  # Adiciona a quantidade (que já é negativa para saídas)
-        elif movimentacao.tipo == TipoEstoque.BALANCO and movimentacao != balanco_recente:
-            saldo = movimentacao.quantidade
+    return _calcular_saldos(session, sku, deposito_id).get((sku, deposito_id), 0)
 
-    return saldo
+
+def _recalcular_snapshots(session: Session, sku: str, deposito_id: int, a_partir_de: datetime) -> None:
+    """
+    Recalcula o saldo do par nos snapshots com data de referência >= a_partir_de,
+    após a alteração ou exclusão de uma movimentação já coberta por eles.
+    """
+    datas = session.exec(
+        select(SaldoSnapshot.data_referencia)
+        .where(SaldoSnapshot.data_referencia >= a_partir_de)
+        .distinct()
+    ).all()
+
+    for data_referencia in datas:
+        saldo = _calcular_saldos(session, pares=[(sku, deposito_id)], ate=data_referencia).get((sku, deposito_id), 0)
+        snapshot = session.get(SaldoSnapshot, (sku, deposito_id, data_referencia))
+        if saldo == 0:
+            # Snapshots não guardam saldos zerados
+            if snapshot:
+                session.delete(snapshot)
+        elif snapshot:
+            snapshot.saldo = saldo
+            session.add(snapshot)
+        else:
+            session.add(SaldoSnapshot(sku=sku, deposito_id=deposito_id, data_referencia=data_referencia, saldo=saldo))
 
 def atualizar_movimentacao(
     movimentacao_id: int,
@@ -77,22 +227,26 @@ def atualizar_movimentacao(
             if not registro:
                 raise ValueError("Registro de movimentação não encontrado")
 
+            registro_saldo = _obter_saldo_materializado(session, registro.sku, registro.deposito_id)
+
             # Validar a quantidade
-            if registro.tipo == TipoEstoque.SAIDA and nova_quantidade > _calcular_saldo(session, registro.sku, registro.deposito_id):
+            if registro.tipo == TipoEstoque.SAIDA and nova_quantidade > registro_saldo.saldo:
                 raise ValueError("Saldo insuficiente")
 
             registro.quantidade = nova_quantidade
             registro.observacoes = nova_observacao
-
             session.add(registro)
-            session.commit()
-            session.refresh(registro)
+            session.flush()
 
-            # Recalcular o saldo
+            # Recalcular o saldo (a movimentação alterada pode ser anterior ao último balanço)
             novo_saldo = _calcular_saldo(session, registro.sku, registro.deposito_id)
             registro.saldo = novo_saldo
+            _atualizar_saldo_materializado(registro_saldo, novo_saldo)
+            _recalcular_snapshots(session, registro.sku, registro.deposito_id, registro.data_hora)
             session.add(registro)
+            session.add(registro_saldo)
             session.commit()
+            cache_estoque.invalidar(registro.deposito_id)
             session.refresh(registro)
 
             logging.debug(f"Movimentação de estoque atualizada: {registro}")
@@ -118,15 +272,18 @@ def excluir_movimentacao(movimentacao_id: int) -> None:
             if not registro:
                 raise ValueError("Registro de movimentação não encontrado")
 
+            registro_saldo = _obter_saldo_materializado(session, registro.sku, registro.deposito_id)
+
             session.delete(registro)
-            session.commit()
+            session.flush()
 
-            # Recalcular o saldo
+            # Recalcular o saldo materializado sem a movimentação excluída
             novo_saldo = _calcular_saldo(session, registro.sku, registro.deposito_id)
-            # registro.saldo = novo_saldo # Não sei se precisa disso
-            # session.add(registro) # Não sei se precisa disso
-            # session.commit() # Não sei se precisa disso
-            # session.refresh(registro) # Não sei se precisa disso
+            _atualizar_saldo_materializado(registro_saldo, novo_saldo)
+            _recalcular_snapshots(session, registro.sku, registro.deposito_id, registro.data_hora)
+            session.add(registro_saldo)
+            session.commit()
+            cache_estoque.invalidar(registro.deposito_id)
 
             logging.debug(f"Movimentação de estoque excluída: {registro}")
 
@@ -155,8 +312,9 @@ def registrar_movimentacao(
             if not produto or not deposito:
                 raise ValueError("Produto ou Depósito inválido")
 
-            # Calcula o saldo atual
-            saldo_atual = _calcular_saldo(session, sku, deposito_id)
+            # Saldo atual lido (e bloqueado) na tabela saldo_estoque
+            registro_saldo = _obter_saldo_materializado(session, sku, deposito_id)
+            saldo_atual = registro_saldo.saldo
 
             # Valida a saída
             if tipo == TipoEstoque.SAIDA and quantidade > saldo_atual:
@@ -187,18 +345,16 @@ def registrar_movimentacao(
                 quantidade=quantidade,
                 tipo=tipo,                                
                 data_hora=datetime.now(ZoneInfo("America/Sao_Paulo")).replace(tzinfo=None),
-                observacoes=observacoes
+                observacoes=observacoes,
+                saldo=_aplicar_movimentacao(saldo_atual, tipo, quantidade)
             )
+            _atualizar_saldo_materializado(registro_saldo, registro.saldo)
 
+            # Movimentação e saldo materializado gravados na mesma transação
             session.add(registro)
+            session.add(registro_saldo)
             session.commit()
-            session.refresh(registro)
-
-            # Atualiza o saldo
-            novo_saldo = _calcular_saldo(session, sku, deposito_id)
-            registro.saldo = novo_saldo
-            session.add(registro)
-            session.commit()
+            cache_estoque.invalidar(deposito_id)
             session.refresh(registro)
 
             logging.debug(f"Movimentação de estoque registrada: {registro}")
@@ -216,6 +372,124 @@ def registrar_movimentacao(
         
         return None  # Retorna None em caso de falha
 
+def _obter_saldos_materializados(session: Session, pares: List[Tuple[str, int]]) -> Dict[Tuple[str, int], SaldoEstoque]:
+    """
+    Retorna (bloqueadas para atualização) as linhas de saldo_estoque dos pares informados.
+    Pares sem saldo materializado são calculados pelo histórico em uma única consulta agrupada.
+    """
+    pares = sorted(set(pares))  # Ordem fixa de bloqueio evita deadlock entre lotes concorrentes
+    existentes = session.exec(
+        select(SaldoEstoque)
+        .where(tuple_(SaldoEstoque.sku, SaldoEstoque.deposito_id).in_(pares))
+        .order_by(SaldoEstoque.sku, SaldoEstoque.deposito_id)
+        .with_for_update()
+    ).all()
+    registros = {(r.sku, r.deposito_id): r for r in existentes}
+
+    faltantes = [par for par in pares if par not in registros]
+    if faltantes:
+        saldos = _calcular_saldos(session, pares=faltantes)
+        for sku, deposito_id in faltantes:
+            registro_saldo = SaldoEstoque(sku=sku, deposito_id=deposito_id, saldo=saldos.get((sku, deposito_id), 0))
+            session.add(registro_saldo)
+            registros[(sku, deposito_id)] = registro_saldo
+
+    return registros
+
+
+def _registrar_linhas(session: Session, linhas: List[Dict[str, Any]]) -> List[Estoque]:
+    """
+    Valida e grava um conjunto de movimentações na sessão (sem commit), atualizando
+    o saldo de cada linha e o saldo materializado dos pares envolvidos.
+    Retorna os registros inseridos, na ordem das linhas.
+    """
+    if not linhas:
+        return []
+
+    for linha in linhas:
+        if linha["quantidade"] < 0:
+            raise ValueError(f"Quantidade não pode ser negativa (SKU '{linha['sku']}')")
+
+    # Validação de SKUs e depósitos com uma consulta IN cada
+    skus = {linha["sku"] for linha in linhas}
+    deposito_ids = {linha["deposito_id"] for linha in linhas}
+    skus_validos = set(session.exec(select(Produto.sku).where(Produto.sku.in_(skus))).all())
+    depositos_validos = set(session.exec(select(Deposito.id).where(Deposito.id.in_(deposito_ids))).all())
+
+    if skus - skus_validos:
+        raise ValueError(f"Produto inválido: {', '.join(sorted(skus - skus_validos))}")
+    if deposito_ids - depositos_validos:
+        raise ValueError(f"Depósito inválido: {', '.join(str(d) for d in sorted(deposito_ids - depositos_validos))}")
+
+    registros_saldo = _obter_saldos_materializados(
+        session, [(linha["sku"], linha["deposito_id"]) for linha in linhas]
+    )
+    saldos = {par: registro.saldo for par, registro in registros_saldo.items()}
+
+    # Mesmo instante para o lote, com um microssegundo por linha para preservar a ordem
+    agora = datetime.now(ZoneInfo("America/Sao_Paulo")).replace(tzinfo=None)
+    novos_registros = []
+    for i, linha in enumerate(linhas):
+        par = (linha["sku"], linha["deposito_id"])
+        tipo = linha["tipo"]
+        quantidade = linha["quantidade"]
+
+        if tipo == TipoEstoque.SAIDA and quantidade > saldos[par]:
+            raise ValueError(f"Saldo insuficiente para o SKU '{linha['sku']}' (saldo atual: {saldos[par]})")
+
+        saldos[par] = _aplicar_movimentacao(saldos[par], tipo, quantidade)
+        novos_registros.append({
+            "sku": linha["sku"],
+            "deposito_id": linha["deposito_id"],
+            "quantidade": quantidade,
+            "tipo": TipoEstoque(tipo).value,
+            "data_hora": agora + timedelta(microseconds=i),
+            "observacoes": linha.get("observacoes"),
+            "saldo": saldos[par],
+        })
+
+    registros = session.scalars(
+        insert(Estoque).returning(Estoque, sort_by_parameter_order=True),
+        novos_registros
+    ).all()
+
+    for par, registro_saldo in registros_saldo.items():
+        _atualizar_saldo_materializado(registro_saldo, saldos[par])
+        session.add(registro_saldo)
+
+    return registros
+
+
+def registrar_movimentacoes_em_lote(linhas: List[Dict[str, Any]]) -> int:
+    """
+    Registra várias entradas/saídas/balanços em uma única transação.
+
+    Args:
+        linhas: Lista de dicionários com as chaves 'sku', 'deposito_id', 'quantidade',
+            'tipo' e, opcionalmente, 'observacoes'. As linhas são aplicadas na ordem recebida.
+
+    Returns:
+        Quantidade de movimentações registradas.
+
+    Raises:
+        ValueError: Se algum produto/depósito for inválido ou alguma saída exceder o saldo.
+            Nesse caso nenhuma linha do lote é gravada.
+    """
+    with get_session() as session:
+        try:
+            total = len(_registrar_linhas(session, linhas))
+            session.commit()
+            cache_estoque.invalidar(*{linha["deposito_id"] for linha in linhas})
+
+            logging.debug(f"Lote de {total} movimentações de estoque registrado")
+            return total
+
+        except Exception as e:
+            logging.error(f"Erro ao registrar lote de movimentações de estoque: {str(e)}", exc_info=True)
+            session.rollback()
+            raise
+
+
 def transferir_estoque(
     sku: str,
     origem_id: int,
@@ -227,122 +501,175 @@ def transferir_estoque(
     Transferência segura entre depósitos com verificação de saldo.
     Retorna os registros atualizados da origem e destino.
     """
-    with get_session() as session:  # Gerencia a sessão automaticamente
-        try:
-            if origem_id == destino_id:
-                raise ValueError("Origem e destino devem ser diferentes")
-
-            origem = session.get(Deposito, origem_id)
-            destino = session.get(Deposito, destino_id)
-            produto = session.get(Produto, sku)
-
-            if not all([origem, destino, produto]):
-                raise ValueError("Parâmetros inválidos")
-
-            # Calcula o saldo atual na origem
-            saldo_origem = _calcular_saldo(session, sku, origem_id)
-            if saldo_origem < quantidade:
-                raise ValueError("Saldo insuficiente na origem")
-
-            # Registra a saída no depósito de origem
-            registro_saida = Estoque(
-                sku=sku,
-                deposito_id=origem_id,
-                quantidade=quantidade,  # Quantidade positiva para saída
-                tipo=TipoEstoque.SAIDA,                
-                data_hora=datetime.now(ZoneInfo("America/Sao_Paulo")).replace(tzinfo=None),
-                observacoes=observacoes
-            )
-            session.add(registro_saida)
+    transferencias = transferir_estoque_lote(
+        origem_id,
+        destino_id,
+        [{"sku": sku, "quantidade": quantidade, "observacoes": observacoes}]
+    )
+    return transferencias[0]
+
+
+def _linhas_transferencia(origem_id: int, destino_id: int, itens: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """Valida os itens e monta as duas pernas (saída na origem, entrada no destino) de cada um."""
+    if origem_id == destino_id:
+        raise ValueError("Origem e destino devem ser diferentes")
+
+    linhas = []
+    for item in itens:
+        if item["quantidade"] <= 0:
+            raise ValueError(f"Quantidade a transferir deve ser positiva (SKU '{item['sku']}')")
+        linhas.append({
+            "sku": item["sku"],
+            "deposito_id": origem_id,
+            "quantidade": item["quantidade"],  # Quantidade positiva para saída
+            "tipo": TipoEstoque.SAIDA,
+            "observacoes": item.get("observacoes"),
+        })
+        linhas.append({
+            "sku": item["sku"],
+            "deposito_id": destino_id,
+            "quantidade": item["quantidade"],  # Quantidade positiva para entrada
+            "tipo": TipoEstoque.ENTRADA,
+            "observacoes": item.get("observacoes"),
+        })
+    return linhas
+
+
+def transferir_estoque_lote(
+    origem_id: int,
+    destino_id: int,
+    itens: List[Dict[str, Any]]
+) -> List[Tuple[Estoque, Estoque]]:
+    """
+    Transfere um ou vários SKUs entre dois depósitos em uma única transação.
 
-            # Registra a entrada no depósito de destino
-            registro_entrada = Estoque(
-                sku=sku,
-                deposito_id=destino_id,
-                quantidade=quantidade,  # Quantidade positiva para entrada
-                tipo=TipoEstoque.ENTRADA,                
-                data_hora=datetime.now(ZoneInfo("America/Sao_Paulo")).replace(tzinfo=None),
-                observacoes=observacoes
-            )
-            session.add(registro_entrada)
+    Os saldos da origem e do destino são bloqueados (SELECT ... FOR UPDATE) antes da
+    verificação, de modo que duas transferências concorrentes da mesma origem não
+    conseguem consumir o mesmo saldo. As duas pernas de cada item são gravadas já
+    com o saldo final e confirmadas em um único commit.
 
-            session.commit()
-            session.refresh(registro_saida)
-            session.refresh(registro_entrada)
+    Args:
+        origem_id: ID do depósito de origem.
+        destino_id: ID do depósito de destino.
+        itens: Lista de dicionários com as chaves 'sku', 'quantidade' e, opcionalmente, 'observacoes'.
 
-            # Atualiza o saldo na origem
-            novo_saldo_origem = _calcular_saldo(session, sku, origem_id)
-            registro_saida.saldo = novo_saldo_origem
-            session.add(registro_saida)
-            session.commit()
-            session.refresh(registro_saida)
+    Returns:
+        Lista de tuplas (registro de saída, registro de entrada), na ordem dos itens.
+    """
+    with get_session() as session:  # Gerencia a sessão automaticamente
+        try:
+            registros = _registrar_linhas(session, _linhas_transferencia(origem_id, destino_id, itens))
 
-            # Atualiza o saldo no destino
-            novo_saldo_destino = _calcular_saldo(session, sku, destino_id)
-            registro_entrada.saldo = novo_saldo_destino
-            session.add(registro_entrada)
+            # Desanexa os registros para que continuem legíveis após o commit, sem novo SELECT
+            for registro in registros:
+                session.expunge(registro)
             session.commit()
-            session.refresh(registro_entrada)
+            cache_estoque.invalidar(origem_id, destino_id)
 
-            logging.debug(f"Transferência de estoque realizada: Saída={registro_saida}, Entrada={registro_entrada}")
-            return registro_saida, registro_entrada
+            transferencias = list(zip(registros[0::2], registros[1::2]))
+            logging.debug(f"Transferência de estoque realizada: {len(transferencias)} item(ns) de {origem_id} para {destino_id}")
+            return transferencias
 
         except Exception as e:
             logging.error(f"Erro ao transferir estoque: {str(e)}", exc_info=True)
             session.rollback()  # Garante rollback em caso de erro
             raise
-        
-        return None, None  # Retorna None em caso de falha
-    
 
 
-@lru_cache(maxsize=1)
+def _stmt_ultimas_movimentacoes(*colunas, sku: Optional[str] = None, deposito_id: Optional[int] = None):
+    """
+    Monta a consulta do registro mais recente de cada par (sku, depósito).
+
+    Os pares vêm de saldo_estoque (uma linha por par) e, para cada um, o último registro
+    é buscado pelo índice ix_estoque_sku_deposito_data_hora (ORDER BY data_hora DESC,
+    id DESC LIMIT 1). O custo é proporcional ao número de pares, e o id desempata
+    movimentações com a mesma data/hora, como as duas pernas de uma transferência.
+    """
+    EstoqueAlias = aliased(Estoque)
+    ultimo_id = (
+        select(EstoqueAlias.id)
+        .where(
+            EstoqueAlias.sku == SaldoEstoque.sku,
+            EstoqueAlias.deposito_id == SaldoEstoque.deposito_id
+        )
+        .order_by(EstoqueAlias.data_hora.desc(), EstoqueAlias.id.desc())
+        .limit(1)
+        .correlate(SaldoEstoque)
+        .scalar_subquery()
+    )
+
+    statement = (
+        select(*colunas)
+        .select_from(SaldoEstoque)
+        .join(Estoque, Estoque.id == ultimo_id)
+    )
+
+    if sku:
+        statement = statement.where(SaldoEstoque.sku == sku)
+    if deposito_id:
+        statement = statement.where(SaldoEstoque.deposito_id == deposito_id)
+
+    return statement
+
+
+def _stmt_estoque_deposito(origem_id: int):
+    """Consulta do estoque positivo de cada produto do depósito (nome do produto, saldo)."""
+    return (
+        _stmt_ultimas_movimentacoes(Produto.nome, Estoque.saldo, deposito_id=origem_id)
+        .join(Produto, Estoque.sku == Produto.sku)
+        .where(Estoque.saldo > 0)
+    )
+
+
+def _carregar_estoque_deposito(origem_id: int) -> Dict[str, int]:
+    """Lê do banco o estoque positivo de cada produto do depósito, por nome do produto."""
+    with get_session() as db:
+        resultados = db.exec(_stmt_estoque_deposito(origem_id)).all()
+
+        return {
+            resultado.nome: resultado.saldo
+            for resultado in resultados
+        }
+
+
 def consultar_estoque_batch(origem_id):
     """
     Consulta o estoque para todos os produtos de um depósito específico de uma só vez.
+    O resultado fica em cache por depósito (ver cache_estoque) até expirar o TTL ou
+    até uma movimentação no depósito invalidá-lo.
     """
     try:
-        with get_session() as db:
-            EstoqueAlias = aliased(Estoque)
-            
-            # Subquery para encontrar a data/hora mais recente de cada SKU
-            subquery = (
-                select(
-                    EstoqueAlias.sku,
-                    func.max(EstoqueAlias.data_hora).label("max_data_hora")
-                )
-                .where(EstoqueAlias.deposito_id == origem_id)
-                .group_by(EstoqueAlias.sku)
-                .subquery()
-            )
-
-            # Query principal
-            stmt = (
-                select(Estoque)
-                .options(selectinload(Estoque.produto))
-                .join(Produto, Estoque.sku == Produto.sku)
-                .join(
-                    subquery,
-                    (Estoque.sku == subquery.c.sku) &
-                    (Estoque.data_hora == subquery.c.max_data_hora)
-                )
-                .where(
-                    Estoque.deposito_id == origem_id,
-                    Estoque.saldo > 0
-                )
-            )
-            
-            resultados = db.scalars(stmt).all()
-            
-            return {
-                resultado.produto.nome: resultado.saldo
-                for resultado in resultados
-            }
+        return cache_estoque.obter(origem_id, lambda: _carregar_estoque_deposito(origem_id))
     except Exception as e:
         print(f"Erro ao consultar estoque: {str(e)}")
         return {}
 
 
+def _stmt_estoque_atual(sku: Optional[str] = None, deposito_id: Optional[int] = None):
+    """Registro mais recente de cada SKU e depósito (exatamente um por par), com os nomes."""
+    return (
+        _stmt_ultimas_movimentacoes(
+            Estoque,
+            Deposito.nome.label("Depósito"),
+            Produto.nome.label("Produto"),
+            sku=sku,
+            deposito_id=deposito_id
+        )
+        .join(Deposito, Estoque.deposito_id == Deposito.id)
+        .join(Produto, Estoque.sku == Produto.sku)
+    )
+
+
+def _linha_estoque_atual(registro) -> Dict:
+    """Converte uma linha de _stmt_estoque_atual no dicionário retornado por consultar_estoque."""
+    return {
+        "Depósito": registro.Depósito,
+        "SKU": registro.Estoque.sku,
+        "Nome do Produto": registro.Produto,
+        "Quantidade": int(registro.Estoque.saldo)  # Usar o saldo ao invés da quantidade
+    }
+
+
 def consultar_estoque(sku=None, deposito_id=None):
     """
     Consulta o estoque, retornando o saldo atual com base no registro mais recente.
@@ -356,45 +683,9 @@ def consultar_estoque(sku=None, deposito_id=None):
     """
     try:
         with get_session() as db:
-            # Subquery para encontrar a data/hora mais recente de cada SKU e depósito
-            subquery = (
-                select(Estoque.sku, Estoque.deposito_id, func.max(Estoque.data_hora).label("max_data_hora"))
-                .group_by(Estoque.sku, Estoque.deposito_id)
-                .subquery()
-            )
-
-            # Query principal para selecionar os registros mais recentes
-            statement = (
-                select(
-                    Estoque,
-                    Deposito.nome.label("Depósito"),
-                    Produto.nome.label("Produto")
-                )
-                .join(Deposito, Estoque.deposito_id == Deposito.id)
-                .join(Produto, Estoque.sku == Produto.sku)
-                .join(subquery, and_(
-                    Estoque.sku == subquery.c.sku,
-                    Estoque.deposito_id == subquery.c.deposito_id,
-                    Estoque.data_hora == subquery.c.max_data_hora
-                ))
-            )
-            
-            if sku:
-                statement = statement.where(Estoque.sku == sku)
-            if deposito_id:
-                statement = statement.where(Estoque.deposito_id == deposito_id)
-            
-            resultados = db.exec(statement).all()
+            resultados = db.exec(_stmt_estoque_atual(sku, deposito_id)).all()
             
-            detalhado = [
-                {
-                    "Depósito": registro.Depósito,
-                    "SKU": registro.Estoque.sku,
-                    "Nome do Produto": registro.Produto,
-                    "Quantidade": int(registro.Estoque.saldo)  # Usar o saldo ao invés da quantidade
-                }
-                for registro in resultados
-            ]
+            detalhado = [_linha_estoque_atual(registro) for registro in resultados]
             
             total = len(detalhado)
             return total, detalhado
@@ -404,54 +695,219 @@ def consultar_estoque(sku=None, deposito_id=None):
         return 0, []    
 
 
+def _stmt_historico_tabela(
+    tabela,
+    sku: Optional[str],
+    deposito_id: Optional[int],
+    data_inicio: Optional[datetime],
+    data_fim: Optional[datetime],
+    cursor: Optional[Tuple[datetime, int]] = None,
+):
+    """Colunas do histórico de uma tabela (estoque ou estoque_arquivo) com os filtros aplicados."""
+    query = select(
+        tabela.id,
+        tabela.sku,
+        tabela.deposito_id,
+        tabela.quantidade,
+        tabela.tipo,
+        tabela.data_hora,
+        tabela.observacoes,
+        tabela.saldo,
+    )
+
+    if sku:
+        query = query.where(tabela.sku == sku)
+    if deposito_id:
+        query = query.where(tabela.deposito_id == deposito_id)
+    if data_inicio:
+        query = query.where(tabela.data_hora >= data_inicio)
+    if data_fim:
+        query = query.where(tabela.data_hora <= data_fim)
+    if cursor:
+        # O limite simples em data_hora é redundante com a comparação de tuplas, mas é o
+        # que o planejador usa para descartar as partições posteriores ao cursor
+        query = query.where(
+            tabela.data_hora <= cursor[0],
+            tuple_(tabela.data_hora, tabela.id) < tuple_(*cursor)
+        )
+
+    return query.order_by(tabela.data_hora.desc(), tabela.id.desc())
+
+
+def _stmt_historico(
+    sku: Optional[str] = None,
+    deposito_id: Optional[int] = None,
+    data_inicio: Optional[datetime] = None,
+    data_fim: Optional[datetime] = None,
+    cursor: Optional[Tuple[datetime, int]] = None,
+    limite: Optional[int] = None,
+    incluir_arquivo: bool = False,
+):
+    """
+    Monta a consulta filtrada do histórico, da movimentação mais recente para a mais antiga.
+    O id desempata registros com a mesma data/hora, o que torna a ordem total e estável
+    (necessário para a paginação por cursor).
+
+    Com incluir_arquivo, une as movimentações compactadas (estoque_arquivo), que mantêm
+    o id original; cada lado da união já vem ordenado e limitado pelo próprio índice.
+    """
+    query = _stmt_historico_tabela(Estoque, sku, deposito_id, data_inicio, data_fim, cursor)
+    if incluir_arquivo:
+        arquivo = _stmt_historico_tabela(EstoqueArquivo, sku, deposito_id, data_inicio, data_fim, cursor)
+        if limite:
+            query, arquivo = query.limit(limite), arquivo.limit(limite)
+        historico = union_all(
+            select(*query.subquery("ativo").c),
+            select(*arquivo.subquery("arquivo").c)
+        ).subquery("historico")
+        query = select(*historico.c).order_by(historico.c.data_hora.desc(), historico.c.id.desc())
+
+    return query.limit(limite) if limite else query
+
+
+def _registro_historico(registro) -> Dict:
+    """Converte uma linha do histórico (estoque ou estoque_arquivo) no dicionário usado pelo histórico."""
+    return {
+        "id": registro.id,
+        "sku": registro.sku,
+        "deposito_id": registro.deposito_id,
+        "quantidade": registro.quantidade,
+        "tipo": registro.tipo,
+        "data_hora": registro.data_hora,
+        "observacoes": registro.observacoes,
+        "saldo": registro.saldo,
+    }
+
+
 def consultar_historico_movimentacoes(
     sku: Optional[str] = None,
     deposito_id: Optional[int] = None,
     data_inicio: Optional[datetime] = None,
     data_fim: Optional[datetime] = None,
+    incluir_arquivo: bool = False,
 ) -> List[Dict]:
     """
     Consulta o histórico de movimentações de estoque, permitindo filtrar por SKU, depósito e período.
 
+    Carrega todo o resultado em memória; para períodos grandes prefira
+    consultar_historico_paginado ou iterar_historico_movimentacoes.
+
     Args:
         sku: SKU do produto para filtrar as movimentações.
         deposito_id: ID do depósito para filtrar as movimentações.
         data_inicio: Data de início para filtrar as movimentações.
         data_fim: Data de fim para filtrar as movimentações.
+        incluir_arquivo: Inclui as movimentações compactadas (ver compactacao_estoque).
 
     Returns:
         Uma lista de dicionários representando o histórico de movimentações.
     """
     with get_session() as session:
-        query = select(Estoque)
+        query = _stmt_historico(sku, deposito_id, data_inicio, data_fim, incluir_arquivo=incluir_arquivo)
+        historico = session.exec(query).all()
 
-        if sku:
-            query = query.where(Estoque.sku == sku)
-        if deposito_id:
-            query = query.where(Estoque.deposito_id == deposito_id)
-        if data_inicio:
-            query = query.where(Estoque.data_hora >= data_inicio)
-        if data_fim:
-            query = query.where(Estoque.data_hora <= data_fim)
+        # Converte as linhas do histórico para uma lista de dicionários
+        return [_registro_historico(registro) for registro in historico]
 
-        query = query.order_by(Estoque.data_hora.desc())
 
-        historico = session.exec(query).all()
-        
-        # Converte a lista de objetos Estoque para uma lista de dicionários
-        historico_lista = []
-        for registro in historico:
-            historico_lista.append({
-                "id": registro.id,
-                "sku": registro.sku,
-                "deposito_id": registro.deposito_id,
-                "quantidade": registro.quantidade,
-                "tipo": registro.tipo,
-                "data_hora": registro.data_hora,
-                "observacoes": registro.observacoes,
-                "saldo": registro.saldo,
-            })
-        
-        return historico_lista
+def consultar_historico_paginado(
+    sku: Optional[str] = None,
+    deposito_id: Optional[int] = None,
+    data_inicio: Optional[datetime] = None,
+    data_fim: Optional[datetime] = None,
+    cursor: Optional[Tuple[datetime, int]] = None,
+    tamanho_pagina: int = 100,
+    incluir_arquivo: bool = False,
+) -> Tuple[List[Dict], Optional[Tuple[datetime, int]]]:
+    """
+    Consulta uma página do histórico de movimentações usando paginação por cursor (keyset).
 
+    Em vez de OFFSET, cada página continua a partir do par (data_hora, id) do último
+    registro da página anterior. A consulta percorre o índice na ordem data_hora DESC,
+    id DESC e lê apenas as linhas da página, então o custo não cresce com a profundidade.
 
+    Args:
+        sku: SKU do produto para filtrar as movimentações.
+        deposito_id: ID do depósito para filtrar as movimentações.
+        data_inicio: Data de início para filtrar as movimentações.
+        data_fim: Data de fim para filtrar as movimentações.
+        cursor: Cursor (data_hora, id) devolvido pela página anterior; None para a primeira página.
+        tamanho_pagina: Quantidade máxima de registros por página.
+        incluir_arquivo: Inclui as movimentações compactadas (ver compactacao_estoque).
+
+    Returns:
+        Tupla (registros da página, cursor da próxima página). O cursor é None na última página.
+    """
+    with get_session() as session:
+        query = _stmt_pagina_historico(
+            sku, deposito_id, data_inicio, data_fim, cursor, tamanho_pagina, incluir_arquivo
+        )
+        return _montar_pagina_historico(session.exec(query).all(), tamanho_pagina)
+
+
+def _stmt_pagina_historico(
+    sku: Optional[str],
+    deposito_id: Optional[int],
+    data_inicio: Optional[datetime],
+    data_fim: Optional[datetime],
+    cursor: Optional[Tuple[datetime, int]],
+    tamanho_pagina: int,
+    incluir_arquivo: bool = False,
+):
+    """Consulta de uma página do histórico a partir do cursor (data_hora, id)."""
+    if tamanho_pagina <= 0:
+        raise ValueError("O tamanho da página deve ser positivo")
+
+    # Um registro a mais indica se existe próxima página, sem um COUNT separado
+    return _stmt_historico(sku, deposito_id, data_inicio, data_fim, cursor, tamanho_pagina + 1, incluir_arquivo)
+
+
+def _montar_pagina_historico(
+    registros: list,
+    tamanho_pagina: int
+) -> Tuple[List[Dict], Optional[Tuple[datetime, int]]]:
+    """Separa a página do registro excedente e calcula o cursor da próxima página."""
+    pagina = [_registro_historico(registro) for registro in registros[:tamanho_pagina]]
+    proximo_cursor = None
+    if len(registros) > tamanho_pagina:
+        proximo_cursor = (pagina[-1]["data_hora"], pagina[-1]["id"])
+
+    return pagina, proximo_cursor
+
+
+def iterar_historico_movimentacoes(
+    sku: Optional[str] = None,
+    deposito_id: Optional[int] = None,
+    data_inicio: Optional[datetime] = None,
+    data_fim: Optional[datetime] = None,
+    tamanho_lote: int = 1000,
+    incluir_arquivo: bool = False,
+) -> Iterator[Dict]:
+    """
+    Percorre o histórico de movimentações sob demanda, com memória constante.
+
+    Usa cursor no servidor (stream_results/yield_per): o banco envia os registros em
+    lotes de tamanho_lote à medida que o gerador é consumido. A sessão fica aberta até
+    o gerador terminar ou ser fechado, portanto consuma-o até o fim (ou chame close()).
+
+    Args:
+        sku: SKU do produto para filtrar as movimentações.
+        deposito_id: ID do depósito para filtrar as movimentações.
+        data_inicio: Data de início para filtrar as movimentações.
+        data_fim: Data de fim para filtrar as movimentações.
+        tamanho_lote: Quantidade de registros buscados do banco por vez.
+        incluir_arquivo: Inclui as movimentações compactadas (ver compactacao_estoque).
+
+    Yields:
+        Dicionários no mesmo formato de consultar_historico_movimentacoes.
+    """
+    with get_session() as session:
+        query = _stmt_historico(
+            sku, deposito_id, data_inicio, data_fim, incluir_arquivo=incluir_arquivo
+        ).execution_options(
+            stream_results=True,
+            yield_per=tamanho_lote
+        )
+        # Linhas de colunas (não entidades) não se acumulam no identity map da sessão
+        for registro in session.exec(query):
+            yield _registro_historico(registro)
@@ -1,8 +1,12 @@
 from sqlmodel import Session, select
-from typing import List, Optional
+from typing import Any, Dict, List, Optional, Union
+from sqlalchemy.dialects import postgresql, sqlite
 from .models import Produto
 from src.db.database import get_session
+from src.db.cache_estoque import cache_estoque
+from src.db.busca import buscar_produtos, indice_produtos
 import logging
+import pandas as pd
 
 # Configuração básica do logging
 logging.basicConfig(level=logging.DEBUG)
@@ -23,6 +27,7 @@ def criar_produto(sku: str, nome: str, descricao: Optional[str] = None) -> Produ
             novo_produto = Produto(sku=sku, nome=nome, descricao=descricao)
             session.add(novo_produto)
             session.commit()
+            indice_produtos.invalidar()
             session.refresh(novo_produto)
             
             logging.debug(f"Novo produto criado: {novo_produto}")
@@ -33,18 +38,18 @@ def criar_produto(sku: str, nome: str, descricao: Optional[str] = None) -> Produ
             session.rollback()  # Garante rollback em caso de erro
             raise
 
-def listar_produtos(filtro: Optional[str] = None) -> List[Produto]:
+def listar_produtos(filtro: Optional[str] = None, limite: Optional[int] = None) -> List[Produto]:
     """
     Lista produtos com filtro opcional por nome ou SKU.
-    Retorna uma lista de produtos ordenados pelo SKU.
+    Sem filtro, retorna todos os produtos ordenados pelo SKU; com filtro, retorna os
+    produtos ordenados por relevância (ver busca.buscar_produtos), até 'limite' se informado.
     """
+    if filtro and filtro.strip():
+        return buscar_produtos(filtro, limite)
+
     with get_session() as session:  # Gerencia a sessão automaticamente
         try:
-            query = select(Produto).order_by(Produto.sku)
-            if filtro:
-                query = query.where(Produto.nome.ilike(f"%{filtro}%") | Produto.sku.ilike(f"%{filtro}%"))
-            
-            return session.exec(query).all()
+            return session.exec(select(Produto).order_by(Produto.sku)).all()
         
         except Exception as e:
             logging.error(f"Erro ao listar produtos: {str(e)}", exc_info=True)
@@ -73,6 +78,8 @@ def atualizar_produto(
             
             session.add(produto)
             session.commit()
+            cache_estoque.limpar()  # O estoque em cache é indexado pelo nome do produto
+            indice_produtos.invalidar()
             session.refresh(produto)
             
             logging.debug(f"Produto atualizado: {produto}")
@@ -97,6 +104,8 @@ def deletar_produto(sku: str) -> bool:
             logging.debug(f"Tentando excluir produto com SKU: {sku}")
             session.delete(produto)
             session.commit()  # Confirma a transação
+            cache_estoque.limpar()  # O CASCADE remove o estoque do produto em todos os depósitos
+            indice_produtos.invalidar()
             
             return True
         
@@ -108,4 +117,117 @@ def deletar_produto(sku: str) -> bool:
         except Exception as e:
             logging.error(f"Erro inesperado ao deletar produto: {str(e)}", exc_info=True)
             session.rollback()  # Garante rollback em caso de erro
-            raise
\ No newline at end of file
+            raise
+
+
+# Colunas aceitas como nome do produto nos DataFrames das integrações:
+# "Nome" (Mercado Livre e Amazon) e "Produto" (Mercos)
+COLUNAS_NOME_PRODUTO = ("Nome", "Produto")
+
+
+def produtos_do_dataframe(df: pd.DataFrame) -> List[Dict[str, str]]:
+    """
+    Converte o DataFrame de estoque de uma integração (MercadoLivreAPI.gerar_relatorio_estoque,
+    AmazonAPI.gerar_relatorio_estoque ou MercosWebScraping.carrega_dados_mercos) em uma lista
+    de produtos {'sku', 'nome'}, sem SKUs vazios ou repetidos.
+    """
+    if df is None or df.empty:
+        return []
+
+    coluna_nome = next((coluna for coluna in COLUNAS_NOME_PRODUTO if coluna in df.columns), None)
+    if "SKU" not in df.columns or coluna_nome is None:
+        raise ValueError(f"O DataFrame deve ter a coluna 'SKU' e uma das colunas {COLUNAS_NOME_PRODUTO}")
+
+    dados = pd.DataFrame({
+        "sku": df["SKU"].astype("string").fillna("").str.strip().str[:50],
+        "nome": df[coluna_nome].astype("string").fillna("").str.strip().str[:200],
+    })
+    dados = dados[dados["sku"] != ""]
+    dados["nome"] = dados["nome"].mask(dados["nome"] == "", dados["sku"])  # nome é obrigatório
+
+    # Variações podem repetir o SKU no mesmo relatório: fica a primeira ocorrência
+    return dados.drop_duplicates(subset="sku").to_dict("records")
+
+
+def _stmt_upsert_produtos(dialeto: str, atualizar_nomes: bool):
+    """INSERT ... ON CONFLICT (sku) DO UPDATE (ou DO NOTHING) no dialeto da sessão."""
+    modulo = postgresql if dialeto == "postgresql" else sqlite
+    stmt = modulo.insert(Produto)
+    if not atualizar_nomes:
+        return stmt.on_conflict_do_nothing(index_elements=[Produto.sku])
+    return stmt.on_conflict_do_update(
+        index_elements=[Produto.sku],
+        set_={"nome": stmt.excluded.nome},
+        where=Produto.nome != stmt.excluded.nome
+    )
+
+
+def sincronizar_produtos(
+    produtos: Union[pd.DataFrame, List[Dict[str, Any]]],
+    atualizar_nomes: bool = True,
+    tamanho_lote: int = 1000
+) -> Dict[str, int]:
+    """
+    Cadastra ou atualiza em massa os produtos recebidos, em uma única transação.
+
+    Cada lote faz uma consulta dos SKUs já existentes (para a contagem) e um único
+    INSERT ... ON CONFLICT (sku) DO UPDATE apenas com os produtos novos ou alterados.
+
+    Args:
+        produtos: DataFrame de uma integração (ver produtos_do_dataframe) ou lista de
+            dicionários com as chaves 'sku' e 'nome'. Na lista, um SKU repetido fica com
+            o nome da última ocorrência.
+        atualizar_nomes: Se False, produtos já cadastrados não têm o nome alterado.
+        tamanho_lote: Quantidade de produtos por comando.
+
+    Returns:
+        Dicionário com as contagens 'inseridos', 'atualizados' e 'inalterados'.
+    """
+    if isinstance(produtos, pd.DataFrame):
+        produtos = produtos_do_dataframe(produtos)
+    else:
+        # O mesmo SKU duas vezes no comando faria o ON CONFLICT do PostgreSQL falhar
+        # (e seria contado duas vezes): fica a última ocorrência
+        produtos = list({produto["sku"]: produto for produto in produtos}.values())
+    if tamanho_lote <= 0:
+        raise ValueError("O tamanho do lote deve ser positivo")
+
+    contagem = {"inseridos": 0, "atualizados": 0, "inalterados": 0}
+
+    with get_session() as session:  # Gerencia a sessão automaticamente
+        try:
+            stmt = _stmt_upsert_produtos(session.get_bind().dialect.name, atualizar_nomes)
+
+            for inicio in range(0, len(produtos), tamanho_lote):
+                lote = produtos[inicio:inicio + tamanho_lote]
+                existentes = dict(session.exec(
+                    select(Produto.sku, Produto.nome).where(Produto.sku.in_([p["sku"] for p in lote]))
+                ).all())
+
+                alterados = []
+                for produto in lote:
+                    nome_atual = existentes.get(produto["sku"])
+                    if nome_atual is None:
+                        contagem["inseridos"] += 1
+                    elif atualizar_nomes and nome_atual != produto["nome"]:
+                        contagem["atualizados"] += 1
+                    else:
+                        contagem["inalterados"] += 1
+                        continue
+                    alterados.append({"sku": produto["sku"], "nome": produto["nome"]})
+
+                if alterados:
+                    session.exec(stmt, params=alterados)
+
+            session.commit()
+            indice_produtos.invalidar()
+            if contagem["atualizados"]:
+                cache_estoque.limpar()  # O estoque em cache é indexado pelo nome do produto
+
+            logging.debug(f"Produtos sincronizados: {contagem}")
+            return contagem
+
+        except Exception as e:
+            logging.error(f"Erro ao sincronizar produtos: {str(e)}", exc_info=True)
+            session.rollback()  # Garante rollback em caso de erro
+            raise
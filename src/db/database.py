@@ -1,6 +1,11 @@
 from sqlmodel import SQLModel, Session, create_engine
+from sqlalchemy import text
+from sqlalchemy.engine import Engine
 from dotenv import load_dotenv
+from typing import Optional
+import logging
 import os
+import threading
 from urllib.parse import urlparse
 
 # Carrega variáveis do .env
@@ -16,10 +21,108 @@ parsed_url = urlparse(DATABASE_URL)
 if parsed_url.scheme == "postgres":
     DATABASE_URL = DATABASE_URL.replace("postgres://", "postgresql://")
 
-#engine = create_engine(DATABASE_URL, echo=True)
-# Configuração para SSL
-ssl_mode = 'require'  # Ou 'verify-full' dependendo da sua necessidade
-engine = create_engine(DATABASE_URL, echo=True, connect_args={'sslmode': ssl_mode})
+
+def _env_bool(nome: str, padrao: bool) -> bool:
+    valor = os.getenv(nome)
+    if valor is None:
+        return padrao
+    return valor.strip().lower() in ("1", "true", "sim", "yes", "on")
+
+
+def _env_int(nome: str, padrao: int) -> int:
+    valor = os.getenv(nome)
+    return int(valor) if valor else padrao
+
+
+def criar_engine(
+    url: str = DATABASE_URL,
+    *,
+    pool_size: Optional[int] = None,
+    max_overflow: Optional[int] = None,
+    pool_timeout: Optional[int] = None,
+    pool_recycle: Optional[int] = None,
+    pool_pre_ping: Optional[bool] = None,
+    echo: Optional[bool] = None,
+    sslmode: Optional[str] = None,
+    connect_timeout: Optional[int] = None,
+    keepalives_idle: Optional[int] = None,
+) -> Engine:
+    """
+    Cria o engine do banco com pool e parâmetros de conexão configuráveis.
+
+    Os argumentos não informados vêm das variáveis de ambiente (DB_POOL_SIZE, DB_MAX_OVERFLOW,
+    DB_POOL_TIMEOUT, DB_POOL_RECYCLE, DB_POOL_PRE_PING, DB_ECHO, DB_SSLMODE, DB_CONNECT_TIMEOUT,
+    DB_KEEPALIVES_IDLE). Os padrões consideram o Neon, que suspende o compute ocioso e
+    derruba as conexões abertas:
+        - pool_pre_ping testa a conexão antes de usá-la e reconecta se ela tiver caído;
+        - pool_recycle (300 s) descarta conexões antes do tempo de suspensão do Neon;
+        - keepalives TCP detectam conexões mortas sem esperar o timeout do sistema;
+        - echo (log de todo SQL) fica desligado, salvo se pedido.
+    """
+    echo = _env_bool("DB_ECHO", False) if echo is None else echo
+
+    if not url.startswith("postgresql"):
+        # SQLite (testes/uso local): sem pool de conexões nem parâmetros do libpq
+        return create_engine(url, echo=echo)
+
+    connect_args = {
+        "sslmode": sslmode or os.getenv("DB_SSLMODE", "require"),
+        "connect_timeout": connect_timeout if connect_timeout is not None else _env_int("DB_CONNECT_TIMEOUT", 10),
+        "keepalives": 1,
+        "keepalives_idle": keepalives_idle if keepalives_idle is not None else _env_int("DB_KEEPALIVES_IDLE", 30),
+        "keepalives_interval": 10,
+        "keepalives_count": 3,
+        "application_name": "app_dv_smartshop",
+    }
+
+    return create_engine(
+        url,
+        echo=echo,
+        pool_size=pool_size if pool_size is not None else _env_int("DB_POOL_SIZE", 5),
+        max_overflow=max_overflow if max_overflow is not None else _env_int("DB_MAX_OVERFLOW", 5),
+        pool_timeout=pool_timeout if pool_timeout is not None else _env_int("DB_POOL_TIMEOUT", 30),
+        pool_recycle=pool_recycle if pool_recycle is not None else _env_int("DB_POOL_RECYCLE", 300),
+        pool_pre_ping=pool_pre_ping if pool_pre_ping is not None else _env_bool("DB_POOL_PRE_PING", True),
+        pool_use_lifo=True,  # Reutiliza as conexões mais recentes e deixa as ociosas expirarem
+        connect_args=connect_args,
+    )
+
+
+engine = criar_engine()
+
+
+def aquecer_engine(engine_alvo: Optional[Engine] = None, conexoes: int = 1, em_segundo_plano: bool = False) -> None:
+    """
+    Abre conexões no pool e executa SELECT 1 para acordar o banco (o compute do Neon pode
+    estar suspenso) e pagar conexão/TLS antes da primeira consulta do usuário.
+
+    Args:
+        engine_alvo: Engine a aquecer (padrão: o engine do módulo).
+        conexoes: Quantidade de conexões abertas e devolvidas ao pool.
+        em_segundo_plano: Se True, aquece em uma thread e retorna imediatamente.
+    """
+    engine_alvo = engine_alvo or engine
+
+    def aquecer():
+        # As conexões ficam abertas ao mesmo tempo para que o pool realmente crie "conexoes" delas
+        abertas = []
+        try:
+            for _ in range(conexoes):
+                conexao = engine_alvo.connect()
+                abertas.append(conexao)
+                conexao.execute(text("SELECT 1"))
+            logging.debug(f"Engine aquecido com {conexoes} conexão(ões)")
+        except Exception as e:
+            logging.warning(f"Falha ao aquecer conexões com o banco: {str(e)}")
+        finally:
+            for conexao in abertas:
+                conexao.close()  # Devolve a conexão ao pool
+
+    if em_segundo_plano:
+        threading.Thread(target=aquecer, name="aquecer-engine", daemon=True).start()
+    else:
+        aquecer()
+
 
 def init_db():
     """Cria todas as tabelas no banco de dados"""
@@ -30,4 +133,4 @@ def get_session():
     Retorna uma nova sessão de banco de dados.
     Use um bloco 'with' para garantir que a sessão seja fechada automaticamente.
     """
-    return Session(engine)
\ No newline at end of file
+    return Session(engine)
@@ -0,0 +1,145 @@
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import AsyncEngine, create_async_engine
+from sqlmodel.ext.asyncio.session import AsyncSession
+from typing import Optional
+import asyncio
+import atexit
+import os
+import threading
+
+from src.db.database import DATABASE_URL, _env_bool, _env_int
+
+# Parâmetros do libpq que o asyncpg não aceita na URL
+_PARAMETROS_LIBPQ = ("sslmode", "channel_binding", "connect_timeout", "options")
+
+
+def _url_async(url: str):
+    """
+    Converte a URL síncrona (psycopg2/SQLite) para o driver assíncrono equivalente:
+    postgresql -> postgresql+asyncpg e sqlite -> sqlite+aiosqlite.
+    O sslmode da URL (comum nas URLs do Neon) vira o argumento ssl do asyncpg.
+    """
+    url_obj = make_url(url)
+    if url_obj.get_backend_name() == "sqlite":
+        return url_obj.set(drivername="sqlite+aiosqlite"), {}
+
+    sslmode = url_obj.query.get("sslmode")
+    url_obj = url_obj.set(drivername="postgresql+asyncpg").difference_update_query(_PARAMETROS_LIBPQ)
+    return url_obj, {"sslmode": sslmode}
+
+
+def criar_engine_async(
+    url: str = DATABASE_URL,
+    *,
+    pool_size: Optional[int] = None,
+    max_overflow: Optional[int] = None,
+    pool_timeout: Optional[int] = None,
+    pool_recycle: Optional[int] = None,
+    pool_pre_ping: Optional[bool] = None,
+    echo: Optional[bool] = None,
+    sslmode: Optional[str] = None,
+    connect_timeout: Optional[int] = None,
+) -> AsyncEngine:
+    """
+    Cria o engine assíncrono (asyncpg) com as mesmas configurações de pool de
+    database.criar_engine, lidas das mesmas variáveis de ambiente DB_*.
+    """
+    url_obj, parametros_url = _url_async(url)
+    echo = _env_bool("DB_ECHO", False) if echo is None else echo
+
+    if url_obj.get_backend_name() == "sqlite":
+        return create_async_engine(url_obj, echo=echo)
+
+    connect_args = {
+        "ssl": sslmode or parametros_url.get("sslmode") or os.getenv("DB_SSLMODE", "require"),
+        "timeout": connect_timeout if connect_timeout is not None else _env_int("DB_CONNECT_TIMEOUT", 10),
+        "server_settings": {"application_name": "app_dv_smartshop"},
+    }
+
+    return create_async_engine(
+        url_obj,
+        echo=echo,
+        pool_size=pool_size if pool_size is not None else _env_int("DB_POOL_SIZE", 5),
+        max_overflow=max_overflow if max_overflow is not None else _env_int("DB_MAX_OVERFLOW", 5),
+        pool_timeout=pool_timeout if pool_timeout is not None else _env_int("DB_POOL_TIMEOUT", 30),
+        pool_recycle=pool_recycle if pool_recycle is not None else _env_int("DB_POOL_RECYCLE", 300),
+        pool_pre_ping=pool_pre_ping if pool_pre_ping is not None else _env_bool("DB_POOL_PRE_PING", True),
+        pool_use_lifo=True,
+        connect_args=connect_args,
+    )
+
+
+class LoopBanco:
+    """
+    Event loop próprio do acesso assíncrono ao banco, em uma thread daemon, com um único
+    engine assíncrono por processo.
+
+    As conexões do asyncpg pertencem ao loop em que foram abertas, então o engine (e o
+    pool) só pode ser usado nesse loop: o código síncrono executa as corrotinas de
+    crud_async com executar(), e cada asyncio.run do Streamlit reaproveita o mesmo pool.
+    """
+
+    def __init__(self, url: str = DATABASE_URL):
+        self.url = url
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._thread: Optional[threading.Thread] = None
+        self._engine: Optional[AsyncEngine] = None
+        self._lock = threading.Lock()
+
+    def _start(self) -> asyncio.AbstractEventLoop:
+        """Inicia o loop e a thread na primeira utilização"""
+        with self._lock:
+            if self._loop is None:
+                self._loop = asyncio.new_event_loop()
+                self._thread = threading.Thread(
+                    target=self._loop.run_forever, name="banco-async", daemon=True
+                )
+                self._thread.start()
+            return self._loop
+
+    @property
+    def engine(self) -> AsyncEngine:
+        """O engine assíncrono do processo (usar apenas em corrotinas executadas por executar())"""
+        if self._loop is None or threading.current_thread() is not self._thread:
+            raise RuntimeError("O engine assíncrono só pode ser usado no loop do banco; use executar()")
+        if self._engine is None:
+            self._engine = criar_engine_async(self.url)
+        return self._engine
+
+    def executar(self, coro):
+        """Executa a corrotina no loop do banco e aguarda o resultado (ponte para o código síncrono)"""
+        loop = self._start()
+        if threading.current_thread() is self._thread:
+            coro.close()
+            raise RuntimeError("LoopBanco.executar() chamado de dentro do próprio loop; use await")
+        return asyncio.run_coroutine_threadsafe(coro, loop).result()
+
+    def encerrar(self) -> None:
+        """Descarta o engine (fecha as conexões do pool) e encerra o loop"""
+        if self._loop is None:
+            return
+        if self._engine is not None:
+            self.executar(self._engine.dispose())
+            self._engine = None
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join()
+        self._loop.close()
+        self._loop = self._thread = None
+
+
+# Instância compartilhada pelo processo; o pool é fechado ao encerrar o interpretador
+loop_banco = LoopBanco()
+atexit.register(loop_banco.encerrar)
+
+
+def executar(coro):
+    """Executa uma corrotina de crud_async no loop do banco e retorna o resultado."""
+    return loop_banco.executar(coro)
+
+
+def get_session_async() -> AsyncSession:
+    """
+    Retorna uma nova sessão assíncrona. Use com 'async with' e não compartilhe a mesma
+    sessão entre tarefas concorrentes (cada consulta paralela abre a sua).
+    """
+    return AsyncSession(loop_banco.engine, expire_on_commit=False)
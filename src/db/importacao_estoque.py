@@ -0,0 +1,485 @@
+"""
+Importação em massa de movimentações de estoque (livro legado, contagem de inventário).
+
+O arquivo (CSV ou Parquet) é lido em lotes, validado em memória contra os SKUs e
+depósitos cadastrados e gravado na tabela estoque com COPY (copy_expert do psycopg2),
+em vez de passar linha a linha por registrar_movimentacao. O saldo de cada linha é
+calculado depois, em um único UPDATE com funções de janela sobre os pares importados;
+em seguida saldo_estoque, os snapshots afetados e o cache de estoque são atualizados.
+Tudo ocorre em uma única transação: um erro em qualquer lote desfaz a importação inteira.
+
+Colunas do arquivo: sku, deposito_id, quantidade, tipo (Entrada, Saída ou Balanço) e,
+opcionalmente, data_hora e observacoes. Sem data_hora, as linhas recebem o instante da
+importação somado à sua posição no arquivo em microssegundos, mantendo a ordem do arquivo.
+
+Uso:
+    python -m src.db.importacao_estoque movimentacoes.csv [--tamanho-lote 100000]
+"""
+import argparse
+import io
+import logging
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, Iterator, Optional, Set
+from zoneinfo import ZoneInfo
+
+import pandas as pd
+from sqlalchemy import (
+    TIMESTAMP, Column, Integer, MetaData, String, Table,
+    case, cast, delete, func, insert, literal, null, text, tuple_, union_all, update,
+)
+from sqlalchemy.orm import aliased
+from sqlmodel import Session, select
+
+from src.db.cache_estoque import cache_estoque
+from src.db.compactacao_estoque import limite_compactacao
+from src.db.database import get_session
+from .models import Deposito, Estoque, Produto, SaldoEstoque, SaldoSnapshot, TipoEstoque
+
+COLUNAS_OBRIGATORIAS = ("sku", "deposito_id", "quantidade", "tipo")
+
+# Ordem das colunas enviadas no COPY
+COLUNAS_COPY = ("sku", "deposito_id", "quantidade", "tipo", "data_hora", "observacoes")
+
+# Tipos aceitos no arquivo, sem diferenciar maiúsculas de minúsculas
+_TIPOS = {tipo.value.lower(): tipo.value for tipo in TipoEstoque}
+
+# Quantidade máxima de linhas inválidas citadas na mensagem de erro
+_EXEMPLOS_ERRO = 5
+
+# Tabela temporária que recebe o COPY. As linhas passam dela para estoque já com o saldo
+# calculado, de modo que cada linha é gravada uma única vez na tabela (e nos seus índices)
+_estoque_importacao = Table(
+    "estoque_importacao",
+    MetaData(),
+    Column("ordem", Integer, primary_key=True),  # Ordem no arquivo: desempata a mesma data/hora
+    Column("sku", String(50)),
+    Column("deposito_id", Integer),
+    Column("quantidade", Integer),
+    Column("tipo", String(50)),
+    Column("data_hora", TIMESTAMP(timezone=True)),
+    Column("observacoes", String(200)),
+    prefixes=["TEMPORARY"],
+    postgresql_on_commit="DROP",
+)
+
+
+def _ler_lotes(caminho: str, tamanho_lote: int) -> Iterator[pd.DataFrame]:
+    """Lê o arquivo em DataFrames de até tamanho_lote linhas, sem carregá-lo inteiro na memória."""
+    if Path(caminho).suffix.lower() in (".parquet", ".pq"):
+        import pyarrow.parquet as pq
+
+        for lote in pq.ParquetFile(caminho).iter_batches(batch_size=tamanho_lote):
+            yield lote.to_pandas()
+    else:
+        yield from pd.read_csv(caminho, chunksize=tamanho_lote, dtype={"sku": str, "observacoes": str})
+
+
+def _erro_validacao(mensagem: str, invalidas: pd.Series, primeira_linha: int) -> ValueError:
+    """Monta o erro citando as primeiras linhas (numeradas a partir de 1, sem o cabeçalho) inválidas."""
+    linhas = [str(primeira_linha + posicao) for posicao in invalidas[invalidas].index[:_EXEMPLOS_ERRO]]
+    return ValueError(f"{mensagem} em {int(invalidas.sum())} linha(s) (ex.: linhas {', '.join(linhas)})")
+
+
+def _validar_lote(
+    df: pd.DataFrame,
+    skus: Set[str],
+    depositos: Set[int],
+    primeira_linha: int,
+    agora: datetime
+) -> pd.DataFrame:
+    """
+    Valida um lote contra os SKUs e depósitos cadastrados e o normaliza nas colunas do COPY.
+    Levanta ValueError na primeira regra violada, citando as linhas inválidas.
+    """
+    faltantes = [coluna for coluna in COLUNAS_OBRIGATORIAS if coluna not in df.columns]
+    if faltantes:
+        raise ValueError(f"Colunas obrigatórias ausentes no arquivo: {', '.join(faltantes)}")
+
+    df = df.reset_index(drop=True)
+
+    sku = df["sku"].astype("string").str.strip()
+    invalidas = ~sku.isin(skus).fillna(False).astype(bool)
+    if invalidas.any():
+        raise _erro_validacao("Produto inválido", invalidas, primeira_linha)
+
+    deposito_id = pd.to_numeric(df["deposito_id"], errors="coerce")
+    invalidas = ~deposito_id.isin(depositos)
+    if invalidas.any():
+        raise _erro_validacao("Depósito inválido", invalidas, primeira_linha)
+
+    quantidade = pd.to_numeric(df["quantidade"], errors="coerce")
+    invalidas = quantidade.isna() | (quantidade < 0) | (quantidade % 1 != 0)
+    if invalidas.any():
+        raise _erro_validacao("Quantidade inválida (deve ser um inteiro não negativo)", invalidas, primeira_linha)
+
+    tipo = df["tipo"].astype("string").str.strip().str.lower().map(_TIPOS)
+    invalidas = tipo.isna()
+    if invalidas.any():
+        raise _erro_validacao(f"Tipo inválido (use {', '.join(_TIPOS.values())})", invalidas, primeira_linha)
+
+    # Linhas sem data/hora: instante da importação + posição no arquivo (em microssegundos),
+    # para não empatarem entre si (um balanço no meio do arquivo separa o antes do depois)
+    instantes = pd.Series(
+        pd.Timestamp(agora) + pd.to_timedelta(primeira_linha + df.index, unit="us"), index=df.index
+    )
+    if "data_hora" in df.columns:
+        data_hora = pd.to_datetime(df["data_hora"], errors="coerce")
+        invalidas = data_hora.isna() & df["data_hora"].notna()
+        if invalidas.any():
+            raise _erro_validacao("Data/hora inválida", invalidas, primeira_linha)
+        if data_hora.dt.tz is not None:
+            # Mesmo padrão das demais gravações: horário de São Paulo, sem fuso
+            data_hora = data_hora.dt.tz_convert("America/Sao_Paulo").dt.tz_localize(None)
+        data_hora = data_hora.fillna(instantes)
+    else:
+        data_hora = instantes
+
+    if "observacoes" in df.columns:
+        observacoes = df["observacoes"].astype("string").str.strip().str[:200]
+    else:
+        observacoes = pd.Series(pd.NA, index=df.index, dtype="string")
+
+    return pd.DataFrame({
+        "sku": sku,
+        "deposito_id": deposito_id.astype("int64"),
+        "quantidade": quantidade.astype("int64"),
+        "tipo": tipo,
+        "data_hora": data_hora,
+        "observacoes": observacoes,
+    })
+
+
+def _copiar_lote(session: Session, lote: pd.DataFrame) -> None:
+    """Grava o lote na tabela temporária: COPY no PostgreSQL, INSERT em lote nos demais bancos."""
+    if session.get_bind().dialect.name == "postgresql":
+        buffer = io.StringIO()
+        # Campos vazios sem aspas viram NULL no COPY em formato CSV (observações ausentes)
+        lote.to_csv(buffer, index=False, header=False, date_format="%Y-%m-%d %H:%M:%S.%f")
+        buffer.seek(0)
+        # O cursor é da mesma conexão da sessão, então o COPY entra na transação da importação
+        with session.connection().connection.cursor() as cursor:
+            cursor.copy_expert(
+                f"COPY {_estoque_importacao.name} ({', '.join(COLUNAS_COPY)}) FROM STDIN WITH (FORMAT csv)",
+                buffer
+            )
+    else:
+        registros = lote.astype(object).where(lote.notna(), None).to_dict("records")
+        session.execute(insert(_estoque_importacao), registros)
+
+
+def _pares_importados():
+    """Pares (sku, depósito) presentes no arquivo importado."""
+    return select(_estoque_importacao.c.sku, _estoque_importacao.c.deposito_id).distinct()
+
+
+def _stmt_saldos_recalculados():
+    """
+    Saldo de cada linha dos pares importados, somando as linhas já existentes e as do arquivo.
+
+    Cada balanço abre um segmento (contagem acumulada de balanços do par); dentro do
+    segmento o saldo é a soma acumulada do balanço e das entradas/saídas posteriores.
+    Na mesma data/hora, as linhas existentes vêm antes das importadas, e estas na ordem do arquivo.
+    """
+    existentes = (
+        select(
+            Estoque.id,
+            literal(0).label("origem"),
+            Estoque.id.label("ordem"),
+            Estoque.sku,
+            Estoque.deposito_id,
+            Estoque.quantidade,
+            Estoque.tipo,
+            Estoque.data_hora,
+            Estoque.observacoes,
+            Estoque.saldo.label("saldo_atual")
+        )
+        .where(tuple_(Estoque.sku, Estoque.deposito_id).in_(_pares_importados()))
+    )
+    importadas = select(
+        cast(null(), Integer).label("id"),
+        literal(1).label("origem"),
+        _estoque_importacao.c.ordem,
+        _estoque_importacao.c.sku,
+        _estoque_importacao.c.deposito_id,
+        _estoque_importacao.c.quantidade,
+        _estoque_importacao.c.tipo,
+        _estoque_importacao.c.data_hora,
+        _estoque_importacao.c.observacoes,
+        cast(null(), Integer).label("saldo_atual")
+    )
+    todas = union_all(existentes, importadas).subquery("todas")
+
+    eh_balanco = todas.c.tipo == TipoEstoque.BALANCO.value
+    ordem = (todas.c.data_hora, todas.c.origem, todas.c.ordem)
+    segmentos = (
+        select(
+            todas,
+            case(
+                (eh_balanco, todas.c.quantidade),
+                (todas.c.tipo == TipoEstoque.ENTRADA.value, todas.c.quantidade),
+                (todas.c.tipo == TipoEstoque.SAIDA.value, -todas.c.quantidade),
+                else_=0
+            ).label("movimento"),
+            func.count(case((eh_balanco, 1))).over(
+                partition_by=(todas.c.sku, todas.c.deposito_id),
+                order_by=ordem
+            ).label("segmento")
+        )
+        .subquery("segmentos")
+    )
+    return (
+        select(
+            segmentos,
+            func.sum(segmentos.c.movimento).over(
+                partition_by=(segmentos.c.sku, segmentos.c.deposito_id, segmentos.c.segmento),
+                order_by=(segmentos.c.data_hora, segmentos.c.origem, segmentos.c.ordem)
+            ).label("saldo")
+        )
+        .subquery("recalculadas")
+    )
+
+
+def _gravar_movimentacoes(session: Session) -> None:
+    """
+    Passa as linhas da tabela temporária para estoque já com o saldo calculado e corrige o
+    saldo das linhas existentes posteriores a elas (as importadas podem ser mais antigas).
+    """
+    recalculadas = _stmt_saldos_recalculados()
+    session.execute(
+        update(Estoque)
+        .where(
+            Estoque.id == recalculadas.c.id,
+            Estoque.data_hora == recalculadas.c.data_hora,  # chave primária completa (particionada)
+            recalculadas.c.origem == 0,
+            recalculadas.c.saldo != recalculadas.c.saldo_atual
+        )
+        .values(saldo=recalculadas.c.saldo)
+        .execution_options(synchronize_session=False)
+    )
+
+    colunas = ["sku", "deposito_id", "quantidade", "tipo", "data_hora", "observacoes", "saldo"]
+    session.execute(
+        insert(Estoque).from_select(
+            colunas,
+            select(*(recalculadas.c[coluna] for coluna in colunas))
+            .where(recalculadas.c.origem == 1)
+            .order_by(recalculadas.c.ordem)  # ids na ordem do arquivo
+        )
+    )
+
+
+def _criar_particoes(session: Session) -> None:
+    """
+    No estoque particionado (migração 4 de create_schema.py), cria as partições mensais
+    do período do arquivo que ainda não existem, para as linhas não irem para a partição padrão.
+    As datas do arquivo (horário de São Paulo sem fuso) ficam gravadas como UTC, o mesmo
+    critério dos limites das partições.
+    """
+    if session.exec(select(func.to_regprocedure("criar_particoes_estoque(date, date)"))).one() is None:
+        return
+    session.execute(text(f"""
+        SELECT criar_particoes_estoque(
+            (min(data_hora) AT TIME ZONE 'UTC')::date,
+            (max(data_hora) AT TIME ZONE 'UTC')::date
+        )
+        FROM {_estoque_importacao.name}
+    """))
+
+
+def _stmt_saldos_finais(ate: Optional[datetime] = None):
+    """
+    Saldo da última linha de cada par importado (até a data informada), buscada pelo
+    índice ix_estoque_sku_deposito_data_hora, como em _stmt_ultimas_movimentacoes.
+    """
+    pares = _pares_importados().subquery("pares")
+    anterior = aliased(Estoque)
+    ultimo_id = (
+        select(anterior.id)
+        .where(anterior.sku == pares.c.sku, anterior.deposito_id == pares.c.deposito_id)
+        .order_by(anterior.data_hora.desc(), anterior.id.desc())
+        .limit(1)
+    )
+    if ate is not None:
+        ultimo_id = ultimo_id.where(anterior.data_hora <= ate)
+
+    return (
+        select(pares.c.sku, pares.c.deposito_id, Estoque.saldo)
+        .select_from(pares)
+        .join(Estoque, Estoque.id == ultimo_id.correlate(pares).scalar_subquery())
+    )
+
+
+def _verificar_limite_compactacao(session: Session) -> None:
+    """
+    Rejeita movimentações até o limite da última compactação: elas ficariam antes do
+    Balanço sintético do par e não entrariam no saldo.
+    """
+    limite = limite_compactacao(session)
+    if limite is None:
+        return
+    anteriores = session.exec(
+        select(func.count()).where(_estoque_importacao.c.data_hora <= limite)
+    ).one()
+    if anteriores:
+        raise ValueError(
+            f"{anteriores} movimentação(ões) com data até {limite}, período já compactado "
+            f"(ver compactacao_estoque)"
+        )
+
+
+def _verificar_saldos_negativos(session: Session) -> None:
+    """Rejeita a importação se alguma saída deixar o saldo de um par negativo."""
+    negativos = session.exec(
+        select(Estoque.sku, Estoque.deposito_id, func.min(Estoque.saldo))
+        .where(
+            tuple_(Estoque.sku, Estoque.deposito_id).in_(_pares_importados()),
+            Estoque.saldo < 0
+        )
+        .group_by(Estoque.sku, Estoque.deposito_id)
+        .order_by(Estoque.sku, Estoque.deposito_id)
+        .limit(_EXEMPLOS_ERRO)
+    ).all()
+    if negativos:
+        pares = ", ".join(f"{sku}/depósito {deposito_id} ({saldo})" for sku, deposito_id, saldo in negativos)
+        raise ValueError(f"Saldo insuficiente: a importação deixaria saldo negativo em {pares}")
+
+
+def _atualizar_saldos_materializados(session: Session) -> None:
+    """Regrava em saldo_estoque o saldo final de cada par importado."""
+    session.execute(
+        delete(SaldoEstoque)
+        .where(tuple_(SaldoEstoque.sku, SaldoEstoque.deposito_id).in_(_pares_importados()))
+        .execution_options(synchronize_session=False)
+    )
+    session.execute(
+        insert(SaldoEstoque).from_select(["sku", "deposito_id", "saldo"], _stmt_saldos_finais())
+    )
+
+
+def _atualizar_snapshots(session: Session) -> None:
+    """Regrava, para os pares importados, os snapshots posteriores à movimentação mais antiga do arquivo."""
+    a_partir_de = session.exec(select(func.min(_estoque_importacao.c.data_hora))).one()
+    datas = session.exec(
+        select(SaldoSnapshot.data_referencia)
+        .where(SaldoSnapshot.data_referencia >= a_partir_de)
+        .distinct()
+    ).all()
+
+    for data_referencia in datas:
+        session.execute(
+            delete(SaldoSnapshot)
+            .where(
+                SaldoSnapshot.data_referencia == data_referencia,
+                tuple_(SaldoSnapshot.sku, SaldoSnapshot.deposito_id).in_(_pares_importados())
+            )
+            .execution_options(synchronize_session=False)
+        )
+        saldos = _stmt_saldos_finais(ate=data_referencia).subquery("saldos")
+        session.execute(
+            insert(SaldoSnapshot).from_select(
+                ["sku", "deposito_id", "data_referencia", "saldo"],
+                select(
+                    saldos.c.sku,
+                    saldos.c.deposito_id,
+                    literal(data_referencia, SaldoSnapshot.__table__.c.data_referencia.type),
+                    saldos.c.saldo
+                ).where(saldos.c.saldo != 0)  # Snapshots não guardam saldos zerados
+            )
+        )
+
+
+def importar_movimentacoes(
+    caminho: str,
+    tamanho_lote: int = 100_000,
+    permitir_saldo_negativo: bool = False
+) -> Dict[str, int]:
+    """
+    Importa em massa as movimentações de um arquivo CSV ou Parquet para a tabela estoque.
+
+    Args:
+        caminho: Arquivo .csv ou .parquet com as colunas sku, deposito_id, quantidade,
+            tipo e, opcionalmente, data_hora e observacoes.
+        tamanho_lote: Linhas lidas, validadas e copiadas por vez.
+        permitir_saldo_negativo: Se False, a importação é rejeitada quando alguma saída
+            deixa o saldo de um par negativo (a mesma regra de registrar_movimentacao).
+
+    Returns:
+        Dicionário com as contagens 'linhas', 'pares' e 'depositos' importados.
+
+    Raises:
+        ValueError: Se o arquivo tiver colunas ausentes, SKUs/depósitos não cadastrados,
+            quantidades, tipos ou datas inválidos, ou saldo negativo. Nada é gravado.
+    """
+    if tamanho_lote <= 0:
+        raise ValueError("O tamanho do lote deve ser positivo")
+
+    agora = datetime.now(ZoneInfo("America/Sao_Paulo")).replace(tzinfo=None)
+
+    with get_session() as session:
+        try:
+            if session.get_bind().dialect.name == "postgresql":
+                # Impede outras movimentações (as leituras continuam) até o saldo ser recalculado
+                session.execute(text("LOCK TABLE estoque IN SHARE ROW EXCLUSIVE MODE"))
+
+            skus = set(session.exec(select(Produto.sku)).all())
+            depositos = set(session.exec(select(Deposito.id)).all())
+
+            conexao = session.connection()
+            _estoque_importacao.drop(conexao, checkfirst=True)  # Sobra de importação anterior (SQLite)
+            _estoque_importacao.create(conexao)
+
+            total = 0
+            for df in _ler_lotes(caminho, tamanho_lote):
+                lote = _validar_lote(df, skus, depositos, total + 1, agora)
+                if lote.empty:
+                    continue
+                _copiar_lote(session, lote)
+                total += len(lote)
+                logging.debug(f"Importação de estoque: {total} linhas copiadas")
+
+            if not total:
+                session.rollback()
+                return {"linhas": 0, "pares": 0, "depositos": 0}
+
+            if session.get_bind().dialect.name == "postgresql":
+                # Tabelas temporárias não são analisadas pelo autovacuum
+                session.execute(text(f"ANALYZE {_estoque_importacao.name}"))
+                _criar_particoes(session)
+
+            _verificar_limite_compactacao(session)
+            _gravar_movimentacoes(session)
+            if not permitir_saldo_negativo:
+                _verificar_saldos_negativos(session)
+            _atualizar_saldos_materializados(session)
+            _atualizar_snapshots(session)
+
+            pares = session.exec(select(func.count()).select_from(_pares_importados().subquery())).one()
+            deposito_ids = set(session.exec(select(_estoque_importacao.c.deposito_id).distinct()).all())
+            session.commit()
+            cache_estoque.invalidar(*deposito_ids)
+
+            resultado = {"linhas": total, "pares": pares, "depositos": len(deposito_ids)}
+            logging.debug(f"Importação de estoque concluída: {resultado}")
+            return resultado
+
+        except Exception as e:
+            logging.error(f"Erro ao importar movimentações de estoque: {str(e)}", exc_info=True)
+            session.rollback()
+            raise
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.DEBUG)  # só na linha de comando: importar o módulo não reconfigura o logging
+    parser = argparse.ArgumentParser(description="Importa movimentações de estoque de um arquivo CSV ou Parquet.")
+    parser.add_argument("arquivo", help="arquivo .csv ou .parquet com as movimentações")
+    parser.add_argument("--tamanho-lote", type=int, default=100_000, help="linhas copiadas por vez")
+    parser.add_argument(
+        "--permitir-saldo-negativo",
+        action="store_true",
+        help="aceita saídas que deixem o saldo negativo (livros legados incompletos)"
+    )
+    args = parser.parse_args()
+    resultado = importar_movimentacoes(args.arquivo, args.tamanho_lote, args.permitir_saldo_negativo)
+    print(f"✅ {resultado['linhas']} movimentações importadas ({resultado['pares']} pares, "
+          f"{resultado['depositos']} depósitos)")
@@ -1,7 +1,7 @@
 from sqlmodel import SQLModel, Field, Relationship
 from typing import Optional, List
 from datetime import datetime
-from sqlalchemy import Column, TIMESTAMP
+from sqlalchemy import Column, TIMESTAMP, Index, text
 from zoneinfo import ZoneInfo  # novo import para timezone
 from enum import Enum
 
@@ -26,6 +26,28 @@ class Produto(SQLModel, table=True):
     estoques: List["Estoque"] = Relationship(back_populates="produto")
 
 class Estoque(SQLModel, table=True):
+    # No PostgreSQL a tabela é particionada por mês em data_hora (migração 4 de
+    # create_schema.py), com chave primária física (id, data_hora); o id continua único e
+    # é a identidade usada pelo ORM. Filtre por data_hora sempre que possível: só as
+    # partições do intervalo são lidas.
+    # Mesmos índices da migração 2 de create_schema.py (consultas de saldo, estoque atual e histórico)
+    __table_args__ = (
+        Index(
+            "ix_estoque_sku_deposito_data_hora",
+            "sku", "deposito_id", text("data_hora DESC"), text("id DESC"),
+            postgresql_include=["tipo", "quantidade", "saldo"]
+        ),
+        Index(
+            "ix_estoque_balanco",
+            "sku", "deposito_id", text("data_hora DESC"), text("id DESC"),
+            postgresql_include=["quantidade"],
+            postgresql_where=text("tipo = 'Balanço'"),
+            sqlite_where=text("tipo = 'Balanço'")
+        ),
+        Index("ix_estoque_deposito_data_hora", "deposito_id", text("data_hora DESC"), text("id DESC")),
+        Index("ix_estoque_data_hora", text("data_hora DESC"), text("id DESC")),
+    )
+
     id: Optional[int] = Field(default=None, primary_key=True)
     sku: str = Field(foreign_key="produto.sku")
     deposito_id: int = Field(foreign_key="deposito.id")
@@ -33,10 +55,58 @@ class Estoque(SQLModel, table=True):
     tipo: str = Field(default="Entrada", max_length=50)
     data_hora: datetime = Field(
         default_factory=lambda: datetime.now(ZoneInfo("America/Sao_Paulo")),
-        sa_column=Column(TIMESTAMP(timezone=True))
+        sa_column=Column(TIMESTAMP(timezone=True), nullable=False)
     )
     observacoes: Optional[str] = Field(default=None, max_length=200)
     saldo: int = Field(default=0)  # Adicione este campo
     
     produto: Produto = Relationship(back_populates="estoques")
-    deposito: Deposito = Relationship(back_populates="estoques")
\ No newline at end of file
+    deposito: Deposito = Relationship(back_populates="estoques")
+
+class EstoqueArquivo(SQLModel, table=True):
+    """
+    Movimentações antigas retiradas da tabela estoque pela compactação (compactacao_estoque),
+    com o mesmo id e as mesmas colunas. Cada par compactado ganha em estoque um Balanço
+    sintético em compactado_ate, com o saldo naquele instante.
+    """
+    __tablename__ = "estoque_arquivo"
+    __table_args__ = (
+        Index("ix_estoque_arquivo_sku_deposito_data_hora", "sku", "deposito_id", text("data_hora DESC"), text("id DESC")),
+        Index("ix_estoque_arquivo_data_hora", text("data_hora DESC"), text("id DESC")),
+    )
+
+    id: int = Field(primary_key=True, sa_column_kwargs={"autoincrement": False})
+    sku: str = Field(foreign_key="produto.sku")
+    deposito_id: int = Field(foreign_key="deposito.id")
+    quantidade: int
+    tipo: str = Field(max_length=50)
+    data_hora: datetime = Field(sa_column=Column(TIMESTAMP(timezone=True)))
+    observacoes: Optional[str] = Field(default=None, max_length=200)
+    saldo: int = Field(default=0)
+    compactado_ate: datetime = Field(sa_column=Column(TIMESTAMP(timezone=True), nullable=False))
+
+class SaldoEstoque(SQLModel, table=True):
+    """Saldo corrente por (sku, depósito), mantido junto com cada movimentação do estoque."""
+    __tablename__ = "saldo_estoque"
+
+    sku: str = Field(foreign_key="produto.sku", primary_key=True, max_length=50)
+    deposito_id: int = Field(foreign_key="deposito.id", primary_key=True)
+    saldo: int = Field(default=0)
+    atualizado_em: datetime = Field(
+        default_factory=lambda: datetime.now(ZoneInfo("America/Sao_Paulo")),
+        sa_column=Column(TIMESTAMP(timezone=True))
+    )
+
+class SaldoSnapshot(SQLModel, table=True):
+    """
+    Saldo de cada (sku, depósito) em uma data de referência (checkpoint gerado por snapshot_estoque).
+    Considera todas as movimentações com data_hora <= data_referencia; saldos zerados não são gravados.
+    """
+    __tablename__ = "saldo_snapshot"
+
+    sku: str = Field(foreign_key="produto.sku", primary_key=True, max_length=50)
+    deposito_id: int = Field(foreign_key="deposito.id", primary_key=True)
+    data_referencia: datetime = Field(
+        sa_column=Column(TIMESTAMP(timezone=True), primary_key=True, index=True)
+    )
+    saldo: int = Field(default=0)
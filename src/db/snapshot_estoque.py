@@ -0,0 +1,157 @@
+"""
+Snapshots (checkpoints) do saldo de estoque e consulta de saldo em uma data passada.
+
+Um snapshot grava o saldo de cada par (sku, depósito) em uma data de referência.
+consultar_saldo_em parte do snapshot mais próximo anterior à data pedida e aplica só
+as movimentações posteriores a ele, em vez de reprocessar o histórico inteiro.
+
+Gere os snapshots periodicamente (por exemplo, diariamente via cron):
+    python -m src.db.snapshot_estoque [--data 2025-01-31]
+"""
+import argparse
+import logging
+from datetime import datetime, time
+from typing import Dict, Optional, Tuple
+from zoneinfo import ZoneInfo
+
+from sqlalchemy import delete, func, insert
+from sqlmodel import Session, select
+
+from src.db.compactacao_estoque import data_compactada
+from src.db.crud_estoque import _stmt_saldos
+from src.db.database import get_session
+from .models import Estoque, EstoqueArquivo, SaldoSnapshot
+
+
+def _snapshot_anterior(session: Session, data: datetime) -> Optional[datetime]:
+    """Data de referência do snapshot mais recente com data_referencia <= data (ou None)."""
+    return session.exec(
+        select(func.max(SaldoSnapshot.data_referencia)).where(SaldoSnapshot.data_referencia <= data)
+    ).one()
+
+
+def _saldos_em(
+    session: Session,
+    data: datetime,
+    sku: Optional[str] = None,
+    deposito_id: Optional[int] = None
+) -> Dict[Tuple[str, int], int]:
+    """
+    Calcula o saldo de cada par em uma data: saldo do snapshot anterior + movimentações
+    entre o snapshot e a data. Se houver balanço nesse intervalo, ele substitui o saldo do snapshot.
+
+    Antes do limite da última compactação, as movimentações estão todas em estoque_arquivo.
+    """
+    data_snapshot = _snapshot_anterior(session, data)
+
+    tabela = EstoqueArquivo if data_compactada(session, data) else Estoque
+
+    saldos = {}
+    if data_snapshot is not None:
+        query = select(SaldoSnapshot).where(SaldoSnapshot.data_referencia == data_snapshot)
+        if sku:
+            query = query.where(SaldoSnapshot.sku == sku)
+        if deposito_id:
+            query = query.where(SaldoSnapshot.deposito_id == deposito_id)
+        saldos = {(linha.sku, linha.deposito_id): linha.saldo for linha in session.exec(query)}
+
+    for linha in session.exec(_stmt_saldos(sku, deposito_id, desde=data_snapshot, ate=data, tabela=tabela)):
+        par = (linha.sku, linha.deposito_id)
+        if linha.balanco is not None:
+            saldos[par] = int(linha.saldo)
+        else:
+            saldos[par] = saldos.get(par, 0) + int(linha.saldo)
+
+    return saldos
+
+
+def consultar_saldo_em(
+    data: datetime,
+    sku: Optional[str] = None,
+    deposito_id: Optional[int] = None
+) -> Dict[Tuple[str, int], int]:
+    """
+    Consulta o saldo de cada par (sku, depósito) em uma data passada.
+
+    Args:
+        data: Instante da consulta (movimentações com data_hora <= data são consideradas).
+        sku: SKU do produto para filtrar.
+        deposito_id: ID do depósito para filtrar.
+
+    Returns:
+        Dicionário {(sku, deposito_id): saldo}. Pares sem movimentação até a data não aparecem.
+    """
+    with get_session() as session:
+        try:
+            return _saldos_em(session, data, sku, deposito_id)
+        except Exception as e:
+            logging.error(f"Erro ao consultar saldo em {data}: {str(e)}", exc_info=True)
+            raise
+
+
+def gerar_snapshot(data_referencia: Optional[datetime] = None) -> int:
+    """
+    Grava o saldo de todos os pares na data de referência, substituindo um snapshot
+    existente na mesma data. O cálculo parte do snapshot anterior, então o custo é
+    proporcional às movimentações desde ele.
+
+    Args:
+        data_referencia: Instante do snapshot. Por padrão, a meia-noite de hoje
+            (horário de São Paulo), ou seja, o fechamento do dia anterior, para não
+            disputar com movimentações do dia ainda em andamento.
+
+    Returns:
+        Quantidade de pares gravados (saldos zerados não são gravados).
+    """
+    if data_referencia is None:
+        hoje = datetime.now(ZoneInfo("America/Sao_Paulo")).date()
+        data_referencia = datetime.combine(hoje, time.min)
+
+    with get_session() as session:
+        try:
+            saldos = _saldos_em(session, data_referencia)
+
+            session.exec(delete(SaldoSnapshot).where(SaldoSnapshot.data_referencia == data_referencia))
+            linhas = [
+                {"sku": sku, "deposito_id": deposito_id, "data_referencia": data_referencia, "saldo": saldo}
+                for (sku, deposito_id), saldo in saldos.items()
+                if saldo != 0
+            ]
+            if linhas:
+                session.exec(insert(SaldoSnapshot), params=linhas)
+            session.commit()
+
+            logging.debug(f"Snapshot de estoque em {data_referencia}: {len(linhas)} pares")
+            return len(linhas)
+
+        except Exception as e:
+            logging.error(f"Erro ao gerar snapshot de estoque: {str(e)}", exc_info=True)
+            session.rollback()
+            raise
+
+
+def remover_snapshots_anteriores(data: datetime) -> int:
+    """Remove os snapshots com data de referência anterior à data informada. Retorna as linhas removidas."""
+    with get_session() as session:
+        try:
+            resultado = session.exec(delete(SaldoSnapshot).where(SaldoSnapshot.data_referencia < data))
+            session.commit()
+            return resultado.rowcount
+
+        except Exception as e:
+            logging.error(f"Erro ao remover snapshots de estoque: {str(e)}", exc_info=True)
+            session.rollback()
+            raise
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.DEBUG)  # só na linha de comando: importar o módulo não reconfigura o logging
+    parser = argparse.ArgumentParser(description="Gera um snapshot do saldo de estoque.")
+    parser.add_argument(
+        "--data",
+        type=datetime.fromisoformat,
+        help="data/hora de referência (ISO 8601); padrão: meia-noite de hoje"
+    )
+    args = parser.parse_args()
+    total = gerar_snapshot(args.data)
+    print(f"✅ Snapshot gerado: {total} pares")
@@ -5,8 +5,6 @@ from datetime import datetime
 import sys
 import os
 import logging
-from functools import _lru_cache_wrapper
-import gc
 import time
 import pytz
 
@@ -18,6 +16,7 @@ sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')
 from src.api.mercadolivre import MercadoLivreAPI
 from src.api.amazon import AmazonAPI
 from src.api.mercos import MercosWebScraping
+from src.coleta_fontes import coletar_fontes_em_paralelo
 
 from plotly.express.colors import qualitative
 from sqlmodel import Session, select
@@ -44,6 +43,14 @@ COLOR_SCHEME = {
     'background': '#F8F9FA'
 }
 
+# Tempo máximo (em segundos) de cada fonte da visão integrada; a fonte que não responder
+# a tempo fica de fora e o painel é montado com as demais
+TIMEOUTS_FONTES = {
+    'Mercado Livre': int(os.getenv("TIMEOUT_MERCADO_LIVRE", "90")),
+    'Amazon': int(os.getenv("TIMEOUT_AMAZON", "60")),
+    'Estoque próprio': int(os.getenv("TIMEOUT_ESTOQUE_PROPRIO", "30")),
+}
+
 
 def gerar_paleta_depositos(depositos):
     """Gera cores únicas para cada depósito próprio"""
@@ -139,45 +146,58 @@ def criar_card_metrica(titulo, valor, ajuda=None):
     </div>
     """
 
+def coletar_mercado_livre(api):
+    """Estoque Full do Mercado Livre com as colunas padronizadas"""
+    ml_data = api.gerar_relatorio_estoque()
+    if not ml_data.empty:
+        ml_data.rename(columns={"Nome": "Produto"}, inplace=True)  # Padroniza nome da coluna
+        ml_data['Depósito'] = 'Mercado Livre (Full)'
+
+        #Dados do ML como referência para conciliação com Mercos
+        ml_data.to_csv("skus_mercado_livre_amazon.csv", index=False)
+    return ml_data
+
+
+def coletar_amazon(api):
+    """Estoque FBA da Amazon com as colunas padronizadas"""
+    amazon_data = api.gerar_relatorio_estoque()
+    if not amazon_data.empty:
+        amazon_data.rename(columns={"Nome": "Produto"}, inplace=True)  # Padroniza nome da coluna
+        amazon_data['Depósito'] = 'Amazon (FBA)'
+    return amazon_data
+
+
 @st.cache_data(ttl=3600, show_spinner=False)
 def carregar_dados_completos(_apis):
-    """Combina estoque de marketplaces com estoque próprio"""
-    # Dados externos
-    dados_externos = []
-    
-    # Mercado Livre
-    with st.spinner("Coletando Mercado Livre..."):
-        try:
-            ml_data = _apis['ml'].gerar_relatorio_estoque()
-            if not ml_data.empty:
-                ml_data.rename(columns={"Nome": "Produto"}, inplace=True)  # Padroniza nome da coluna
-                ml_data['Depósito'] = 'Mercado Livre (Full)'
-                dados_externos.append(ml_data)
-                
-                #Dados do ML como referência para conciliação com Mercos                
-                ml_data.to_csv("skus_mercado_livre_amazon.csv", index=False)
+    """
+    Combina estoque de marketplaces com estoque próprio, coletados em paralelo.
+
+    Returns:
+        tuple: DataFrame combinado (só com as fontes que responderam) e a situação de
+        cada fonte, no formato de coletar_fontes_em_paralelo.
+    """
+    fontes = {
+        'Mercado Livre': (lambda: coletar_mercado_livre(_apis['ml']), TIMEOUTS_FONTES['Mercado Livre']),
+        'Amazon': (lambda: coletar_amazon(_apis['amazon']), TIMEOUTS_FONTES['Amazon']),
+        'Estoque próprio': (carregar_estoque_interno, TIMEOUTS_FONTES['Estoque próprio']),
+    }
+    resultados, situacao = coletar_fontes_em_paralelo(fontes)
+
+    # Combinação (marketplaces primeiro, como antes)
+    dados = [df for df in resultados.values() if df is not None and not df.empty]
+    df_completo = pd.concat(dados, ignore_index=True) if dados else pd.DataFrame()
+    return df_completo, situacao
 
-        except Exception as e:
-            st.error(f"Erro ML: {str(e)}")
-    
-    # Amazon
-    with st.spinner("Coletando Amazon..."):
-        try:
-            amazon_data = _apis['amazon'].gerar_relatorio_estoque()
-            if not amazon_data.empty:
-                amazon_data.rename(columns={"Nome": "Produto"}, inplace=True)  # Padroniza nome da coluna
-                amazon_data['Depósito'] = 'Amazon (FBA)'
-                dados_externos.append(amazon_data)
-        except Exception as e:
-            st.error(f"Erro Amazon: {str(e)}")
-    
-    # Dados internos
-    with st.spinner("Carregando estoque próprio..."):
-        interno_df = carregar_estoque_interno()
-    
-    # Combinação
-    externo_df = pd.concat(dados_externos, ignore_index=True) if dados_externos else pd.DataFrame()
-    return pd.concat([externo_df, interno_df], ignore_index=True)
+
+def exibir_situacao_fontes(situacao):
+    """Tempo de cada fonte na última carga e aviso das que ficaram de fora"""
+    icones = {'ok': '✅', 'erro': '❌', 'timeout': '⏱️'}
+    st.caption(" · ".join(
+        f"{icones[info['status']]} {nome}: {info['segundos']:.1f} s" for nome, info in situacao.items()
+    ))
+    for nome, info in situacao.items():
+        if info['status'] != 'ok':
+            st.warning(f"{nome} não incluído nesta carga ({info['mensagem']}). Os demais dados foram exibidos.")
 
 
 def exibir_visao_integrada(apis):
@@ -192,13 +212,19 @@ def exibir_visao_integrada(apis):
     # Carregamento de dados
     if not st.session_state.dados_carregados or st.session_state.get('atualizar_dados', False):
         with st.spinner("Carregando dados..."):
-            df_completo = carregar_dados_completos(apis)
+            df_completo, situacao_fontes = carregar_dados_completos(apis)
+            if any(info['status'] != 'ok' for info in situacao_fontes.values()):
+                # Resultado parcial não fica em cache: a próxima atualização tenta de novo
+                carregar_dados_completos.clear()
             st.session_state.df_completo = df_completo  # Armazena o DataFrame no estado da sessão
+            st.session_state.situacao_fontes = situacao_fontes
             st.session_state.dados_carregados = True
             st.session_state.atualizar_dados = False  # Reseta o flag
     else:
         df_completo = st.session_state.df_completo  # Recupera o DataFrame do estado da sessão
-        
+
+    exibir_situacao_fontes(st.session_state.get('situacao_fontes', {}))
+
     if df_completo.empty:
         st.warning("Nenhum dado disponível")
         return
@@ -325,12 +351,6 @@ def exibir_visao_integrada(apis):
             height=1200
         )
 
-def limpar_cache():
-    
-    for obj in gc.get_objects():
-        if isinstance(obj, _lru_cache_wrapper):
-            obj.cache_clear()
-
 def reset_estado_estoque():
     """Reseta as variáveis de estado da tela de Gestão de Estoque."""
     for key in ['etapa', 'produtos_selecionados', 'deposito_nome', 'tipo', 'origem_nome', 'destino_nome']:
@@ -5,8 +5,6 @@ from datetime import datetime
 import sys
 import os
 import logging
-from functools import _lru_cache_wrapper
-import gc
 
 logging.basicConfig(level=logging.DEBUG)
 
@@ -15,15 +13,18 @@ sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')
 
 from src.api.mercadolivre import MercadoLivreAPI
 from src.api.amazon import AmazonAPI
-from src.db.database import get_session
+from src.api.mercos import MercosWebScraping
+from src.db.database import get_session, aquecer_engine
 from src.db.crud_depositos import criar_deposito, listar_depositos, atualizar_deposito, deletar_deposito
-from src.db.crud_produtos import criar_produto, listar_produtos, atualizar_produto, deletar_produto
+from src.db.crud_produtos import criar_produto, listar_produtos, atualizar_produto, deletar_produto, sincronizar_produtos
 
 from src.db.crud_estoque import (
     registrar_movimentacao,
+    registrar_movimentacoes_em_lote,
     transferir_estoque,
+    transferir_estoque_lote,
     consultar_estoque,
-    consultar_historico_movimentacoes,
+    consultar_historico_paginado,
     consultar_saldo,
     consultar_estoque_batch,
     atualizar_movimentacao,
@@ -50,6 +51,7 @@ st.set_page_config(
 
 # Constantes
 DATE_FORMAT = "%Y-%m-%d %H:%M"
+HISTORICO_TAMANHO_PAGINA = 100  # Movimentações por página na tela de histórico
 COLOR_SCHEME = {
     'Mercado Livre (Full)': '#00B8A9',
     'Amazon (FBA)': '#FF6B6B',    
@@ -502,6 +504,32 @@ def exibir_gestao_produtos():
                     except Exception as e:
                         st.error(f"Erro ao criar produto: {str(e)}")
 
+    # Sincronização em massa do catálogo a partir das integrações
+    with st.expander("🔄 Sincronizar Catálogo", expanded=False):
+        origens = {
+            "Mercado Livre": lambda: MercadoLivreAPI().gerar_relatorio_estoque(),
+            "Amazon": lambda: AmazonAPI().gerar_relatorio_estoque(),
+            "Mercos": lambda: MercosWebScraping().carrega_dados_mercos(),
+        }
+        origem = st.selectbox("Origem", options=list(origens.keys()))
+        atualizar_nomes = st.checkbox("Atualizar o nome dos produtos já cadastrados", value=False)
+
+        if st.button("Sincronizar"):
+            try:
+                with st.spinner(f"Carregando produtos de {origem}..."):
+                    df_origem = origens[origem]()
+                if df_origem.empty:
+                    st.warning(f"Nenhum produto retornado por {origem}")
+                else:
+                    contagem = sincronizar_produtos(df_origem, atualizar_nomes=atualizar_nomes)
+                    st.session_state.mensagem_sucesso = (
+                        f"Catálogo sincronizado: {contagem['inseridos']} inseridos, "
+                        f"{contagem['atualizados']} atualizados, {contagem['inalterados']} inalterados"
+                    )
+                    st.rerun()
+            except Exception as e:
+                st.error(f"Erro ao sincronizar produtos: {str(e)}")
+
     # Exibição dos produtos cadastrados
     st.markdown("---")
     st.subheader("Produtos Cadastrados")
@@ -564,12 +592,6 @@ def exibir_gestao_produtos():
 
 
 
-def limpar_cache():
-    
-    for obj in gc.get_objects():
-        if isinstance(obj, _lru_cache_wrapper):
-            obj.cache_clear()
-
 def reset_estado_estoque():
     """Reseta as variáveis de estado da tela de Gestão de Estoque."""
     for key in ['etapa', 'produtos_selecionados', 'deposito_nome', 'tipo', 'origem_nome', 'destino_nome']:
@@ -692,25 +714,32 @@ def exibir_gestao_estoque():
                         deposito_id = deposito_map[st.session_state.deposito_nome]
                         tipo = st.session_state.tipo
                         sucesso = True  # Variável para controlar o sucesso das movimentações
+                        linhas = []
                         for produto_nome in st.session_state.produtos_selecionados:
-                            sku = produto_map[produto_nome]
                             quantidade = quantidades[produto_nome]
-                            observacao = observacoes[produto_nome]
                             if quantidade == 0:
                                 st.error(f"A quantidade para {produto_nome} não pode ser zero.")
                                 sucesso = False
                             else:
-                                try:
-                                    registrar_movimentacao(sku, deposito_id, quantidade, tipo, observacao)
-                                except ValueError as e:
-                                    st.error(str(e))
-                                    sucesso = False
-                                except Exception as e:
-                                    st.error(f"Erro ao registrar movimentação para {produto_nome}: {str(e)}")
-                                    sucesso = False
+                                linhas.append({
+                                    "sku": produto_map[produto_nome],
+                                    "deposito_id": deposito_id,
+                                    "quantidade": quantidade,
+                                    "tipo": tipo,
+                                    "observacoes": observacoes[produto_nome],
+                                })
+                        if sucesso:
+                            # Todas as linhas são gravadas em uma única transação
+                            try:
+                                registrar_movimentacoes_em_lote(linhas)
+                            except ValueError as e:
+                                st.error(str(e))
+                                sucesso = False
+                            except Exception as e:
+                                st.error(f"Erro ao registrar movimentações: {str(e)}")
+                                sucesso = False
                         if sucesso:
                             st.session_state.mensagem_sucesso = "Movimentações registradas com sucesso!"
-                            limpar_cache()
                             st.session_state.etapa = 1
                             st.rerun()
                 with col2:
@@ -833,10 +862,10 @@ def exibir_gestao_estoque():
                         origem_id = deposito_map[st.session_state.origem_nome]
                         destino_id = deposito_map[st.session_state.destino_nome]
                         sucesso = True
+                        itens = []
                         for produto_nome in st.session_state.produtos_selecionados:
-                            sku = produto_map[produto_nome]
                             quantidade = quantidades[produto_nome]
-                            observacao = observacoes[produto_nome]
+                            saldo_atual = estoque.get(produto_nome, 0)
                             if quantidade == 0:
                                 st.error(f"A quantidade para {produto_nome} não pode ser zero.")
                                 sucesso = False
@@ -844,17 +873,23 @@ def exibir_gestao_estoque():
                                 st.error(f"A quantidade para {produto_nome} não pode ser maior que o saldo atual ({saldo_atual}).")
                                 sucesso = False
                             else:
-                                try:
-                                    transferir_estoque(sku, origem_id, destino_id, quantidade, observacao)
-                                except ValueError as e:
-                                    st.error(str(e))
-                                    sucesso = False
-                                except Exception as e:
-                                    st.error(f"Erro ao transferir estoque para {produto_nome}: {str(e)}")
-                                    sucesso = False
+                                itens.append({
+                                    "sku": produto_map[produto_nome],
+                                    "quantidade": quantidade,
+                                    "observacoes": observacoes[produto_nome],
+                                })
+                        if sucesso:
+                            # Todos os produtos são transferidos em uma única transação
+                            try:
+                                transferir_estoque_lote(origem_id, destino_id, itens)
+                            except ValueError as e:
+                                st.error(str(e))
+                                sucesso = False
+                            except Exception as e:
+                                st.error(f"Erro ao transferir estoque: {str(e)}")
+                                sucesso = False
                         if sucesso:
                             st.session_state.mensagem_sucesso = "Transferências realizadas com sucesso!"
-                            limpar_cache()
                             st.session_state.etapa = 1
                             st.rerun()
                 with col2:
@@ -918,6 +953,10 @@ def exibir_gestao_estoque():
                 }
             if 'confirmar_exclusao' not in st.session_state:
                 st.session_state.confirmar_exclusao = None
+            if 'historico_paginas' not in st.session_state:
+                st.session_state.historico_paginas = 1
+            if 'historico_tem_mais' not in st.session_state:
+                st.session_state.historico_tem_mais = False
 
         def exibir_titulos():
             col1, col2, col3, col4, col5, col6, col7 = st.columns([3, 2, 1, 1, 0.7, 2, 0.7], border=True)
@@ -960,7 +999,6 @@ def exibir_gestao_estoque():
                             try:
                                 excluir_movimentacao(row['id'])                                
                                 st.success("Lançamento excluído com sucesso!")
-                                limpar_cache()
                                 st.session_state.confirmar_exclusao = None
                                 st.session_state.historico = None  # Força o recarregamento do histórico
                                 st.rerun()
@@ -971,8 +1009,18 @@ def exibir_gestao_estoque():
                             st.session_state.confirmar_exclusao = None
                             st.rerun()
 
-        def carregar_historico(sku, deposito_id, data_inicio, data_fim):
-            historico = consultar_historico_movimentacoes(sku, deposito_id, data_inicio, data_fim)
+        def carregar_historico(sku, deposito_id, data_inicio, data_fim, paginas):
+            # Percorre as páginas já exibidas pelo cursor (data_hora, id), sem OFFSET
+            historico, cursor = [], None
+            for _ in range(paginas):
+                pagina, cursor = consultar_historico_paginado(
+                    sku, deposito_id, data_inicio, data_fim, cursor=cursor, tamanho_pagina=HISTORICO_TAMANHO_PAGINA
+                )
+                historico.extend(pagina)
+                if cursor is None:
+                    break
+            st.session_state.historico_tem_mais = cursor is not None
+
             if historico and isinstance(historico, list):
                 df = pd.DataFrame(historico)
                 df['Data/Hora'] = pd.to_datetime(df['data_hora']).dt.strftime("%d/%m/%Y %H:%M:%S")
@@ -996,25 +1044,44 @@ def exibir_gestao_estoque():
         with col4:
             st.session_state.filtros['data_fim'] = st.date_input("Data Fim", value=st.session_state.filtros['data_fim'], key="data_fim_input")
 
-        if st.button("Consultar Histórico") or st.session_state.historico is not None:
+        consultar = st.button("Consultar Histórico")
+        if consultar:
+            st.session_state.historico_paginas = 1  # Nova consulta volta para a primeira página
+
+        if consultar or st.session_state.historico is not None:
             sku = produto_map.get(st.session_state.filtros['produto']) if st.session_state.filtros['produto'] != "Todos" else None
             deposito_id = deposito_map.get(st.session_state.filtros['deposito']) if st.session_state.filtros['deposito'] != "Todos" else None
             data_inicio = datetime.combine(st.session_state.filtros['data_inicio'], datetime.min.time()) if st.session_state.filtros['data_inicio'] else None
             data_fim = datetime.combine(st.session_state.filtros['data_fim'], datetime.max.time()) if st.session_state.filtros['data_fim'] else None
 
-            st.session_state.historico = carregar_historico(sku, deposito_id, data_inicio, data_fim)
+            st.session_state.historico = carregar_historico(
+                sku, deposito_id, data_inicio, data_fim, st.session_state.historico_paginas
+            )
 
             if st.session_state.historico is not None:
                 exibir_titulos()
                 for _, row in st.session_state.historico.iterrows():
                     exibir_linha(row)                    
+                if st.session_state.historico_tem_mais and st.button("Carregar mais"):
+                    st.session_state.historico_paginas += 1
+                    st.rerun()
             else:
                 st.info("Nenhuma movimentação encontrada.")
 
     
 
+def aquecer_banco():
+    """
+    Aquece as conexões com o banco no início de cada sessão do usuário, em segundo plano,
+    enquanto a tela é montada (DB_AQUECER=0 desativa).
+    """
+    if os.getenv("DB_AQUECER", "1") != "0" and 'banco_aquecido' not in st.session_state:
+        st.session_state.banco_aquecido = True
+        aquecer_engine(conexoes=2, em_segundo_plano=True)
+
 def main():
     setup_environment()
+    aquecer_banco()
     
     # Menu principal
     with st.sidebar:
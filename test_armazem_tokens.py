@@ -0,0 +1,49 @@
+import os
+import stat
+import tempfile
+import time
+import unittest
+from unittest import mock
+
+from src.api.amazon import AmazonTokenManager
+from src.api.armazem_tokens import ArmazemTokens
+
+
+class TestArmazemTokens(unittest.TestCase):
+
+    def setUp(self):
+        diretorio = tempfile.TemporaryDirectory()
+        self.addCleanup(diretorio.cleanup)
+        self.caminho = os.path.join(diretorio.name, "tokens.sqlite3")
+        self.armazem = ArmazemTokens(self.caminho)
+
+    def test_persistido_entre_instancias_e_restrito_ao_dono(self):
+        with mock.patch("src.api.armazem_tokens.time.time", return_value=1000.0):
+            self.armazem.gravar("amazon:id", "atza|1", None, expires_in=3600)
+
+        self.assertEqual(tuple(ArmazemTokens(self.caminho).obter("amazon:id")), ("atza|1", None, 4600.0))
+        self.assertIsNone(self.armazem.obter("mercadolivre:id"))
+        self.assertEqual(stat.S_IMODE(os.stat(self.caminho).st_mode), 0o600)
+
+    def test_amazon_usa_token_armazenado_sem_renovar(self):
+        self.armazem.gravar("amazon:id", "atza|1", None, expires_in=3600)
+        gerente = AmazonTokenManager("id", "segredo", "refresh", store=self.armazem)
+
+        with mock.patch("src.api.amazon.requests.post") as post:
+            self.assertEqual(gerente.get_token(), "atza|1")
+        post.assert_not_called()
+        self.assertGreater(gerente.expires_at, time.time())
+
+    def test_amazon_renova_token_expirado(self):
+        self.armazem.gravar("amazon:id", "atza|1", None, expires_in=-1)
+        gerente = AmazonTokenManager("id", "segredo", "refresh", store=self.armazem)
+
+        with mock.patch("src.api.amazon.requests.post") as post:
+            post.return_value.json.return_value = {"access_token": "atza|2", "expires_in": 3600}
+            self.assertEqual(gerente.get_token(), "atza|2")
+        post.assert_called_once()
+        self.assertEqual(self.armazem.obter("amazon:id").access_token, "atza|2")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,40 @@
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+from src.api.cache_envios import CacheEnvios
+
+
+class TestCacheEnvios(unittest.TestCase):
+
+    def setUp(self):
+        diretorio = tempfile.TemporaryDirectory()
+        self.addCleanup(diretorio.cleanup)
+        self.caminho = os.path.join(diretorio.name, "envios.sqlite3")
+        self.cache = CacheEnvios(self.caminho, ttl_final_segundos=86400, ttl_andamento_segundos=60)
+
+    def test_ttl_depende_do_status(self):
+        with mock.patch("src.api.cache_envios.time.time", return_value=1000.0):
+            self.cache.gravar_varios([
+                (1, "delivered", "fulfillment", 0.0),
+                (2, "shipped", "cross_docking", 19.9),
+            ])
+        with mock.patch("src.api.cache_envios.time.time", return_value=1059.0):
+            self.assertEqual(set(self.cache.obter_varios([1, 2, 3])), {"1", "2"})
+        with mock.patch("src.api.cache_envios.time.time", return_value=1061.0):
+            # O envio em andamento expira; o entregue continua válido
+            self.assertEqual(self.cache.obter_varios([1, 2]), {"1": ("fulfillment", 0.0)})
+
+        estatisticas = self.cache.estatisticas()
+        self.assertEqual((estatisticas["hits"], estatisticas["misses"]), (3, 2))
+
+    def test_persistido_entre_instancias(self):
+        self.cache.gravar_varios([("42", "delivered", "fulfillment", 5.5)])
+
+        outro = CacheEnvios(self.caminho)
+        self.assertEqual(outro.obter_varios(["42"]), {"42": ("fulfillment", 5.5)})
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,56 @@
+import os
+import unittest
+from unittest import mock
+
+# O DATABASE_URL só precisa existir para importar os módulos de src.db
+os.environ.setdefault("DATABASE_URL", "sqlite://")
+
+from src.db.cache_estoque import CacheEstoque
+
+
+class TestCacheEstoque(unittest.TestCase):
+
+    def setUp(self):
+        self.cache = CacheEstoque(ttl_segundos=60)
+        self.cargas = []
+
+    def carregador(self, deposito_id):
+        def carregar():
+            self.cargas.append(deposito_id)
+            return {"Produto": len(self.cargas)}
+        return carregar
+
+    def test_invalidacao_apenas_do_deposito_afetado(self):
+        self.cache.obter(1, self.carregador(1))
+        self.cache.obter(2, self.carregador(2))
+        self.cache.invalidar(1)
+
+        self.cache.obter(1, self.carregador(1))
+        self.cache.obter(2, self.carregador(2))
+
+        self.assertEqual(self.cargas, [1, 2, 1])
+        estatisticas = self.cache.estatisticas()
+        self.assertEqual((estatisticas["hits"], estatisticas["misses"]), (1, 3))
+
+    def test_expira_apos_ttl(self):
+        with mock.patch("src.db.cache_estoque.time.monotonic", return_value=1000.0):
+            self.cache.obter(1, self.carregador(1))
+        with mock.patch("src.db.cache_estoque.time.monotonic", return_value=1059.0):
+            self.cache.obter(1, self.carregador(1))
+        with mock.patch("src.db.cache_estoque.time.monotonic", return_value=1061.0):
+            self.cache.obter(1, self.carregador(1))
+
+        self.assertEqual(self.cargas, [1, 1])
+
+    def test_carga_invalidada_durante_a_leitura_nao_fica_em_cache(self):
+        def carregar_com_escrita_concorrente():
+            self.cache.invalidar(1)  # Uma movimentação é gravada enquanto a leitura está em andamento
+            return {"Produto": 10}
+
+        self.assertEqual(self.cache.obter(1, carregar_com_escrita_concorrente), {"Produto": 10})
+        self.cache.obter(1, self.carregador(1))
+        self.assertEqual(self.cargas, [1])
+
+
+if __name__ == "__main__":
+    unittest.main()
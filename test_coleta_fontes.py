@@ -0,0 +1,56 @@
+import threading
+import time
+import unittest
+
+import pandas as pd
+
+from src.coleta_fontes import coletar_fontes_em_paralelo
+
+
+class TestColetaEmParalelo(unittest.TestCase):
+
+    def setUp(self):
+        # Libera a fonte lenta ao fim do teste, para a thread não ficar presa
+        self.liberar = threading.Event()
+        self.addCleanup(self.liberar.set)
+
+    def lenta(self):
+        self.liberar.wait(5)
+        return pd.DataFrame({'SKU': ['LENTA']})
+
+    def test_cada_fonte_com_o_seu_resultado_e_situacao(self):
+        def falha():
+            raise RuntimeError("credencial inválida")
+
+        inicio = time.perf_counter()
+        resultados, situacao = coletar_fontes_em_paralelo({
+            'Rápida': (lambda: pd.DataFrame({'SKU': ['A']}), 2),
+            'Com erro': (falha, 2),
+            'Lenta': (self.lenta, 0.2),
+        })
+        decorrido = time.perf_counter() - inicio
+
+        self.assertEqual(list(resultados), ['Rápida'])
+        self.assertEqual(resultados['Rápida']['SKU'].tolist(), ['A'])
+        self.assertEqual({nome: s['status'] for nome, s in situacao.items()},
+                         {'Rápida': 'ok', 'Com erro': 'erro', 'Lenta': 'timeout'})
+        self.assertEqual(situacao['Com erro']['mensagem'], "credencial inválida")
+        self.assertEqual(situacao['Lenta']['segundos'], 0.2)
+        # Não espera a fonte que estourou o tempo terminar
+        self.assertLess(decorrido, 2)
+
+    def test_tempos_maximos_contam_do_inicio_comum(self):
+        # Duas fontes que estouram 0,3 s: juntas esperam 0,3 s, não 0,6 s
+        inicio = time.perf_counter()
+        resultados, situacao = coletar_fontes_em_paralelo({
+            'Lenta 1': (self.lenta, 0.3),
+            'Lenta 2': (self.lenta, 0.3),
+            'Rápida': (pd.DataFrame, 0.3),
+        })
+        self.assertLess(time.perf_counter() - inicio, 0.5)
+        self.assertEqual(list(resultados), ['Rápida'])
+        self.assertEqual([s['status'] for s in situacao.values()], ['timeout', 'timeout', 'ok'])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,172 @@
+import asyncio
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+# O engine assíncrono dos testes é SQLite (aiosqlite); o DATABASE_URL só precisa existir para importar os módulos
+os.environ.setdefault("DATABASE_URL", "sqlite://")
+
+from sqlalchemy import event
+from sqlmodel import SQLModel, Session, create_engine, select
+from src.db import crud_async, database_async
+from src.db.crud_estoque import _calcular_saldos
+from src.db.database_async import LoopBanco
+from src.db.models import Deposito, Estoque, Produto, SaldoEstoque, TipoEstoque
+
+ENTRADA, SAIDA, BALANCO = TipoEstoque.ENTRADA, TipoEstoque.SAIDA, TipoEstoque.BALANCO
+
+
+class BancoAsync(unittest.TestCase):
+    """
+    Base dos testes: arquivo SQLite temporário, lido pelas funções de crud_async em um
+    LoopBanco próprio (engine aiosqlite) e conferido por um engine síncrono.
+    """
+
+    def setUp(self):
+        diretorio = tempfile.TemporaryDirectory()
+        self.addCleanup(diretorio.cleanup)
+        url = f"sqlite:///{os.path.join(diretorio.name, 'estoque.db')}"
+
+        self.engine = create_engine(url)
+        self.addCleanup(self.engine.dispose)
+        SQLModel.metadata.create_all(self.engine)
+        with Session(self.engine) as session:
+            for sku in ("A", "B"):
+                session.add(Produto(sku=sku, nome=f"Produto {sku}"))
+            session.add(Deposito(nome="Loja"))
+            session.add(Deposito(nome="CD"))
+            session.commit()
+            self.loja, self.cd = [d.id for d in session.exec(select(Deposito).order_by(Deposito.id)).all()]
+
+        self.loop_banco = LoopBanco(url)
+        self.addCleanup(self.loop_banco.encerrar)
+        patcher = mock.patch.object(database_async, "loop_banco", self.loop_banco)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def executar(self, coro):
+        return database_async.executar(coro)
+
+    def saldos_materializados(self):
+        with Session(self.engine) as session:
+            return {(r.sku, r.deposito_id): r.saldo for r in session.exec(select(SaldoEstoque)).all()}
+
+
+class TestLoopBanco(BancoAsync):
+
+    def test_um_engine_por_processo_fechado_ao_encerrar(self):
+        async def engine_atual():
+            return self.loop_banco.engine
+
+        engine = self.executar(engine_atual())
+        self.assertEqual(engine.url.drivername, "sqlite+aiosqlite")
+        # Outras chamadas (cada uma como um asyncio.run do Streamlit) reaproveitam o engine
+        self.assertIs(self.executar(engine_atual()), engine)
+
+        async def em_paralelo():
+            return await asyncio.gather(engine_atual(), engine_atual())
+
+        self.assertEqual(self.executar(em_paralelo()), [engine, engine])
+
+        # Fora do loop do banco o engine não é entregue
+        with self.assertRaises(RuntimeError):
+            self.loop_banco.engine
+        with self.assertRaises(RuntimeError):
+            asyncio.run(engine_atual())
+
+        # Ao encerrar, as conexões do pool são fechadas
+        self.executar(crud_async.consultar_saldos_async())
+        fechadas = []
+        event.listen(engine.sync_engine, "close", lambda *_: fechadas.append(1))
+        self.loop_banco.encerrar()
+        self.assertEqual(len(fechadas), 1)
+
+    def test_criar_engine_async_postgres_com_pre_ping(self):
+        with mock.patch.object(database_async, "create_async_engine") as create_async_engine:
+            database_async.criar_engine_async("postgresql://usuario@servidor/banco?sslmode=require")
+        url, kwargs = create_async_engine.call_args.args[0], create_async_engine.call_args.kwargs
+        self.assertEqual(url.drivername, "postgresql+asyncpg")
+        self.assertNotIn("sslmode", url.query)
+        self.assertTrue(kwargs["pool_pre_ping"])
+        self.assertEqual(kwargs["connect_args"]["ssl"], "require")
+
+
+class TestCrudAsync(BancoAsync):
+
+    def test_registrar_e_consultar_saldos(self):
+        registro = self.executar(crud_async.registrar_movimentacao_async("A", self.loja, 10, ENTRADA, "compra"))
+        self.assertEqual((registro.sku, registro.saldo, registro.observacoes), ("A", 10, "compra"))
+        self.executar(crud_async.registrar_movimentacao_async("A", self.loja, 4, SAIDA))
+        self.executar(crud_async.registrar_movimentacao_async("B", self.cd, 7, BALANCO))
+
+        saldos = self.executar(crud_async.consultar_saldos_async())
+        self.assertEqual(saldos, {("A", self.loja): 6, ("B", self.cd): 7})
+        with Session(self.engine) as session:
+            self.assertEqual(_calcular_saldos(session), saldos)
+        self.assertEqual(self.saldos_materializados(), saldos)
+        self.assertEqual(self.executar(crud_async.consultar_saldos_async(deposito_id=self.cd)), {("B", self.cd): 7})
+
+    def test_movimentacao_invalida_nao_grava(self):
+        self.executar(crud_async.registrar_movimentacao_async("A", self.loja, 3, ENTRADA))
+        for args in (("A", self.loja, 4, SAIDA), ("X", self.loja, 1, ENTRADA), ("A", 999, 1, ENTRADA)):
+            with self.subTest(args=args), self.assertRaises(ValueError):
+                self.executar(crud_async.registrar_movimentacao_async(*args))
+
+        with Session(self.engine) as session:
+            self.assertEqual(len(session.exec(select(Estoque)).all()), 1)
+        self.assertEqual(self.saldos_materializados(), {("A", self.loja): 3})
+
+    def test_listar_movimentacoes_por_cursor(self):
+        self.executar(crud_async.registrar_movimentacoes_em_lote_async([
+            {"sku": "A", "deposito_id": self.loja, "quantidade": q, "tipo": ENTRADA} for q in range(1, 6)
+        ]))
+
+        pagina, cursor = self.executar(crud_async.listar_movimentacoes_async(tamanho_pagina=2))
+        vistas = [r["quantidade"] for r in pagina]
+        while cursor:
+            pagina, cursor = self.executar(crud_async.listar_movimentacoes_async(cursor=cursor, tamanho_pagina=2))
+            vistas += [r["quantidade"] for r in pagina]
+        self.assertEqual(vistas, [5, 4, 3, 2, 1])
+
+        pagina, cursor = self.executar(crud_async.listar_movimentacoes_async(deposito_id=self.cd))
+        self.assertEqual((pagina, cursor), ([], None))
+
+    def test_consultas_da_tela_em_paralelo(self):
+        self.executar(crud_async.registrar_movimentacao_async("A", self.loja, 5, ENTRADA))
+        transferencias = self.executar(crud_async.transferir_estoque_lote_async(
+            self.loja, self.cd, [{"sku": "A", "quantidade": 2}]
+        ))
+        self.assertEqual([(s.saldo, e.saldo) for s, e in transferencias], [(3, 2)])
+
+        # Cada consulta abre a própria conexão: com o engine instrumentado, elas se sobrepõem
+        simultaneas, maximo = [0], [0]
+
+        async def instrumentar():
+            engine = self.loop_banco.engine.sync_engine
+
+            def inicio(*_):
+                simultaneas[0] += 1
+                maximo[0] = max(maximo[0], simultaneas[0])
+
+            def fim(*_):
+                simultaneas[0] -= 1
+
+            event.listen(engine, "before_cursor_execute", inicio)
+            event.listen(engine, "after_cursor_execute", fim)
+
+        self.executar(instrumentar())
+        tela = self.executar(crud_async.carregar_tela_estoque_async(deposito_id=self.cd))
+
+        self.assertEqual([d.nome for d in tela["depositos"]], ["CD", "Loja"])
+        self.assertEqual([p.sku for p in tela["produtos"]], ["A", "B"])
+        self.assertEqual(tela["estoque"], [{"Depósito": "CD", "SKU": "A", "Nome do Produto": "Produto A", "Quantidade": 2}])
+        self.assertEqual([r["tipo"] for r in tela["historico"]], [ENTRADA])
+        self.assertGreater(maximo[0], 1)
+
+        self.assertEqual([p.sku for p in self.executar(crud_async.listar_produtos_async("duto b"))], ["B"])
+        self.assertEqual(self.executar(crud_async.consultar_estoque_batch_async(self.loja)), {"Produto A": 3})
+
+
+if __name__ == "__main__":
+    unittest.main()
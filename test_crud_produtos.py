@@ -0,0 +1,150 @@
+import os
+import unittest
+from contextlib import contextmanager
+from unittest import mock
+
+# Os testes usam SQLite em memória; o DATABASE_URL só precisa existir para importar o módulo
+os.environ.setdefault("DATABASE_URL", "sqlite://")
+
+import pandas as pd
+from sqlmodel import SQLModel, Session, create_engine, select
+from sqlalchemy.pool import StaticPool
+from src.db import busca, crud_produtos
+from src.db.models import Deposito, Produto
+
+
+class BancoProdutos(unittest.TestCase):
+    """Base dos testes: SQLite em memória com dois produtos cadastrados."""
+
+    def setUp(self):
+        self.engine = create_engine("sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool)
+        SQLModel.metadata.create_all(self.engine)
+        with Session(self.engine) as session:
+            session.add(Produto(sku="A1", nome="Produto A1"))
+            session.add(Produto(sku="A2", nome="Produto A2"))
+            session.commit()
+
+        @contextmanager
+        def sessao_de_teste():
+            with Session(self.engine) as session:
+                yield session
+
+        for modulo in (crud_produtos, busca):
+            patcher = mock.patch.object(modulo, "get_session", sessao_de_teste)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        busca.indice_produtos.invalidar()
+
+    def tearDown(self):
+        self.engine.dispose()
+
+
+class TestSincronizarProdutos(BancoProdutos):
+
+    def nomes(self):
+        with Session(self.engine) as session:
+            return {p.sku: p.nome for p in session.exec(select(Produto)).all()}
+
+    def test_contagens_e_upsert_em_lotes(self):
+        # Formato do relatório do Mercado Livre/Amazon, com SKU repetido e SKU vazio
+        df = pd.DataFrame({
+            "SKU": ["A1", "A2", "B1", "B1", None, "B2"],
+            "Nome": ["Produto A1", "Produto A2 novo", "Produto B1", "Outra variação", "Sem SKU", ""],
+            "Estoque": [1, 2, 3, 4, 5, 6],
+        })
+
+        contagem = crud_produtos.sincronizar_produtos(df, tamanho_lote=2)
+
+        self.assertEqual(contagem, {"inseridos": 2, "atualizados": 1, "inalterados": 1})
+        self.assertEqual(self.nomes(), {
+            "A1": "Produto A1", "A2": "Produto A2 novo", "B1": "Produto B1", "B2": "B2"
+        })
+        self.assertEqual(
+            crud_produtos.sincronizar_produtos(df),
+            {"inseridos": 0, "atualizados": 0, "inalterados": 4}
+        )
+
+    def test_lista_com_sku_repetido_fica_com_a_ultima_ocorrencia(self):
+        contagem = crud_produtos.sincronizar_produtos([
+            {"sku": "C1", "nome": "Primeiro nome"},
+            {"sku": "A1", "nome": "Produto A1"},
+            {"sku": "C1", "nome": "Nome final"},
+            {"sku": "A2", "nome": "Produto A2 antigo"},
+            {"sku": "A2", "nome": "Produto A2 novo"},
+        ], tamanho_lote=2)
+
+        self.assertEqual(contagem, {"inseridos": 1, "atualizados": 1, "inalterados": 1})
+        nomes = self.nomes()
+        self.assertEqual((nomes["C1"], nomes["A2"]), ("Nome final", "Produto A2 novo"))
+
+    def test_dataframe_do_mercos_sem_atualizar_nomes(self):
+        df = pd.DataFrame({
+            "SKU": ["A1", "C1"],
+            "Produto": ["Nome do Mercos", "Produto C1"],
+            "Depósito": ["Grupo Vision", "Grupo Vision"],
+            "Estoque": [10, 20],
+        })
+
+        contagem = crud_produtos.sincronizar_produtos(df, atualizar_nomes=False)
+
+        self.assertEqual(contagem, {"inseridos": 1, "atualizados": 0, "inalterados": 1})
+        self.assertEqual(self.nomes()["A1"], "Produto A1")
+
+
+class TestBuscaProdutos(BancoProdutos):
+    """Busca por prefixo no índice em memória (o SQLite não tem a coluna tsvector)."""
+
+    def setUp(self):
+        super().setUp()
+        crud_produtos.sincronizar_produtos([
+            {"sku": "KIT-24", "nome": "Kit Galaxy 24 peças"},
+            {"sku": "KIT-2", "nome": "Kit iPhone"},
+            {"sku": "CAPA-1", "nome": "Capa Galaxy S24"},
+        ])
+
+    def skus(self, termo, limite=None):
+        return [produto.sku for produto in crud_produtos.listar_produtos(termo, limite=limite)]
+
+    def test_palavras_como_prefixo_com_ranking_e_limite(self):
+        self.assertEqual(self.skus("galax"), ["CAPA-1", "KIT-24"])
+        self.assertEqual(self.skus("kit 24"), ["KIT-24"])
+        self.assertEqual(self.skus("kit-2"), ["KIT-2", "KIT-24"])  # SKU exato primeiro
+        self.assertEqual(self.skus("kit", limite=1), ["KIT-2"])
+        self.assertEqual(self.skus("xyz"), [])
+
+    def test_trecho_no_meio_quando_nenhum_prefixo_casa(self):
+        self.assertEqual(self.skus("alax"), ["CAPA-1", "KIT-24"])
+        self.assertEqual(self.skus("IT-2"), ["KIT-2", "KIT-24"])
+        self.assertEqual(self.skus("alax", limite=1), ["CAPA-1"])
+
+    def test_termo_so_com_pontuacao_busca_o_trecho(self):
+        crud_produtos.sincronizar_produtos([{"sku": "CABO-3", "nome": "Cabo 12/3 metros"}])
+        self.assertEqual(self.skus("-"), ["CABO-3", "CAPA-1", "KIT-2", "KIT-24"])
+        self.assertEqual(self.skus("/"), ["CABO-3"])
+        self.assertEqual(self.skus("2/3"), ["CABO-3"])
+
+        with Session(self.engine) as session:
+            session.add(Deposito(nome="CD - Sul"))
+            session.add(Deposito(nome="Loja"))
+            session.commit()
+        busca.indice_depositos.invalidar()
+        self.assertEqual([deposito.nome for deposito in busca.buscar_depositos(" - ")], ["CD - Sul"])
+        self.assertEqual(busca.buscar_depositos("  "), [])
+
+    def test_listagem_filtrada_nao_limita_por_padrao(self):
+        crud_produtos.sincronizar_produtos([
+            {"sku": f"LOTE-{i:03d}", "nome": f"Produto em lote {i}"} for i in range(busca.LIMITE_BUSCA + 10)
+        ])
+        self.assertEqual(len(crud_produtos.listar_produtos("lote")), busca.LIMITE_BUSCA + 10)
+        self.assertEqual(len(busca.buscar_produtos("lote")), busca.LIMITE_BUSCA)
+
+    def test_indice_acompanha_alteracoes_do_cadastro(self):
+        self.assertEqual(self.skus("galax"), ["CAPA-1", "KIT-24"])
+        crud_produtos.atualizar_produto("CAPA-1", novo_nome="Capa Moto G")
+        crud_produtos.deletar_produto("KIT-24")
+        self.assertEqual(self.skus("galax"), [])
+        self.assertEqual(self.skus("moto"), ["CAPA-1"])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,83 @@
+import os
+import unittest
+from unittest import mock
+
+# O engine de PostgreSQL é montado sem conectar; o DATABASE_URL só precisa existir para importar o módulo
+os.environ.setdefault("DATABASE_URL", "sqlite://")
+
+from src.db import database
+
+URL_POSTGRES = "postgresql://usuario@servidor/banco"
+VARIAVEIS = (
+    "DB_POOL_SIZE", "DB_MAX_OVERFLOW", "DB_POOL_TIMEOUT", "DB_POOL_RECYCLE", "DB_POOL_PRE_PING",
+    "DB_ECHO", "DB_SSLMODE", "DB_CONNECT_TIMEOUT", "DB_KEEPALIVES_IDLE",
+)
+
+
+class TestCriarEngine(unittest.TestCase):
+
+    def setUp(self):
+        # Parte de um ambiente sem nenhuma das variáveis DB_*
+        ambiente = {nome: valor for nome, valor in os.environ.items() if nome not in VARIAVEIS}
+        patcher = mock.patch.dict(os.environ, ambiente, clear=True)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def argumentos(self, url=URL_POSTGRES, **kwargs):
+        """Argumentos passados a create_engine por criar_engine (o engine é criado, mas não conecta)."""
+        with mock.patch.object(database, "create_engine", wraps=database.create_engine) as create_engine:
+            database.criar_engine(url, **kwargs).dispose()
+        return create_engine.call_args
+
+    def test_padroes_para_o_neon(self):
+        chamada = self.argumentos()
+        self.assertEqual(chamada.args, (URL_POSTGRES,))
+        self.assertEqual({k: v for k, v in chamada.kwargs.items() if k != "connect_args"}, {
+            "echo": False, "pool_size": 5, "max_overflow": 5, "pool_timeout": 30,
+            "pool_recycle": 300, "pool_pre_ping": True, "pool_use_lifo": True,
+        })
+        connect_args = chamada.kwargs["connect_args"]
+        self.assertEqual(
+            (connect_args["sslmode"], connect_args["connect_timeout"], connect_args["keepalives_idle"]),
+            ("require", 10, 30)
+        )
+
+    def test_variaveis_de_ambiente(self):
+        os.environ.update({
+            "DB_POOL_SIZE": "2", "DB_MAX_OVERFLOW": "0", "DB_POOL_TIMEOUT": "7", "DB_POOL_RECYCLE": "60",
+            "DB_POOL_PRE_PING": "não", "DB_ECHO": " Sim ", "DB_SSLMODE": "disable",
+            "DB_CONNECT_TIMEOUT": "3", "DB_KEEPALIVES_IDLE": "15",
+        })
+        kwargs = self.argumentos().kwargs
+        self.assertEqual(
+            [kwargs[k] for k in ("pool_size", "max_overflow", "pool_timeout", "pool_recycle", "pool_pre_ping", "echo")],
+            [2, 0, 7, 60, False, True]
+        )
+        self.assertEqual(
+            [kwargs["connect_args"][k] for k in ("sslmode", "connect_timeout", "keepalives_idle")],
+            ["disable", 3, 15]
+        )
+
+        # Argumentos explícitos prevalecem sobre o ambiente, inclusive zero e False
+        kwargs = self.argumentos(pool_size=0, pool_pre_ping=True, echo=False, connect_timeout=0).kwargs
+        self.assertEqual((kwargs["pool_size"], kwargs["pool_pre_ping"], kwargs["echo"]), (0, True, False))
+        self.assertEqual(kwargs["connect_args"]["connect_timeout"], 0)
+
+        # Variável vazia vale como não informada
+        os.environ["DB_POOL_SIZE"] = ""
+        self.assertEqual(self.argumentos().kwargs["pool_size"], 5)
+
+    def test_sqlite_sem_pool_nem_parametros_do_libpq(self):
+        os.environ["DB_POOL_SIZE"] = "2"
+        chamada = self.argumentos("sqlite://")
+        self.assertEqual(chamada.args, ("sqlite://",))
+        self.assertEqual(chamada.kwargs, {"echo": False})
+
+    def test_valor_invalido_falha_na_criacao(self):
+        os.environ["DB_POOL_SIZE"] = "cinco"
+        with self.assertRaises(ValueError):
+            self.argumentos()
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,146 @@
+import os
+import random
+import tempfile
+import unittest
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+from unittest import mock
+
+# Os testes usam SQLite em memória; o DATABASE_URL só precisa existir para importar o módulo
+os.environ.setdefault("DATABASE_URL", "sqlite://")
+
+import pandas as pd
+from sqlmodel import SQLModel, Session, create_engine, select
+from src.db import importacao_estoque
+from src.db.crud_estoque import _aplicar_movimentacao, _calcular_saldos
+from src.db.models import Deposito, Estoque, Produto, SaldoEstoque, SaldoSnapshot, TipoEstoque
+
+
+class TestImportacaoEstoque(unittest.TestCase):
+    """Importação em massa em SQLite (INSERT em lote no lugar do COPY, mesmo recálculo de saldo)."""
+
+    def setUp(self):
+        self._preparar_banco()
+
+        @contextmanager
+        def sessao():
+            with Session(self.engine) as session:
+                yield session
+
+        patcher = mock.patch.object(importacao_estoque, "get_session", sessao)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+        self.diretorio = tempfile.TemporaryDirectory()
+        self.addCleanup(self.diretorio.cleanup)
+
+    def _preparar_banco(self):
+        self.engine = create_engine("sqlite://")
+        SQLModel.metadata.create_all(self.engine)
+
+        with Session(self.engine) as session:
+            for sku in ("A", "B"):
+                session.add(Produto(sku=sku, nome=f"Produto {sku}"))
+            session.add(Deposito(nome="Loja"))
+            session.add(Deposito(nome="CD"))
+            # Movimentações já existentes, posteriores a parte do arquivo importado
+            session.add(Estoque(sku="A", deposito_id=1, quantidade=10, tipo=TipoEstoque.ENTRADA,
+                                data_hora=datetime(2025, 3, 1), saldo=10))
+            session.add(SaldoEstoque(sku="A", deposito_id=1, saldo=10))
+            session.add(SaldoSnapshot(sku="A", deposito_id=1, data_referencia=datetime(2025, 2, 1), saldo=0))
+            session.commit()
+
+    def _arquivo(self, linhas, nome="movimentacoes.csv"):
+        caminho = os.path.join(self.diretorio.name, nome)
+        df = pd.DataFrame(linhas)
+        if nome.endswith(".parquet"):
+            df.to_parquet(caminho, index=False)
+        else:
+            df.to_csv(caminho, index=False)
+        return caminho
+
+    def test_saldos_recalculados_apos_importacao(self):
+        gerador = random.Random(7)
+        inicio = datetime(2025, 1, 1)
+        linhas = []
+        for i in range(600):
+            tipo = gerador.choices(["Entrada", "saída", "Balanço"], weights=[6, 3, 1])[0]
+            linhas.append({
+                "sku": gerador.choice("AB"),
+                "deposito_id": gerador.choice([1, 2]),
+                "quantidade": gerador.randint(0, 5) if tipo == "saída" else gerador.randint(0, 40),
+                "tipo": tipo,
+                "data_hora": (inicio + timedelta(hours=3 * i)).isoformat(),
+            })
+
+        for nome in ("movimentacoes.csv", "movimentacoes.parquet"):
+            with self.subTest(arquivo=nome):
+                self._preparar_banco()
+                resultado = importacao_estoque.importar_movimentacoes(
+                    self._arquivo(linhas, nome), tamanho_lote=128, permitir_saldo_negativo=True
+                )
+                self.assertEqual(resultado["linhas"], 600)
+
+                with Session(self.engine) as session:
+                    # Saldo de cada linha igual ao recálculo sequencial do histórico
+                    saldos = {}
+                    for registro in session.exec(select(Estoque).order_by(Estoque.data_hora, Estoque.id)):
+                        par = (registro.sku, registro.deposito_id)
+                        saldos[par] = _aplicar_movimentacao(saldos.get(par, 0), TipoEstoque(registro.tipo), registro.quantidade)
+                        self.assertEqual(registro.saldo, saldos[par])
+
+                    materializados = {(r.sku, r.deposito_id): r.saldo for r in session.exec(select(SaldoEstoque))}
+                    self.assertEqual(materializados, _calcular_saldos(session))
+
+                    data_snapshot = datetime(2025, 2, 1)
+                    esperados = {
+                        par: saldo
+                        for par, saldo in _calcular_saldos(session, ate=data_snapshot).items()
+                        if saldo != 0
+                    }
+                    snapshot = {
+                        (r.sku, r.deposito_id): r.saldo
+                        for r in session.exec(select(SaldoSnapshot).where(SaldoSnapshot.data_referencia == data_snapshot))
+                    }
+                    self.assertEqual(snapshot, esperados)
+
+    def test_linhas_sem_data_hora_na_ordem_do_arquivo(self):
+        # Sem data/hora, cada linha recebe um instante distinto: o balanço separa as entradas
+        linhas = [
+            {"sku": "B", "deposito_id": 2, "quantidade": 5, "tipo": "Entrada"},
+            {"sku": "B", "deposito_id": 2, "quantidade": 10, "tipo": "Balanço"},
+            {"sku": "B", "deposito_id": 2, "quantidade": 3, "tipo": "Entrada"},
+            {"sku": "B", "deposito_id": 1, "quantidade": 4, "tipo": "Entrada"},
+        ]
+        importacao_estoque.importar_movimentacoes(self._arquivo(linhas), tamanho_lote=2)
+
+        with Session(self.engine) as session:
+            importadas = session.exec(select(Estoque).where(Estoque.sku == "B").order_by(Estoque.id)).all()
+            datas = [registro.data_hora for registro in importadas]
+            self.assertEqual(datas, sorted(set(datas)))
+            self.assertEqual([registro.saldo for registro in importadas], [5, 10, 13, 4])
+
+            materializados = {(r.sku, r.deposito_id): r.saldo for r in session.exec(select(SaldoEstoque))}
+            self.assertEqual(materializados, _calcular_saldos(session))
+            self.assertEqual(materializados[("B", 2)], 13)
+
+    def test_arquivo_invalido_nao_grava_nada(self):
+        validas = [{"sku": "B", "deposito_id": 2, "quantidade": 5, "tipo": "Entrada"}]
+        casos = [
+            [{"sku": "X", "deposito_id": 1, "quantidade": 1, "tipo": "Entrada"}],
+            [{"sku": "A", "deposito_id": 9, "quantidade": 1, "tipo": "Entrada"}],
+            [{"sku": "A", "deposito_id": 1, "quantidade": 1, "tipo": "Ajuste"}],
+            [{"sku": "A", "deposito_id": 1, "quantidade": 11, "tipo": "Saída", "data_hora": "2025-04-01"}],
+        ]
+        for linhas in casos:
+            with self.subTest(linhas=linhas):
+                with self.assertRaises(ValueError):
+                    importacao_estoque.importar_movimentacoes(self._arquivo(validas + linhas), tamanho_lote=1)
+
+        with Session(self.engine) as session:
+            self.assertEqual(len(session.exec(select(Estoque)).all()), 1)
+            self.assertEqual(session.get(SaldoEstoque, ("A", 1)).saldo, 10)
+
+
+if __name__ == "__main__":
+    unittest.main()
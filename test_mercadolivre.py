@@ -0,0 +1,327 @@
+import asyncio
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+import unittest
+from unittest import mock
+
+import httpx
+
+from src.api.armazem_tokens import ArmazemTokens
+from src.api.cache_envios import CacheEnvios
+from src.api.mercadolivre import ML_ITEM_ATTRIBUTES, MercadoLivreAPI, MercadoLivreAPIError, MLAsyncClient
+
+CREDENCIAIS = {
+    "MERCADO_LIVRE_CLIENT_ID": "id",
+    "MERCADO_LIVRE_CLIENT_SECRET": "segredo",
+    "MERCADO_LIVRE_USER_ID": "123",
+}
+
+
+class TestClienteAssincrono(unittest.TestCase):
+
+    def setUp(self):
+        self.renovacoes = 0
+        self.token_valido = "novo"
+
+        def responder(request: httpx.Request) -> httpx.Response:
+            if request.url.path == "/oauth/token":
+                self.renovacoes += 1
+                return httpx.Response(200, json={"access_token": "novo", "refresh_token": "r2"})
+            if request.headers["Authorization"] != f"Bearer {self.token_valido}":
+                return httpx.Response(401, json={"message": "invalid access token"})
+            return httpx.Response(200, json={"id": request.url.params["id"]})
+
+        self.cliente = MLAsyncClient(transport=httpx.MockTransport(responder))
+        self.addCleanup(self.cliente.close)
+        diretorio = tempfile.TemporaryDirectory()
+        self.addCleanup(diretorio.cleanup)
+        self.armazem = ArmazemTokens(os.path.join(diretorio.name, "tokens.sqlite3"))
+        self.api = self.nova_api()
+        self.api.token_manager.access_token = "expirado"
+        self.api.token_manager.refresh_token_value = "r1"
+
+    def nova_api(self) -> MercadoLivreAPI:
+        with mock.patch.dict(os.environ, CREDENCIAIS), \
+                mock.patch("src.api.mercadolivre.armazem_tokens", self.armazem):
+            return MercadoLivreAPI(http_client=self.cliente)
+
+    def test_rajada_de_401_renova_o_token_uma_vez(self):
+        async def rajada():
+            return await asyncio.gather(*(
+                self.api._make_request_async("https://api.mercadolibre.com/teste", {"id": i})
+                for i in range(20)
+            ))
+
+        respostas = self.api._run(rajada())
+        self.assertEqual([resposta["id"] for resposta in respostas], [str(i) for i in range(20)])
+        self.assertEqual(self.renovacoes, 1)
+        self.assertEqual(self.api.token_manager.refresh_token_value, "r2")
+
+        # Versão síncrona, já com o token renovado
+        self.assertEqual(self.api._make_request("https://api.mercadolibre.com/teste", {"id": 7}), {"id": "7"})
+        self.assertEqual(self.renovacoes, 1)
+
+    def test_401_persistente_vira_erro_da_api(self):
+        self.token_valido = "outro"  # o token renovado também é recusado
+        with self.assertRaises(MercadoLivreAPIError):
+            self.api._make_request("https://api.mercadolibre.com/teste", {"id": 1})
+        self.assertEqual(self.renovacoes, 1)
+
+    def test_token_persistido_e_renovado_antes_de_expirar(self):
+        self.armazem.gravar("mercadolivre:id", "novo", "r1", expires_in=60)  # dentro da margem de renovação
+
+        # Uma instância nova usa o token do armazém sem esperar pela renovação...
+        api = self.nova_api()
+        self.assertEqual(api._make_request("https://api.mercadolibre.com/teste", {"id": 1}), {"id": "1"})
+
+        # ... que acontece em segundo plano e é gravada para os outros processos
+        prazo = time.time() + 5
+        while self.armazem.obter("mercadolivre:id").refresh_token == "r1" and time.time() < prazo:
+            time.sleep(0.01)
+        self.assertEqual(self.renovacoes, 1)
+        token = self.armazem.obter("mercadolivre:id")
+        self.assertEqual(token.refresh_token, "r2")
+        self.assertGreater(token.expira_em, time.time() + 3600)
+
+        self.assertEqual(self.nova_api()._make_request("https://api.mercadolibre.com/teste", {"id": 2}), {"id": "2"})
+        self.assertEqual(self.renovacoes, 1)
+
+    def test_renovacao_feita_por_outro_processo_e_aproveitada(self):
+        # Outro processo reservou o armazém e está renovando o token
+        outro_processo = ArmazemTokens(self.armazem.caminho)
+        reserva = outro_processo.reservar()
+        with mock.patch("src.api.armazem_tokens.ESPERA_RESERVA_SEGUNDOS", 0.05), \
+                self.assertRaises(sqlite3.OperationalError):
+            self.armazem.reservar()
+
+        respostas = []
+        requisicao = threading.Thread(target=lambda: respostas.append(
+            self.api._make_request("https://api.mercadolibre.com/teste", {"id": 1})
+        ))
+        requisicao.start()
+        time.sleep(0.2)
+        self.assertTrue(requisicao.is_alive())  # recebeu 401 e espera pela reserva
+
+        reserva.gravar("mercadolivre:id", "novo", "r2", expires_in=21600)
+        reserva.liberar()
+        requisicao.join(5)
+
+        # O token gravado é relido sob a reserva: o refresh token r1, já usado, não vai ao servidor
+        self.assertEqual(respostas, [{"id": "1"}])
+        self.assertEqual(self.renovacoes, 0)
+        self.assertEqual(self.api.token_manager.refresh_token_value, "r2")
+
+
+class TestBuscaItensAtivos(unittest.TestCase):
+    """_iter_active_item_ids contra uma busca falsa com offset limitado a 1000, como a do Mercado Livre."""
+
+    def setUp(self):
+        # A paginação não usa credenciais: dispensa o __init__ (que exige o .env)
+        self.api = MercadoLivreAPI.__new__(MercadoLivreAPI)
+        self.api.user_id = "123"
+        self.chamadas = []
+
+    def buscar(self, total):
+        itens = [f"MLB{i}" for i in range(total)]
+
+        def responder(url, params):
+            self.chamadas.append(dict(params))
+            limite = params["limit"]
+            if params.get("search_type") != "scan":
+                self.assertLessEqual(params["offset"] + limite, 1000)  # a API recusa offsets maiores
+                return {"results": itens[params["offset"]:params["offset"] + limite],
+                        "paging": {"total": total}}
+            inicio = int(params.get("scroll_id", 0))
+            pagina = itens[inicio:inicio + limite]
+            return {"results": pagina, "scroll_id": str(inicio + limite) if pagina else None}
+
+        with mock.patch.object(self.api, "_make_request", side_effect=responder):
+            ids = list(self.api._iter_active_item_ids())
+        self.assertEqual(ids, itens)
+        return [c.get("search_type", "offset") for c in self.chamadas]
+
+    def test_ate_1000_itens_so_com_offset(self):
+        self.assertEqual(self.buscar(250), ["offset"] * 3)
+        self.chamadas.clear()
+        self.assertEqual(self.buscar(1000), ["offset"] * 10)
+
+    def test_acima_de_1000_continua_em_modo_scan(self):
+        # O scan recomeça do início: os 1000 primeiros não se repetem na saída
+        self.assertEqual(self.buscar(2350), ["offset"] * 10 + ["scan"] * 25)
+        self.assertNotIn("scroll_id", self.chamadas[10])
+        self.assertEqual(self.chamadas[-1]["scroll_id"], "2400")
+
+    def test_sem_itens_ativos(self):
+        self.assertEqual(self.buscar(0), ["offset"])
+
+
+class TestDetalhesItens(unittest.TestCase):
+    """Busca e multiget dos itens ativos contra uma API falsa (httpx.MockTransport)."""
+
+    def setUp(self):
+        self.itens = [f"MLB{i}" for i in range(45)]
+        self.com_erro = None
+        self.lotes = []
+
+        def responder(request: httpx.Request) -> httpx.Response:
+            if request.url.path == "/users/123/items/search":
+                return httpx.Response(200, json={"results": self.itens, "paging": {"total": len(self.itens)}})
+            self.assertEqual(request.url.path, "/items")
+            self.assertEqual(request.url.params["attributes"], ML_ITEM_ATTRIBUTES)
+            lote = request.url.params["ids"].split(",")
+            self.lotes.append(lote)
+            # Um item com erro vem com o próprio código dentro de uma resposta 200
+            return httpx.Response(200, json=[
+                {"code": 404, "body": {"message": "item not found"}} if item_id == self.com_erro else
+                {"code": 200, "body": {"id": item_id, "catalog_listing": int(item_id[3:]) % 4 == 0}}
+                for item_id in lote
+            ])
+
+        cliente = MLAsyncClient(transport=httpx.MockTransport(responder))
+        self.addCleanup(cliente.close)
+        diretorio = tempfile.TemporaryDirectory()
+        self.addCleanup(diretorio.cleanup)
+        armazem = ArmazemTokens(os.path.join(diretorio.name, "tokens.sqlite3"))
+        armazem.gravar("mercadolivre:id", "valido", "r1", expires_in=21600)
+        with mock.patch.dict(os.environ, CREDENCIAIS), \
+                mock.patch("src.api.mercadolivre.armazem_tokens", armazem):
+            self.api = MercadoLivreAPI(http_client=cliente)
+
+    def test_multiget_em_lotes_de_20_sem_anuncios_de_catalogo(self):
+        itens = self.api._get_active_items_details()
+
+        self.assertEqual([len(lote) for lote in self.lotes], [20, 20, 5])
+        self.assertEqual(sum(self.lotes, []), self.itens)
+        self.assertEqual([item["id"] for item in itens], [i for i in self.itens if int(i[3:]) % 4 != 0])
+
+    def test_item_com_erro_dentro_de_resposta_200(self):
+        self.com_erro = "MLB25"
+        detalhes = self.api._iter_items_details(self.itens)
+        self.assertEqual(len([next(detalhes) for _ in range(25)]), 25)
+        with self.assertRaises(MercadoLivreAPIError):
+            next(detalhes)
+        # O lote seguinte não chega a ser buscado
+        self.assertEqual(len(self.lotes), 2)
+
+        # Como na consulta item a item, a falha de um item descarta a listagem
+        self.assertEqual(self.api._get_active_items_details(), [])
+
+
+class TestBuscaPedidos(unittest.TestCase):
+    """_fetch_orders_async contra um /orders/search falso, com respostas fora de ordem."""
+
+    def setUp(self):
+        self.api = MercadoLivreAPI.__new__(MercadoLivreAPI)
+        self.inicios = {}
+        self.simultaneas = self.maximo_simultaneas = 0
+
+    async def responder(self, url, params):
+        offset = params["offset"]
+        self.inicios[offset] = time.perf_counter()
+        self.simultaneas += 1
+        self.maximo_simultaneas = max(self.maximo_simultaneas, self.simultaneas)
+        try:
+            # Páginas posteriores respondem antes, para embaralhar a ordem de chegada
+            await asyncio.sleep(0.05 - offset / 10000)
+            pedidos = [{"id": i} for i in range(offset, min(offset + params["limit"], 230))]
+            return {"results": pedidos, "paging": {"total": 230}}
+        finally:
+            self.simultaneas -= 1
+
+    @mock.patch("src.api.mercadolivre.ML_ORDERS_RATE_LIMIT", 50)
+    @mock.patch("src.api.mercadolivre.ML_ORDERS_CONCURRENCY", 2)
+    def test_paginas_em_paralelo_limitadas_e_na_ordem_dos_offsets(self):
+        with mock.patch.object(self.api, "_make_request_async", side_effect=self.responder):
+            pedidos = asyncio.run(self.api._fetch_orders_async("https://api.mercadolibre.com/orders/search",
+                                                               {"seller": "123", "limit": 50}))
+
+        self.assertEqual([p["id"] for p in pedidos], list(range(230)))
+        self.assertEqual(sorted(self.inicios), [0, 50, 100, 150, 200])
+        self.assertEqual(self.maximo_simultaneas, 2)
+
+        # A primeira página sai sozinha; as demais respeitam 50 por segundo (uma a cada 20 ms)
+        inicios = [self.inicios[offset] for offset in (50, 100, 150, 200)]
+        self.assertGreaterEqual(inicios[0], self.inicios[0] + 0.04)
+        for anterior, seguinte in zip(inicios, inicios[1:]):
+            self.assertGreaterEqual(seguinte - anterior, 0.019)
+
+    def test_uma_unica_pagina(self):
+        async def responder(url, params):
+            return {"results": [{"id": 1}], "paging": {"total": 1}}
+
+        with mock.patch.object(self.api, "_make_request_async", side_effect=responder) as requisicao:
+            pedidos = asyncio.run(self.api._fetch_orders_async("url", {"limit": 50}))
+        self.assertEqual(pedidos, [{"id": 1}])
+        requisicao.assert_called_once()
+
+
+class TestDetalhesEnvios(unittest.TestCase):
+    """get_all_shipment_details contra um /shipments falso, com cache_envios em arquivo temporário."""
+
+    def setUp(self):
+        self.api = MercadoLivreAPI.__new__(MercadoLivreAPI)
+        diretorio = tempfile.TemporaryDirectory()
+        self.addCleanup(diretorio.cleanup)
+        self.cache = CacheEnvios(os.path.join(diretorio.name, "envios.sqlite3"),
+                                 ttl_final_segundos=86400, ttl_andamento_segundos=60)
+        patcher = mock.patch("src.api.mercadolivre.cache_envios", self.cache)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+        self.buscados = []
+        self.simultaneas = self.maximo_simultaneas = 0
+
+    async def responder(self, url, params=None):
+        shipping_id = int(url.rsplit("/", 1)[1])
+        self.buscados.append(shipping_id)
+        self.simultaneas += 1
+        self.maximo_simultaneas = max(self.maximo_simultaneas, self.simultaneas)
+        try:
+            # IDs maiores respondem antes, para embaralhar a ordem de chegada
+            await asyncio.sleep(0.03 - shipping_id / 1000)
+            if shipping_id == 13:
+                raise MercadoLivreAPIError("Erro na requisição à API")
+            # IDs pares já foram entregues; os ímpares seguem em andamento
+            return {
+                "status": "delivered" if shipping_id % 2 == 0 else "shipped",
+                "logistic_type": f"tipo {shipping_id}",
+                "shipping_option": {"cost": float(shipping_id)},
+            }
+        finally:
+            self.simultaneas -= 1
+
+    def detalhes(self, shipping_ids, agora):
+        with mock.patch.object(self.api, "_make_request_async", side_effect=self.responder), \
+                mock.patch("src.api.cache_envios.time.time", return_value=agora):
+            return asyncio.run(self.api.get_all_shipment_details(shipping_ids))
+
+    @mock.patch("src.api.mercadolivre.ML_SHIPMENTS_CONCURRENCY", 3)
+    def test_busca_limitada_e_na_ordem_dos_ids_com_falhas(self):
+        ids = [1, 2, 13, 4, 5, 6, 7, 8, 2]
+        detalhes = self.detalhes(ids, 1000.0)
+
+        # A falha fica como None na sua posição; o ID repetido é buscado uma vez
+        esperados = [None if i == 13 else (f"tipo {i}", float(i)) for i in ids]
+        self.assertEqual(detalhes, esperados)
+        self.assertEqual(sorted(self.buscados), [1, 2, 4, 5, 6, 7, 8, 13])
+        self.assertEqual(self.maximo_simultaneas, 3)
+
+    def test_cache_evita_a_requisicao_e_ttl_depende_do_status(self):
+        self.detalhes([1, 2, 13], 1000.0)
+
+        # Envios em cache não voltam à API; o que falhou não foi gravado e é buscado de novo
+        self.buscados.clear()
+        self.assertEqual(self.detalhes([2, 1, 13], 1030.0), [("tipo 2", 2.0), ("tipo 1", 1.0), None])
+        self.assertEqual(self.buscados, [13])
+
+        # Depois do TTL de andamento só o envio ainda não entregue é buscado de novo
+        self.buscados.clear()
+        self.assertEqual(self.detalhes([1, 2], 1100.0), [("tipo 1", 1.0), ("tipo 2", 2.0)])
+        self.assertEqual(self.buscados, [1])
+
+
+if __name__ == "__main__":
+    unittest.main()
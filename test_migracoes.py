@@ -0,0 +1,130 @@
+import os
+import unittest
+
+# As migrações rodam contra uma conexão falsa; o DATABASE_URL só precisa existir para importar o módulo
+os.environ.setdefault("DATABASE_URL", "sqlite://")
+
+from src.db.create_schema import MIGRATIONS, MIGRATIONS_LOCK_KEY, aplicar_migracoes
+
+TODAS = [m["versao"] for m in MIGRATIONS]
+
+
+class ConexaoFalsa:
+    """
+    Conexão psycopg2 mínima: guarda schema_migrations em memória (com commit e rollback
+    das transações) e registra cada comando com o estado de autocommit em que rodou.
+    """
+
+    def __init__(self, aplicadas=(), falhar_em=None, invalidos=()):
+        self.aplicadas = set(aplicadas)
+        self.falhar_em = falhar_em
+        self.invalidos = set(invalidos)  # índices inválidos no schema
+        self.autocommit = True
+        self.comandos = []
+        self.rollbacks = 0
+        self._pendentes = set()
+
+    def cursor(self):
+        return CursorFalso(self)
+
+    def commit(self):
+        self.aplicadas |= self._pendentes
+        self._pendentes.clear()
+
+    def rollback(self):
+        self.rollbacks += 1
+        self._pendentes.clear()
+
+
+class CursorFalso:
+
+    def __init__(self, conexao):
+        self.conexao = conexao
+        self.resultado = []
+
+    def execute(self, comando, parametros=None):
+        conexao = self.conexao
+        comando = str(comando)
+        conexao.comandos.append((" ".join(comando.split()), parametros, conexao.autocommit))
+        if comando == conexao.falhar_em:
+            raise RuntimeError("falha simulada")
+        if "FROM schema_migrations" in comando:
+            self.resultado = [(versao,) for versao in conexao.aplicadas]
+        elif "INSERT INTO schema_migrations" in comando:
+            (conexao.aplicadas if conexao.autocommit else conexao._pendentes).add(parametros[0])
+        elif "NOT i.indisvalid" in comando:
+            self.resultado = [(nome,) for nome in parametros[0] if nome in conexao.invalidos]
+        else:
+            self.resultado = []
+
+    def fetchall(self):
+        return self.resultado
+
+    def close(self):
+        pass
+
+
+class TestAplicarMigracoes(unittest.TestCase):
+
+    def test_aplica_em_ordem_sob_o_lock_e_e_idempotente(self):
+        conexao = ConexaoFalsa()
+        self.assertEqual(aplicar_migracoes(conexao), TODAS)
+        self.assertEqual(conexao.aplicadas, set(TODAS))
+
+        comandos = conexao.comandos
+        self.assertEqual(comandos[0][:2], ("SELECT pg_advisory_lock(%s)", (MIGRATIONS_LOCK_KEY,)))
+        self.assertEqual(comandos[-1][:2], ("SELECT pg_advisory_unlock(%s)", (MIGRATIONS_LOCK_KEY,)))
+        self.assertTrue(conexao.autocommit)
+
+        # Transacionais fora do autocommit; CREATE INDEX CONCURRENTLY exige autocommit
+        for migracao in MIGRATIONS:
+            primeiro = " ".join(migracao["sql"][0].split())
+            _, _, autocommit = next(c for c in comandos if c[0] == primeiro)
+            self.assertEqual(autocommit, not migracao["transacional"], migracao["versao"])
+
+        # Segunda execução: nada a aplicar, só o lock e a leitura das versões
+        conexao.comandos.clear()
+        self.assertEqual(aplicar_migracoes(conexao), [])
+        self.assertEqual([c[0] for c in conexao.comandos], [
+            "SELECT pg_advisory_lock(%s)", "SELECT versao FROM schema_migrations", "SELECT pg_advisory_unlock(%s)",
+        ])
+
+    def test_aplica_so_as_pendentes(self):
+        conexao = ConexaoFalsa(aplicadas=TODAS[:-1])
+        self.assertEqual(aplicar_migracoes(conexao), TODAS[-1:])
+        self.assertEqual(conexao.aplicadas, set(TODAS))
+
+    def test_remove_so_os_indices_invalidos_das_migracoes(self):
+        # Um CREATE INDEX CONCURRENTLY interrompido na migração 2 e um índice inválido alheio
+        conexao = ConexaoFalsa(aplicadas=[1], invalidos={"ix_estoque_balanco", "ix_de_outra_aplicacao"})
+        aplicar_migracoes(conexao)
+
+        consultas = [c[1][0] for c in conexao.comandos if "NOT i.indisvalid" in c[0]]
+        self.assertEqual(consultas, [
+            ["ix_estoque_sku_deposito_data_hora", "ix_estoque_balanco", "ix_estoque_deposito_data_hora",
+             "ix_estoque_data_hora"],
+            ["ix_produto_busca", "ix_produto_sku_prefixo", "ix_deposito_busca"],
+        ])
+        remocoes = [c[0] for c in conexao.comandos if "DROP INDEX CONCURRENTLY" in c[0]]
+        self.assertEqual(len(remocoes), 1)
+        self.assertIn("Identifier('ix_estoque_balanco')", remocoes[0])
+
+    def test_falha_desfaz_a_migracao_transacional_e_libera_o_lock(self):
+        # Falha perto do fim da migração de particionamento (transacional), com a tabela já trocada
+        particionamento = next(m for m in MIGRATIONS if m["versao"] == 4)
+        conexao = ConexaoFalsa(falhar_em=particionamento["sql"][-2])
+
+        with self.assertRaises(RuntimeError):
+            aplicar_migracoes(conexao)
+        self.assertEqual(conexao.aplicadas, {1, 2, 3})
+        self.assertEqual(conexao.rollbacks, 1)
+        self.assertTrue(conexao.autocommit)
+        self.assertEqual(conexao.comandos[-1][0], "SELECT pg_advisory_unlock(%s)")
+
+        # A nova tentativa recomeça pela migração que falhou
+        conexao.falhar_em = None
+        self.assertEqual(aplicar_migracoes(conexao), [4])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,235 @@
+import os
+import unittest
+from contextlib import contextmanager
+from datetime import datetime
+from unittest import mock
+
+# Os testes usam SQLite em memória; o DATABASE_URL só precisa existir para importar o módulo
+os.environ.setdefault("DATABASE_URL", "sqlite://")
+
+from sqlalchemy import event
+from sqlalchemy.pool import StaticPool
+from sqlmodel import SQLModel, Session, create_engine, func, select
+from src.db import crud_estoque
+from src.db.crud_estoque import _calcular_saldos
+from src.db.models import Deposito, Estoque, Produto, SaldoEstoque, TipoEstoque
+
+ENTRADA, SAIDA, BALANCO = TipoEstoque.ENTRADA, TipoEstoque.SAIDA, TipoEstoque.BALANCO
+
+
+class BancoEstoque(unittest.TestCase):
+    """Base dos testes: SQLite em memória com três produtos e dois depósitos, sem movimentações."""
+
+    def setUp(self):
+        self.engine = create_engine("sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool)
+        SQLModel.metadata.create_all(self.engine)
+        with Session(self.engine) as session:
+            for sku in ("A", "B", "C"):
+                session.add(Produto(sku=sku, nome=f"Produto {sku}"))
+            session.add(Deposito(nome="Loja"))
+            session.add(Deposito(nome="CD"))
+            session.commit()
+            self.loja, self.cd = [d.id for d in session.exec(select(Deposito).order_by(Deposito.id)).all()]
+
+        @contextmanager
+        def sessao_de_teste():
+            with Session(self.engine) as session:
+                yield session
+
+        patcher = mock.patch.object(crud_estoque, "get_session", sessao_de_teste)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+        # Comandos SQL executados, para conferir as consultas de validação e de bloqueio
+        self.comandos = []
+        ouvinte = lambda conn, cursor, sql, parametros, contexto, executemany: self.comandos.append((sql, parametros))
+        event.listen(self.engine, "before_cursor_execute", ouvinte)
+        self.addCleanup(event.remove, self.engine, "before_cursor_execute", ouvinte)
+
+    def tearDown(self):
+        self.engine.dispose()
+
+    def linha(self, sku, deposito_id, quantidade, tipo):
+        return {"sku": sku, "deposito_id": deposito_id, "quantidade": quantidade, "tipo": tipo}
+
+    def saldos_materializados(self):
+        with Session(self.engine) as session:
+            return {(r.sku, r.deposito_id): r.saldo for r in session.exec(select(SaldoEstoque)).all()}
+
+    def quantidade_movimentacoes(self):
+        with Session(self.engine) as session:
+            return session.exec(select(func.count()).select_from(Estoque)).one()
+
+
+class TestMovimentacoesEmLote(BancoEstoque):
+
+    def test_lote_com_varios_pares_e_encadeamento_de_saldo(self):
+        linhas = [
+            self.linha("A", self.loja, 10, ENTRADA),
+            self.linha("B", self.cd, 5, ENTRADA),
+            self.linha("A", self.loja, 3, SAIDA),
+            self.linha("C", self.loja, 8, BALANCO),
+            self.linha("A", self.loja, 20, BALANCO),
+            self.linha("B", self.cd, 5, SAIDA),
+            self.linha("A", self.loja, 6, SAIDA),
+        ]
+        self.comandos.clear()
+        with Session(self.engine) as session:
+            registros = crud_estoque._registrar_linhas(session, linhas)
+            session.commit()
+
+            # RETURNING na ordem das linhas: cada registro corresponde à linha de mesma posição
+            self.assertEqual(
+                [(r.sku, r.deposito_id, r.quantidade, r.tipo) for r in registros],
+                [(l["sku"], l["deposito_id"], l["quantidade"], l["tipo"]) for l in linhas]
+            )
+            self.assertEqual([r.saldo for r in registros], [10, 5, 7, 8, 20, 0, 14])
+            self.assertEqual([r.data_hora for r in registros], sorted(r.data_hora for r in registros))
+
+        # Validação de produtos e depósitos com uma consulta IN cada, qualquer que seja o tamanho do lote
+        consultas = [sql for sql, _ in self.comandos if sql.lstrip().upper().startswith("SELECT")]
+        self.assertEqual(sum("FROM produto" in sql for sql in consultas), 1)
+        self.assertEqual(sum("FROM deposito" in sql for sql in consultas), 1)
+
+        # Saldos bloqueados em ordem fixa de (sku, depósito), independente da ordem das linhas
+        sql, parametros = next((sql, p) for sql, p in self.comandos if "FROM saldo_estoque" in sql)
+        self.assertIn("ORDER BY saldo_estoque.sku, saldo_estoque.deposito_id", sql)
+        self.assertEqual(list(parametros), ["A", self.loja, "B", self.cd, "C", self.loja])
+
+        esperado = {("A", self.loja): 14, ("B", self.cd): 0, ("C", self.loja): 8}
+        self.assertEqual(self.saldos_materializados(), esperado)
+        with Session(self.engine) as session:
+            self.assertEqual(_calcular_saldos(session), esperado)
+
+    def test_linha_rejeitada_descarta_o_lote_inteiro(self):
+        self.assertEqual(crud_estoque.registrar_movimentacoes_em_lote([
+            self.linha("A", self.loja, 10, ENTRADA),
+            self.linha("B", self.loja, 4, ENTRADA),
+        ]), 2)
+        saldos = self.saldos_materializados()
+
+        lotes_invalidos = [
+            # A última saída excede o saldo que as linhas anteriores do próprio lote deixaram
+            [self.linha("B", self.loja, 1, ENTRADA), self.linha("A", self.loja, 6, SAIDA),
+             self.linha("A", self.loja, 5, SAIDA)],
+            [self.linha("A", self.loja, 1, ENTRADA), self.linha("X", self.loja, 1, ENTRADA)],
+            [self.linha("A", self.loja, 1, ENTRADA), self.linha("A", 999, 1, ENTRADA)],
+            [self.linha("A", self.loja, 1, ENTRADA), self.linha("A", self.loja, -1, ENTRADA)],
+        ]
+        for linhas in lotes_invalidos:
+            with self.subTest(linhas=linhas), self.assertRaises(ValueError):
+                crud_estoque.registrar_movimentacoes_em_lote(linhas)
+            self.assertEqual(self.quantidade_movimentacoes(), 2)
+            self.assertEqual(self.saldos_materializados(), saldos)
+
+
+class TestTransferencia(BancoEstoque):
+
+    def setUp(self):
+        super().setUp()
+        crud_estoque.registrar_movimentacoes_em_lote([
+            self.linha("A", self.loja, 10, ENTRADA),
+            self.linha("B", self.loja, 3, ENTRADA),
+            self.linha("A", self.cd, 1, ENTRADA),
+        ])
+
+    def test_transferencia_de_varios_skus_em_um_commit(self):
+        transferencias = crud_estoque.transferir_estoque_lote(self.loja, self.cd, [
+            {"sku": "A", "quantidade": 4, "observacoes": "reposição"},
+            {"sku": "B", "quantidade": 3},
+        ])
+
+        self.assertEqual(
+            [(saida.sku, saida.deposito_id, saida.tipo, saida.saldo, entrada.deposito_id, entrada.tipo, entrada.saldo)
+             for saida, entrada in transferencias],
+            [("A", self.loja, SAIDA, 6, self.cd, ENTRADA, 5), ("B", self.loja, SAIDA, 0, self.cd, ENTRADA, 3)]
+        )
+        self.assertEqual(transferencias[0][0].observacoes, "reposição")
+        self.assertEqual(self.saldos_materializados(), {
+            ("A", self.loja): 6, ("B", self.loja): 0, ("A", self.cd): 5, ("B", self.cd): 3,
+        })
+
+        saida, entrada = crud_estoque.transferir_estoque("A", self.cd, self.loja, 5)
+        self.assertEqual((saida.saldo, entrada.saldo), (0, 11))
+        self.assertEqual(crud_estoque.consultar_saldo("A", self.loja), 11)
+        self.assertEqual(crud_estoque.consultar_saldo("A", self.cd), 0)
+
+    def test_saldo_insuficiente_em_um_sku_desfaz_a_transferencia(self):
+        saldos = self.saldos_materializados()
+        movimentacoes = self.quantidade_movimentacoes()
+
+        with self.assertRaises(ValueError):
+            crud_estoque.transferir_estoque_lote(self.loja, self.cd, [
+                {"sku": "A", "quantidade": 4},
+                {"sku": "B", "quantidade": 5},  # só há 3 na loja
+            ])
+        for itens in ([{"sku": "A", "quantidade": 0}], [{"sku": "A", "quantidade": 6}, {"sku": "A", "quantidade": 5}]):
+            with self.subTest(itens=itens), self.assertRaises(ValueError):
+                crud_estoque.transferir_estoque_lote(self.loja, self.cd, itens)
+        with self.assertRaises(ValueError):
+            crud_estoque.transferir_estoque("A", self.loja, self.loja, 1)
+
+        self.assertEqual(self.quantidade_movimentacoes(), movimentacoes)
+        self.assertEqual(self.saldos_materializados(), saldos)
+
+
+class TestSaldoMaterializado(BancoEstoque):
+    """saldo_estoque deve acompanhar o histórico depois de qualquer escrita pela API pública."""
+
+    def assertSaldosIguaisAoHistorico(self):
+        with Session(self.engine) as session:
+            historico = _calcular_saldos(session)
+        materializados = self.saldos_materializados()
+        self.assertEqual(materializados, {par: historico.get(par, 0) for par in materializados})
+        for (sku, deposito_id), saldo in historico.items():
+            self.assertEqual(crud_estoque.consultar_saldo(sku, deposito_id), saldo, (sku, deposito_id))
+
+    def test_escritas_mantem_saldo_igual_ao_historico(self):
+        # Histórico anterior à tabela saldo_estoque: o par é materializado na primeira escrita
+        with Session(self.engine) as session:
+            session.add(Estoque(sku="C", deposito_id=self.cd, quantidade=7, tipo=ENTRADA,
+                                data_hora=datetime(2025, 1, 1, 8, 0, 0)))
+            session.commit()
+        self.assertEqual(crud_estoque.consultar_saldo("C", self.cd), 7)
+        self.assertEqual(self.saldos_materializados(), {})
+
+        crud_estoque.registrar_movimentacao("A", self.loja, 10, ENTRADA)
+        crud_estoque.registrar_movimentacao("C", self.cd, 2, SAIDA)
+        crud_estoque.registrar_movimentacoes_em_lote([
+            self.linha("A", self.loja, 4, SAIDA),
+            self.linha("B", self.cd, 9, BALANCO),
+            self.linha("B", self.cd, 1, ENTRADA),
+        ])
+        crud_estoque.transferir_estoque_lote(self.loja, self.cd, [{"sku": "A", "quantidade": 6}])
+        self.assertSaldosIguaisAoHistorico()
+
+        # Correção e exclusão de movimentações antigas recalculam o par pelo histórico
+        with Session(self.engine) as session:
+            balanco = session.exec(select(Estoque).where(Estoque.tipo == BALANCO)).one()
+            saida_c = session.exec(select(Estoque).where(Estoque.sku == "C", Estoque.tipo == SAIDA)).one()
+        crud_estoque.atualizar_movimentacao(balanco.id, 3, "recontagem")
+        crud_estoque.excluir_movimentacao(saida_c.id)
+        self.assertSaldosIguaisAoHistorico()
+        self.assertEqual(self.saldos_materializados(), {
+            ("A", self.loja): 0, ("A", self.cd): 6, ("B", self.cd): 4, ("C", self.cd): 7,
+        })
+
+    def test_balanco_e_entradas_na_mesma_data_hora(self):
+        # Empate de data/hora: vale a ordem dos ids, a mesma usada para escolher o último balanço
+        instante = datetime(2025, 1, 1, 8, 0, 0)
+        with Session(self.engine) as session:
+            for quantidade, tipo in ((5, ENTRADA), (10, BALANCO), (3, ENTRADA)):
+                session.add(Estoque(sku="A", deposito_id=self.loja, quantidade=quantidade, tipo=tipo,
+                                    data_hora=instante))
+                session.flush()
+            session.commit()
+
+        # A entrada anterior ao balanço (id menor) não entra no saldo: 10 + 3
+        self.assertEqual(crud_estoque.consultar_saldos("A", self.loja), {("A", self.loja): 13})
+
+        crud_estoque.registrar_movimentacao("A", self.loja, 1, ENTRADA)
+        self.assertEqual(self.saldos_materializados(), {("A", self.loja): 14})
+        self.assertSaldosIguaisAoHistorico()
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,78 @@
+import os
+import unittest
+from datetime import datetime
+
+# Sem PostgreSQL os testes de partição são pulados; o DATABASE_URL só precisa existir para importar os módulos
+os.environ.setdefault("DATABASE_URL", "sqlite://")
+
+from sqlalchemy import text
+from src.db import database
+from src.db.create_schema import MIGRATIONS
+
+POSTGRES = os.environ["DATABASE_URL"].startswith(("postgresql", "postgres://"))
+
+# Função criar_particoes_estoque, como criada pela migração 4
+SQL_CRIAR_PARTICOES = next(m for m in MIGRATIONS if m["versao"] == 4)["sql"][0]
+
+
+@unittest.skipUnless(POSTGRES, "requer DATABASE_URL apontando para um PostgreSQL")
+class TestLimitesParticoes(unittest.TestCase):
+    """
+    criar_particoes_estoque em um schema temporário (desfeito no rollback), com o engine da
+    aplicação e a sessão em UTC, o padrão do Neon.
+    """
+
+    def setUp(self):
+        self.engine = database.criar_engine(pool_size=1, max_overflow=0)
+        self.addCleanup(self.engine.dispose)
+        self.conexao = self.engine.connect()
+        self.addCleanup(self.conexao.close)
+        self.transacao = self.conexao.begin()
+        self.addCleanup(self.transacao.rollback)
+
+        self.conexao.execute(text("CREATE SCHEMA teste_particoes"))
+        self.conexao.execute(text("SET LOCAL search_path TO teste_particoes"))
+        self.conexao.execute(text("SET LOCAL TIME ZONE 'UTC'"))
+        self.conexao.execute(text("""
+            CREATE TABLE estoque (
+                id SERIAL, sku VARCHAR(50), deposito_id INTEGER, quantidade INTEGER NOT NULL,
+                tipo VARCHAR(50) NOT NULL, data_hora TIMESTAMP WITH TIME ZONE NOT NULL,
+                observacoes VARCHAR(200), saldo INTEGER NOT NULL DEFAULT 0,
+                PRIMARY KEY (id, data_hora)
+            ) PARTITION BY RANGE (data_hora)
+        """))
+        self.conexao.execute(text("CREATE TABLE estoque_padrao PARTITION OF estoque DEFAULT"))
+        self.conexao.execute(text(SQL_CRIAR_PARTICOES))
+
+    def test_limites_em_utc_e_datas_locais_caem_no_mes_certo(self):
+        criadas = self.conexao.execute(text("SELECT criar_particoes_estoque('2025-03-10', '2025-04-02')")).scalar()
+        self.assertEqual(criadas, 2)
+        limites = dict(self.conexao.execute(text("""
+            SELECT c.relname, pg_get_expr(c.relpartbound, c.oid)
+            FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid
+            WHERE i.inhparent = 'estoque'::regclass AND c.relname <> 'estoque_padrao'
+        """)).all())
+        self.assertEqual(limites, {
+            "estoque_2025_03": "FOR VALUES FROM ('2025-03-01 00:00:00+00') TO ('2025-04-01 00:00:00+00')",
+            "estoque_2025_04": "FOR VALUES FROM ('2025-04-01 00:00:00+00') TO ('2025-05-01 00:00:00+00')",
+        })
+
+        # Datas locais sem fuso, como as gravadas pela aplicação (ficam gravadas como UTC), nas bordas do mês
+        for data_hora in (datetime(2025, 3, 31, 23, 30), datetime(2025, 4, 1, 0, 30), datetime(2025, 5, 1, 0, 0)):
+            self.conexao.execute(
+                text("INSERT INTO estoque (quantidade, tipo, data_hora) VALUES (1, 'Entrada', :data_hora)"),
+                {"data_hora": data_hora}
+            )
+        particoes = self.conexao.execute(text("SELECT tableoid::regclass::text FROM estoque ORDER BY data_hora")).scalars().all()
+        self.assertEqual(particoes, ["estoque_2025_03", "estoque_2025_04", "estoque_padrao"])
+
+        # Uma nova partição recolhe da padrão as linhas do seu mês
+        self.assertEqual(self.conexao.execute(text("SELECT criar_particoes_estoque('2025-05-01', '2025-05-01')")).scalar(), 1)
+        self.assertEqual(
+            self.conexao.execute(text("SELECT tableoid::regclass::text FROM estoque WHERE data_hora >= '2025-05-01'")).scalar(),
+            "estoque_2025_05"
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()
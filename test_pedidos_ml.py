@@ -0,0 +1,170 @@
+import tempfile
+import unittest
+from datetime import date
+from unittest import mock
+
+import pandas as pd
+
+from src.api.mercadolivre import MercadoLivreAPI
+from src.api.pedidos_ml import SALES_COLUMNS, STORE_COLUMNS, ArmazemPedidosML
+
+
+def linhas(*pedidos):
+    """Uma linha por (order_id, data de fechamento, status)"""
+    df = pd.DataFrame([
+        {
+            'order_id': order_id, 'order_status': status, 'payment_status': 'approved',
+            'product_name': 'Produto', 'date': pd.Timestamp(data, tz='America/Sao_Paulo'),
+            'sku': 'SKU1', 'qty': 1, 'unit_price': 10.0, 'paid_amount_calculated': 15.0,
+            'paid_amount_calculated_no_ship_cost': 10.0, 'logistic_cost': 5.0,
+            'logistic_type': 'fulfillment', 'date_last_updated': data,
+        }
+        for order_id, data, status in pedidos
+    ])
+    return df[STORE_COLUMNS]
+
+
+def pedido(order_id, itens, **campos):
+    """Pedido como vem de /orders/search, com um item por (sku, quantidade, preço)"""
+    return {
+        'id': order_id, 'status': 'paid', 'date_closed': '2025-01-31T22:30:00.000-04:00',
+        'date_last_updated': '2025-02-02T12:00:00+00:00', 'shipping': {'id': 500 + order_id},
+        'payments': [{'order_id': order_id, 'status': 'approved'}],
+        'order_items': [
+            {'item': {'seller_sku': sku, 'title': f'Produto {sku}'}, 'quantity': qtd, 'unit_price': preco}
+            for sku, qtd, preco in itens
+        ],
+        **campos,
+    }
+
+
+class TestArmazemPedidosML(unittest.TestCase):
+
+    def setUp(self):
+        diretorio = tempfile.TemporaryDirectory()
+        self.addCleanup(diretorio.cleanup)
+        self.armazem = ArmazemPedidosML(diretorio.name)
+
+    def test_sincronizacao_substitui_pedidos_alterados(self):
+        self.armazem.gravar(linhas(
+            (1, '2025-01-31 23:00', 'paid'),
+            (2, '2025-02-01 10:00', 'paid'),
+            (3, '2025-03-15 10:00', 'paid'),
+        ), marco='2025-03-15T10:00:00.000+00:00', inicio=date(2025, 1, 1))
+
+        # Segunda sincronização: o pedido 2 foi cancelado
+        meses = self.armazem.gravar(linhas((2, '2025-02-01 10:00', 'cancelled')), marco='2025-04-01T00:00:00.000+00:00')
+        self.assertEqual(meses, 1)
+
+        df = self.armazem.ler(date(2025, 1, 31), date(2025, 2, 28))
+        self.assertEqual(list(df.columns), SALES_COLUMNS)
+        self.assertEqual(df[['order_id', 'order_status']].values.tolist(), [[1, 'paid'], [2, 'cancelled']])
+
+        self.assertEqual(self.armazem.estado(), {'marco': '2025-04-01T00:00:00.000+00:00', 'inicio': '2025-01-01'})
+        self.assertTrue(self.armazem.cobre(date(2025, 1, 1)))
+        self.assertFalse(self.armazem.cobre(date(2024, 12, 31)))
+
+    def test_armazem_vazio(self):
+        self.assertEqual(self.armazem.estado(), {'marco': None, 'inicio': None})
+        self.assertTrue(self.armazem.ler(date(2025, 1, 1), date(2025, 12, 31)).empty)
+
+
+class TestNormalizacaoPedidos(unittest.TestCase):
+
+    def setUp(self):
+        # _normalize_orders não usa credenciais: dispensa o __init__ (que exige o .env)
+        self.api = MercadoLivreAPI.__new__(MercadoLivreAPI)
+
+    def test_uma_linha_por_item_com_envio_e_fuso(self):
+        pedidos = [
+            pedido(1, [('A', 2, 10), ('B', 1, 5.5)]),
+            pedido(2, [('C', 1, 20)], payments=[]),
+            pedido(3, [('D', 1, 1)], shipping=None),  # sem envio: ignorado
+            pedido(4, []),
+            pedido(5, [('E', 1, 2)]),
+        ]
+        df = self.api._normalize_orders(pedidos, {501: ('fulfillment', 3.0), 505: (None, 1.0)})
+
+        self.assertEqual(list(df.columns), STORE_COLUMNS)
+        self.assertEqual(df['order_id'].tolist(), [1, 1, 2, 5])
+        self.assertEqual(df['sku'].tolist(), ['A', 'B', 'C', 'E'])
+        # Envio sem detalhes vira "unknown"; envio sem logistic_type na API continua nulo
+        self.assertEqual(df['logistic_type'].iloc[:3].tolist(), ['fulfillment', 'fulfillment', 'unknown'])
+        self.assertTrue(pd.isna(df['logistic_type'].iloc[3]))
+        self.assertEqual(df['paid_amount_calculated'].tolist(), [23.0, 8.5, 20.0, 3.0])
+        self.assertEqual(df['paid_amount_calculated_no_ship_cost'].tolist(), [20.0, 5.5, 20.0, 2.0])
+        # 22:30 em UTC-4 é 23:30 em Brasília, ainda em 31/01
+        self.assertEqual(str(df['date'].iloc[0]), '2025-01-31 23:30:00-03:00')
+
+    def test_pedido_malformado_e_ignorado(self):
+        pedidos = [
+            pedido(1, [('A', 2, 10)]),
+            pedido(2, [('B', 'dois', 10)]),  # quantidade em texto
+            pedido(3, [('C', 1, 5)], shipping=503),  # envio sem o objeto
+            pedido(4, [('D', 1, 1)]),
+        ]
+        with self.assertLogs('src.api.mercadolivre', level='WARNING') as logs:
+            df = self.api._normalize_orders(pedidos, {})
+
+        self.assertEqual(df['order_id'].tolist(), [1, 4])
+        self.assertEqual(df['sku'].tolist(), ['A', 'D'])
+        self.assertEqual(len([linha for linha in logs.output if 'formato inesperado' in linha]), 2)
+
+
+@mock.patch("src.api.mercadolivre.ML_SYNC_MARGEM_MINUTOS", 10)
+class TestSincronizacaoPedidos(unittest.TestCase):
+    """sync_orders com /orders/search falso e o armazém em um diretório temporário."""
+
+    def setUp(self):
+        diretorio = tempfile.TemporaryDirectory()
+        self.addCleanup(diretorio.cleanup)
+        self.armazem = ArmazemPedidosML(diretorio.name)
+        self.api = MercadoLivreAPI.__new__(MercadoLivreAPI)
+        self.consultas = []
+
+    def sincronizar(self, pedidos, **kwargs):
+        def buscar(params):
+            self.consultas.append(params)
+            return pedidos
+
+        with mock.patch.object(self.api, "_fetch_orders", side_effect=buscar), \
+                mock.patch.object(self.api, "_get_shipment_dict", return_value={}):
+            return self.api.sync_orders(self.armazem, **kwargs)
+
+    def test_primeira_e_seguintes_sincronizacoes(self):
+        # Primeira execução: busca desde o início informado (meia-noite de Brasília)
+        self.assertEqual(self.sincronizar([pedido(1, [('A', 1, 10)]), pedido(2, [('B', 1, 5)])],
+                                          start_date="01/01/2025"), 2)
+        self.assertEqual(self.consultas[-1]["order.date_last_updated.from"], "2025-01-01T00:00:00-03:00")
+        self.assertEqual(self.armazem.estado(), {'marco': '2025-02-02T12:00:00.000+00:00', 'inicio': '2025-01-01'})
+
+        # Seguintes: desde o marco menos a margem. O pedido 1 foi cancelado e fechado no mês
+        # seguinte: a linha antiga, de janeiro, é substituída
+        alterado = pedido(1, [('A', 1, 10)], status='cancelled', date_closed='2025-02-01T10:00:00.000-03:00',
+                          date_last_updated='2025-02-03T08:00:00+00:00')
+        self.sincronizar([alterado])
+        self.assertEqual(self.consultas[-1]["order.date_last_updated.from"], "2025-02-02T11:50:00.000+00:00")
+        self.assertEqual(self.armazem.estado()["marco"], '2025-02-03T08:00:00.000+00:00')
+
+        df = self.armazem.ler(date(2025, 1, 1), date(2025, 2, 28))
+        self.assertEqual(df[['order_id', 'order_status']].values.tolist(), [[2, 'paid'], [1, 'cancelled']])
+        self.assertEqual(df['date'].dt.strftime('%Y-%m').tolist(), ['2025-01', '2025-02'])
+
+    def test_marco_so_avanca_depois_de_gravar(self):
+        self.sincronizar([pedido(1, [('A', 1, 10)])], start_date="01/01/2025")
+        estado = self.armazem.estado()
+
+        alterado = pedido(1, [('A', 1, 10)], date_last_updated='2025-02-03T08:00:00+00:00')
+        with mock.patch.object(pd.DataFrame, "to_parquet", side_effect=OSError("disco cheio")), \
+                self.assertRaises(OSError):
+            self.sincronizar([alterado])
+        self.assertEqual(self.armazem.estado(), estado)
+
+        # A próxima sincronização busca de novo desde o marco anterior
+        self.sincronizar([alterado])
+        self.assertEqual(self.consultas[-1]["order.date_last_updated.from"], "2025-02-02T11:50:00.000+00:00")
+        self.assertEqual(self.armazem.estado()["marco"], '2025-02-03T08:00:00.000+00:00')
+
+
+if __name__ == "__main__":
+    unittest.main()
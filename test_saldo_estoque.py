@@ -0,0 +1,291 @@
+import os
+import random
+import unittest
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+from unittest import mock
+
+# Os testes usam SQLite em memória; o DATABASE_URL só precisa existir para importar o módulo
+os.environ.setdefault("DATABASE_URL", "sqlite://")
+
+from sqlmodel import SQLModel, Session, create_engine, select
+from src.db import compactacao_estoque, crud_estoque, snapshot_estoque
+from src.db.crud_estoque import _calcular_saldo, _calcular_saldos, _stmt_ultimas_movimentacoes
+from src.db.models import Deposito, Estoque, Produto, SaldoEstoque, SaldoSnapshot, TipoEstoque
+
+
+def saldo_referencia(session, sku, deposito_id):
+    """Cálculo original em Python: último balanço + movimentações a partir dele."""
+    balanco_recente = session.exec(
+        select(Estoque)
+        .where(Estoque.sku == sku)
+        .where(Estoque.deposito_id == deposito_id)
+        .where(Estoque.tipo == TipoEstoque.BALANCO)
+        .order_by(Estoque.data_hora.desc())
+    ).first()
+
+    query = select(Estoque).where(Estoque.sku == sku).where(Estoque.deposito_id == deposito_id)
+
+    if balanco_recente:
+        query = query.where(Estoque.data_hora >= balanco_recente.data_hora)
+        saldo = balanco_recente.quantidade
+    else:
+        saldo = 0
+
+    for movimentacao in session.exec(query).all():
+        if movimentacao.tipo == TipoEstoque.ENTRADA:
+            saldo += movimentacao.quantidade
+        elif movimentacao.tipo == TipoEstoque.SAIDA:
+            saldo -= movimentacao.quantidade
+        elif movimentacao.tipo == TipoEstoque.BALANCO and movimentacao != balanco_recente:
+            saldo = movimentacao.quantidade
+
+    return saldo
+
+
+class LedgerAleatorio(unittest.TestCase):
+    """Base dos testes: SQLite em memória com um ledger aleatório de 1500 movimentações."""
+
+    def setUp(self):
+        self.engine = create_engine("sqlite://")
+        SQLModel.metadata.create_all(self.engine)
+        self.session = Session(self.engine)
+
+        self.skus = [f"SKU{i}" for i in range(8)]
+        for sku in self.skus:
+            self.session.add(Produto(sku=sku, nome=f"Produto {sku}"))
+        for nome in ("Loja", "CD", "Full"):
+            self.session.add(Deposito(nome=nome))
+        self.session.commit()
+        self.depositos = [d.id for d in self.session.exec(select(Deposito)).all()]
+
+        # Ledger aleatório com timestamps distintos (o cálculo original não define empates entre balanços)
+        gerador = random.Random(42)
+        inicio = datetime(2025, 1, 1, 8, 0, 0)
+        for i in range(1500):
+            tipo = gerador.choices(
+                [TipoEstoque.ENTRADA, TipoEstoque.SAIDA, TipoEstoque.BALANCO],
+                weights=[6, 5, 1]
+            )[0]
+            self.session.add(Estoque(
+                sku=gerador.choice(self.skus[:-1]),  # o último SKU fica sem movimentação
+                deposito_id=gerador.choice(self.depositos),
+                quantidade=gerador.randint(0, 50),
+                tipo=tipo,
+                data_hora=inicio + timedelta(minutes=i)
+            ))
+        self.session.commit()
+
+    def tearDown(self):
+        self.session.close()
+        self.engine.dispose()
+
+
+class TestCalculoSaldo(LedgerAleatorio):
+
+    def test_todos_os_pares_iguais_ao_calculo_original(self):
+        saldos = _calcular_saldos(self.session)
+        for sku in self.skus:
+            for deposito_id in self.depositos:
+                esperado = saldo_referencia(self.session, sku, deposito_id)
+                self.assertEqual(saldos.get((sku, deposito_id), 0), esperado, (sku, deposito_id))
+
+    def test_filtros_por_par_e_por_deposito(self):
+        saldos = _calcular_saldos(self.session)
+        for deposito_id in self.depositos:
+            por_deposito = _calcular_saldos(self.session, deposito_id=deposito_id)
+            self.assertEqual(
+                por_deposito,
+                {par: saldo for par, saldo in saldos.items() if par[1] == deposito_id}
+            )
+            for sku in self.skus:
+                self.assertEqual(
+                    _calcular_saldo(self.session, sku, deposito_id),
+                    saldo_referencia(self.session, sku, deposito_id)
+                )
+
+    def test_movimentacao_no_mesmo_instante_do_balanco(self):
+        instante = datetime(2026, 1, 1, 12, 0, 0)
+        deposito_id = self.depositos[0]
+        sku = self.skus[-1]
+        self.session.add(Estoque(sku=sku, deposito_id=deposito_id, quantidade=30, tipo=TipoEstoque.ENTRADA,
+                                 data_hora=instante - timedelta(hours=1)))
+        self.session.add(Estoque(sku=sku, deposito_id=deposito_id, quantidade=10, tipo=TipoEstoque.BALANCO,
+                                 data_hora=instante))
+        self.session.add(Estoque(sku=sku, deposito_id=deposito_id, quantidade=4, tipo=TipoEstoque.SAIDA,
+                                 data_hora=instante))
+        self.session.commit()
+
+        self.assertEqual(saldo_referencia(self.session, sku, deposito_id), 6)
+        self.assertEqual(_calcular_saldo(self.session, sku, deposito_id), 6)
+
+    def test_ultima_movimentacao_unica_por_par_com_empate_de_data_hora(self):
+        for (sku, deposito_id), saldo in _calcular_saldos(self.session).items():
+            self.session.add(SaldoEstoque(sku=sku, deposito_id=deposito_id, saldo=saldo))
+
+        # Duas movimentações no mesmo instante (como as pernas de uma transferência)
+        instante = datetime(2026, 1, 1, 12, 0, 0)
+        sku, deposito_id = self.skus[0], self.depositos[0]
+        self.session.add(Estoque(sku=sku, deposito_id=deposito_id, quantidade=1, tipo=TipoEstoque.ENTRADA,
+                                 data_hora=instante, saldo=1000))
+        self.session.add(Estoque(sku=sku, deposito_id=deposito_id, quantidade=1, tipo=TipoEstoque.ENTRADA,
+                                 data_hora=instante, saldo=1001))
+        self.session.commit()
+
+        ultimas = self.session.exec(_stmt_ultimas_movimentacoes(Estoque)).all()
+        pares = [(registro.sku, registro.deposito_id) for registro in ultimas]
+        self.assertEqual(len(pares), len(set(pares)))
+        self.assertEqual(set(pares), set(_calcular_saldos(self.session)))
+
+        do_par = self.session.exec(_stmt_ultimas_movimentacoes(Estoque, sku=sku, deposito_id=deposito_id)).all()
+        self.assertEqual([registro.saldo for registro in do_par], [1001])
+
+
+class TestHistoricoPaginado(unittest.TestCase):
+
+    def setUp(self):
+        self.engine = create_engine("sqlite://")
+        SQLModel.metadata.create_all(self.engine)
+        with Session(self.engine) as session:
+            session.add(Produto(sku="SKU0", nome="Produto 0"))
+            session.add(Deposito(nome="Loja"))
+            session.commit()
+            deposito_id = session.exec(select(Deposito)).one().id
+            inicio = datetime(2025, 1, 1, 8, 0, 0)
+            for i in range(250):
+                # Grupos de três movimentações no mesmo instante testam o desempate pelo id
+                session.add(Estoque(sku="SKU0", deposito_id=deposito_id, quantidade=i,
+                                    tipo=TipoEstoque.ENTRADA, data_hora=inicio + timedelta(minutes=i // 3)))
+            session.commit()
+
+        @contextmanager
+        def sessao_de_teste():
+            with Session(self.engine) as session:
+                yield session
+
+        patcher = mock.patch.object(crud_estoque, "get_session", sessao_de_teste)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def tearDown(self):
+        self.engine.dispose()
+
+    def test_paginas_percorrem_o_historico_completo_sem_repetir(self):
+        completo = crud_estoque.consultar_historico_movimentacoes()
+        paginas, cursor = [], None
+        while True:
+            pagina, cursor = crud_estoque.consultar_historico_paginado(cursor=cursor, tamanho_pagina=40)
+            paginas.append(pagina)
+            if cursor is None:
+                break
+
+        self.assertEqual([len(pagina) for pagina in paginas], [40] * 6 + [10])
+        self.assertEqual([r["id"] for pagina in paginas for r in pagina], [r["id"] for r in completo])
+
+    def test_gerador_produz_o_mesmo_historico(self):
+        completo = crud_estoque.consultar_historico_movimentacoes(data_inicio=datetime(2025, 1, 1, 9, 0, 0))
+        iterado = list(crud_estoque.iterar_historico_movimentacoes(data_inicio=datetime(2025, 1, 1, 9, 0, 0),
+                                                                   tamanho_lote=16))
+        self.assertEqual(iterado, completo)
+
+
+class TestSaldoEmData(LedgerAleatorio):
+    """Saldo em data passada sobre o ledger aleatório (de 01/01/2025 08:00 a 02/01/2025 09:00)."""
+
+    def setUp(self):
+        super().setUp()
+
+        @contextmanager
+        def sessao_de_teste():
+            with Session(self.engine) as session:
+                yield session
+
+        for modulo in (crud_estoque, snapshot_estoque):
+            patcher = mock.patch.object(modulo, "get_session", sessao_de_teste)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+        inicio = datetime(2025, 1, 1, 8, 0, 0)
+        self.datas = [inicio + timedelta(minutes=minutos) for minutos in (0, 137, 400, 401, 999, 1499, 3000)]
+
+    def assertSaldosIguaisAoHistorico(self):
+        for data in self.datas:
+            esperado = {par: saldo for par, saldo in _calcular_saldos(self.session, ate=data).items() if saldo}
+            obtido = {par: saldo for par, saldo in snapshot_estoque.consultar_saldo_em(data).items() if saldo}
+            self.assertEqual(obtido, esperado, data)
+
+    def test_saldo_em_sem_snapshot_e_com_snapshots(self):
+        self.assertSaldosIguaisAoHistorico()
+
+        for minutos in (120, 400, 1000):
+            snapshot_estoque.gerar_snapshot(datetime(2025, 1, 1, 8, 0, 0) + timedelta(minutes=minutos))
+        self.assertEqual(len(self.session.exec(select(SaldoSnapshot.data_referencia).distinct()).all()), 3)
+        self.assertSaldosIguaisAoHistorico()
+
+    def test_alteracao_de_movimentacao_antiga_atualiza_snapshots(self):
+        snapshot_estoque.gerar_snapshot(datetime(2025, 1, 1, 20, 0, 0))
+        snapshot_estoque.gerar_snapshot(datetime(2025, 1, 2, 6, 0, 0))
+
+        antigas = self.session.exec(
+            select(Estoque).where(Estoque.data_hora < datetime(2025, 1, 1, 12, 0, 0)).where(Estoque.tipo != TipoEstoque.SAIDA)
+        ).all()
+        crud_estoque.atualizar_movimentacao(antigas[0].id, antigas[0].quantidade + 7, "corrigido")
+        crud_estoque.excluir_movimentacao(antigas[1].id)
+        self.session.expire_all()
+
+        self.assertSaldosIguaisAoHistorico()
+
+
+class TestCompactacao(LedgerAleatorio):
+    """Compactação do ledger aleatório (que tem pares com saldo negativo no limite)."""
+
+    def setUp(self):
+        super().setUp()
+
+        @contextmanager
+        def sessao_de_teste():
+            with Session(self.engine) as session:
+                yield session
+
+        for modulo in (crud_estoque, snapshot_estoque, compactacao_estoque):
+            patcher = mock.patch.object(modulo, "get_session", sessao_de_teste)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+        inicio = datetime(2025, 1, 1, 8, 0, 0)
+        self.limite = inicio + timedelta(minutes=700)
+        self.datas = [inicio + timedelta(minutes=minutos) for minutos in (0, 350, 699, 700, 701, 1499)]
+
+    def test_compactacao_preserva_saldos_e_historico(self):
+        snapshot_estoque.gerar_snapshot(self.limite - timedelta(minutes=300))
+        saldos = _calcular_saldos(self.session)
+        saldos_em = {data: snapshot_estoque.consultar_saldo_em(data) for data in self.datas}
+        historico = crud_estoque.consultar_historico_movimentacoes()
+
+        resultado = compactacao_estoque.compactar_estoque(ate=self.limite)
+        self.session.expire_all()
+
+        self.assertEqual(resultado["pares"], len(saldos))
+        sinteticas = len(saldos) + sum(1 for saldo in _calcular_saldos(self.session, ate=self.limite).values() if saldo < 0)
+        self.assertEqual(len(self.session.exec(select(Estoque)).all()), len(historico) - resultado["arquivadas"] + sinteticas)
+        self.assertEqual(_calcular_saldos(self.session), saldos)
+        for data in self.datas:
+            self.assertEqual(snapshot_estoque.consultar_saldo_em(data), saldos_em[data], data)
+
+        # Histórico completo (com o arquivo) = histórico original + um Balanço sintético por par
+        paginas, cursor = [], None
+        while True:
+            pagina, cursor = crud_estoque.consultar_historico_paginado(cursor=cursor, tamanho_pagina=97, incluir_arquivo=True)
+            paginas.extend(pagina)
+            if cursor is None:
+                break
+        self.assertEqual(paginas, crud_estoque.consultar_historico_movimentacoes(incluir_arquivo=True))
+        originais = [r for r in paginas if not (r["observacoes"] or "").startswith("Compactação")]
+        self.assertEqual([r["id"] for r in originais], [r["id"] for r in historico])
+
+        with self.assertRaises(ValueError):
+            compactacao_estoque.compactar_estoque(ate=self.limite)
+
+
+if __name__ == "__main__":
+    unittest.main()